@@ -1,7 +1,7 @@
 #sh!
 
-python manage.py get_ohlcv --from-days-ago 7
-python manage.py get_liquidations --from-days-ago 7
+python manage.py get_ohlcv --sync --from-days-ago 7 --timeframe 1m --resample 5m
+python manage.py get_liquidations --sync --from-days-ago 7
 python manage.py create_positions --from-days-ago 7
 python manage.py create_algorithm_input
 python manage.py create_lvl2_algorithm_input
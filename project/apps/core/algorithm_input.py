@@ -0,0 +1,313 @@
+import os
+import re
+from bisect import bisect_right
+from datetime import date
+from typing import NamedTuple, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from project.apps.core.models import AlgorithmInput
+
+
+# columns of the algorithm input file of every level
+ALGORITHM_INPUT_COLUMNS = {
+    "lvl1": ["hour", "tp", "sl", "performance_lvl1", "trade_lvl1"],
+    "lvl2": [
+        "hour",
+        "tp",
+        "sl",
+        "performance_lvl1",
+        "trade_lvl1",
+        "performance_lvl2",
+        "trade_lvl2",
+    ],
+    "lvl3": ["day", "performance_lvl3", "trade_lvl3"],
+}
+
+# algorithm_input-BTCUSDT-2025-01-06-reversed.csv (lvl1) and
+# algorithm_input-BTCUSDT-2025-01-06-reversed-lvl2.csv
+FILE_NAME = re.compile(
+    r"^algorithm_input-(?P<symbol>[A-Z]+)-(?P<date>\d{4}-\d{2}-\d{2})"
+    r"-(?P<strategy_type>[a-z_]+?)(?:-(?P<level>lvl2))?\.csv$"
+)
+
+# columns of the hour indexed arrays of the registry, trades as 0.0 or 1.0
+REGISTRY_COLUMNS = ALGORITHM_INPUT_COLUMNS["lvl2"][1:]
+
+
+class AlgorithmInputRow(NamedTuple):
+    """One hour of an algorithm input file, attribute compatible with the
+    AlgorithmInput model."""
+
+    hour: int
+    tp: Optional[float]
+    sl: Optional[float]
+    performance_lvl1: Optional[float]
+    trade_lvl1: Optional[bool]
+    performance_lvl2: Optional[float]
+    trade_lvl2: Optional[bool]
+
+
+def _value(value):
+    """Converts a dataframe cell into a value for the model, None for nan."""
+
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def store_algorithm_input(
+    symbol: str,
+    strategy_type: str,
+    level: str,
+    valid_from: date,
+    dataframe: pd.DataFrame,
+) -> int:
+    """Replaces the stored rows of one algorithm input by the rows of the
+    dataframe. Returns the number of rows."""
+
+    columns = ALGORITHM_INPUT_COLUMNS[level]
+    rows = [
+        AlgorithmInput(
+            symbol=symbol,
+            strategy_type=strategy_type,
+            level=level,
+            valid_from=valid_from,
+            **{column: _value(row[column]) for column in columns},
+        )
+        for _, row in dataframe.iterrows()
+    ]
+    with transaction.atomic():
+        AlgorithmInput.objects.filter(
+            symbol=symbol,
+            strategy_type=strategy_type,
+            level=level,
+            valid_from=valid_from,
+        ).delete()
+        AlgorithmInput.objects.bulk_create(rows)
+    return len(rows)
+
+
+def algorithm_input_dataframe(
+    symbol: str, strategy_type: str, level: str, valid_from: date
+) -> pd.DataFrame:
+    """Returns the stored rows of one algorithm input with the columns of its
+    file, empty when it was not generated. Reads the file itself when
+    ALGORITHM_INPUT_SOURCE is files."""
+
+    if settings.ALGORITHM_INPUT_SOURCE == "files":
+        path = os.path.join(
+            settings.ALGORITHM_EXPORT_PATH,
+            algorithm_input_file_name(symbol, strategy_type, level, valid_from),
+        )
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=ALGORITHM_INPUT_COLUMNS[level])
+        return pd.read_csv(path)
+
+    rows = AlgorithmInput.objects.filter(
+        symbol=symbol,
+        strategy_type=strategy_type,
+        level=level,
+        valid_from=valid_from,
+    ).order_by("hour", "day")
+    return pd.DataFrame(
+        list(rows.values(*ALGORITHM_INPUT_COLUMNS[level])),
+        columns=ALGORITHM_INPUT_COLUMNS[level],
+    )
+
+
+def get_algorithm_input(
+    symbol: str,
+    strategy_type: str,
+    level: str,
+    moment: timezone.datetime,
+    hour: Optional[int] = None,
+    day: Optional[int] = None,
+) -> Optional[AlgorithmInput]:
+    """Returns the row for the hour or week day of the latest algorithm input
+    generated on or before the date of moment, in one indexed query."""
+
+    return (
+        AlgorithmInput.objects.filter(
+            symbol=symbol,
+            strategy_type=strategy_type,
+            level=level,
+            valid_from__lte=moment.date(),
+            hour=hour,
+            day=day,
+        )
+        .order_by("-valid_from")
+        .first()
+    )
+
+
+def algorithm_input_file_name(
+    symbol: str, strategy_type: str, level: str, valid_from: date
+) -> str:
+    """Returns the name of the lvl1 or lvl2 algorithm input file."""
+
+    suffix = "-lvl2" if level == AlgorithmInput.LevelChoices.LVL2 else ""
+    return f"algorithm_input-{symbol}-{valid_from}-{strategy_type}{suffix}.csv"
+
+
+class AlgorithmInputRegistry:
+    """The lvl1 and lvl2 algorithm input files of the export directory, parsed
+    once per process into an array per file with a row per hour.
+
+    refresh only parses the files that are new or changed since the last
+    scan, by modification time and size.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = path
+        self._files: dict[str, tuple[tuple[int, int], tuple]] = {}
+        self._inputs: dict[tuple[str, str, str, date], np.ndarray] = {}
+        self._valid_froms: dict[tuple[str, str, str], list[date]] = {}
+
+    @property
+    def path(self) -> str:
+        return self._path or settings.ALGORITHM_EXPORT_PATH
+
+    @staticmethod
+    def parse(file_path: str) -> np.ndarray:
+        """Returns the file as a (24, len(REGISTRY_COLUMNS)) array, nan for the
+        hours and columns it does not have."""
+
+        dataframe = pd.read_csv(file_path)
+        hours = np.full((24, len(REGISTRY_COLUMNS)), np.nan)
+        for column, name in enumerate(REGISTRY_COLUMNS):
+            if name in dataframe:
+                hours[dataframe["hour"].to_numpy(dtype=int), column] = pd.to_numeric(
+                    dataframe[name], errors="coerce"
+                ).to_numpy(dtype=float)
+        return hours
+
+    def refresh(self) -> None:
+        """Parses the new and changed files and forgets the removed ones."""
+
+        try:
+            entries = list(os.scandir(self.path))
+        except FileNotFoundError:
+            entries = []
+        files = {}
+        for entry in entries:
+            match = FILE_NAME.match(entry.name)
+            if not match or not entry.is_file():
+                continue
+            stat = entry.stat()
+            version = (stat.st_mtime_ns, stat.st_size)
+            key = (
+                match["symbol"],
+                match["strategy_type"],
+                match["level"] or AlgorithmInput.LevelChoices.LVL1,
+                date.fromisoformat(match["date"]),
+            )
+            files[entry.name] = (version, key)
+            if self._files.get(entry.name) != (version, key):
+                self._inputs[key] = self.parse(entry.path)
+        for name in self._files.keys() - files.keys():
+            self._inputs.pop(self._files[name][1], None)
+        self._files = files
+        valid_froms = {}
+        for symbol, strategy_type, level, valid_from in self._inputs:
+            valid_froms.setdefault((symbol, strategy_type, level), []).append(
+                valid_from
+            )
+        self._valid_froms = {key: sorted(dates) for key, dates in valid_froms.items()}
+
+    def get(
+        self,
+        symbol: str,
+        strategy_type: str,
+        level: str,
+        moment: timezone.datetime,
+        hour: int,
+    ) -> Optional[AlgorithmInputRow]:
+        """Returns the hour of the file of the liquidation date, else of its
+        Monday, else of the latest file generated before it."""
+
+        liquidation_date = moment.date()
+        monday = liquidation_date - timezone.timedelta(days=liquidation_date.weekday())
+        hours = self._inputs.get((symbol, strategy_type, level, liquidation_date))
+        if hours is None:
+            hours = self._inputs.get((symbol, strategy_type, level, monday))
+        if hours is None:
+            valid_froms = self._valid_froms.get((symbol, strategy_type, level), [])
+            position = bisect_right(valid_froms, liquidation_date)
+            if not position:
+                return None
+            hours = self._inputs[
+                (symbol, strategy_type, level, valid_froms[position - 1])
+            ]
+        row = hours[hour]
+        if np.isnan(row).all():
+            return None
+        values = [None if np.isnan(value) else float(value) for value in row]
+        # the performances and trades alternate after tp and sl
+        return AlgorithmInputRow(
+            hour,
+            *values[:2],
+            *(
+                bool(value) if value is not None and column % 2 else value
+                for column, value in enumerate(values[2:])
+            ),
+        )
+
+
+algorithm_input_registry = AlgorithmInputRegistry()
+
+
+class AlgorithmInputFiles:
+    """Lookup of one symbol, strategy type and level in the registry."""
+
+    def __init__(self, symbol: str, strategy_type: str, level: str):
+        self.key = (symbol, strategy_type, level)
+        algorithm_input_registry.refresh()
+
+    def get(
+        self, moment: timezone.datetime, hour: Optional[int] = None
+    ) -> Optional[AlgorithmInputRow]:
+        return algorithm_input_registry.get(*self.key, moment, hour)
+
+
+class AlgorithmInputCache:
+    """All rows of one symbol, strategy type and level in memory, for loops
+    that look up the algorithm input of many liquidations."""
+
+    def __init__(self, symbol: str, strategy_type: str, level: str):
+        self.rows = {
+            (row.valid_from, row.hour, row.day): row
+            for row in AlgorithmInput.objects.filter(
+                symbol=symbol, strategy_type=strategy_type, level=level
+            )
+        }
+        self.valid_froms = sorted({valid_from for valid_from, _, _ in self.rows})
+
+    def get(
+        self,
+        moment: timezone.datetime,
+        hour: Optional[int] = None,
+        day: Optional[int] = None,
+    ) -> Optional[AlgorithmInput]:
+        """Like get_algorithm_input, without a query."""
+
+        position = bisect_right(self.valid_froms, moment.date())
+        if not position:
+            return None
+        return self.rows.get((self.valid_froms[position - 1], hour, day))
+
+
+def algorithm_inputs(
+    symbol: str, strategy_type: str, level: str
+) -> Union[AlgorithmInputCache, AlgorithmInputFiles]:
+    """Returns the lookup of the configured ALGORITHM_INPUT_SOURCE, the
+    AlgorithmInput table or the files in ALGORITHM_EXPORT_PATH."""
+
+    if settings.ALGORITHM_INPUT_SOURCE == "files":
+        return AlgorithmInputFiles(symbol, strategy_type, level)
+    return AlgorithmInputCache(symbol, strategy_type, level)
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class AppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "project.apps.core"
+
+    def ready(self):
+        from project.apps.core.candles import discard_candle_store
+        from project.apps.core.models import OHLCV
+
+        post_save.connect(discard_candle_store, sender=OHLCV)
+        post_delete.connect(discard_candle_store, sender=OHLCV)
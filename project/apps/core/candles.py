@@ -0,0 +1,486 @@
+import os
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Iterable, Iterator, NamedTuple, Optional, Union
+
+import numpy as np
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from project.apps.core.models import OHLCV, FirstPassageIndex, PositionOutcome
+
+
+COLUMNS = ("datetime", "open", "high", "low", "close", "volume")
+
+# candle datetimes are stored naive (USE_TZ = False), so the store counts seconds
+# from a naive epoch instead of converting to UTC
+EPOCH = timezone.datetime(1970, 1, 1)
+
+UPSERT_BATCH_SIZE = 2000
+
+TIMEFRAME_UNITS = {"m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+
+class Candle(NamedTuple):
+    """Single candle, attribute compatible with the OHLCV model."""
+
+    datetime: timezone.datetime
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+
+
+def to_timestamp(moment: timezone.datetime) -> float:
+    """Converts a naive datetime into seconds since the naive epoch."""
+
+    return (moment - EPOCH).total_seconds()
+
+
+def from_timestamp(timestamp: float) -> timezone.datetime:
+    """Converts seconds since the naive epoch back into a naive datetime."""
+
+    return EPOCH + timezone.timedelta(seconds=int(timestamp))
+
+
+def timeframe_seconds(timeframe: str) -> int:
+    """Returns the duration of a candle in seconds for a timeframe like 5m."""
+
+    return int(timeframe[:-1]) * TIMEFRAME_UNITS[timeframe[-1]]
+
+
+class Candles:
+    """Columnar view on a series of candles ordered by datetime.
+
+    The data is a (6, n) float64 array with one row per column in COLUMNS, so
+    every column is contiguous and slicing a window never copies.
+    """
+
+    def __init__(self, data: np.ndarray):
+        self.data = data
+
+    def __len__(self) -> int:
+        return self.data.shape[1]
+
+    def __iter__(self) -> Iterator[Candle]:
+        for row in self.data.T:
+            yield Candle(from_timestamp(row[0]), *map(float, row[1:]))
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Candle, "Candles"]:
+        if isinstance(index, slice):
+            return Candles(self.data[:, index])
+        row = self.data[:, index]
+        return Candle(from_timestamp(row[0]), *map(float, row[1:]))
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self.data[0]
+
+    @property
+    def open(self) -> np.ndarray:
+        return self.data[1]
+
+    @property
+    def high(self) -> np.ndarray:
+        return self.data[2]
+
+    @property
+    def low(self) -> np.ndarray:
+        return self.data[3]
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.data[4]
+
+    @property
+    def volume(self) -> np.ndarray:
+        return self.data[5]
+
+    def exists(self) -> bool:
+        return len(self) > 0
+
+    def first(self) -> Optional[Candle]:
+        return self[0] if len(self) else None
+
+    def last(self) -> Optional[Candle]:
+        return self[-1] if len(self) else None
+
+    def index(self, moment: timezone.datetime, side: str = "left") -> int:
+        """Returns the position of the given datetime in the series."""
+
+        return int(np.searchsorted(self.timestamps, to_timestamp(moment), side=side))
+
+    def window(self, start: timezone.datetime, end: timezone.datetime) -> "Candles":
+        """Returns the candles with start <= datetime < end, without copying."""
+
+        return Candles(self.data[:, self.index(start) : self.index(end)])
+
+    def gaps(
+        self, start: timezone.datetime, end: timezone.datetime, timeframe: str
+    ) -> list[tuple[timezone.datetime, timezone.datetime]]:
+        """Returns the [start, end) ranges between start and end without candles."""
+
+        step = timeframe_seconds(timeframe)
+        edges = np.concatenate(
+            [
+                [to_timestamp(start) - step],
+                self.window(start, end).timestamps,
+                [to_timestamp(end)],
+            ]
+        )
+        missing = np.flatnonzero(np.diff(edges) > step)
+        return [
+            (from_timestamp(edges[i] + step), from_timestamp(edges[i + 1]))
+            for i in missing
+        ]
+
+    @classmethod
+    def empty(cls) -> "Candles":
+        return cls(np.empty((len(COLUMNS), 0), dtype=np.float64))
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[tuple]) -> "Candles":
+        """Builds candles from (datetime, open, high, low, close, volume) rows."""
+
+        rows = [(to_timestamp(row[0]), *row[1:]) for row in rows]
+        if not rows:
+            return cls.empty()
+        return cls(np.array(rows, dtype=np.float64).T.copy())
+
+    @classmethod
+    def from_queryset(cls, queryset: QuerySet[OHLCV]) -> "Candles":
+        """Builds candles from an OHLCV queryset in a single query."""
+
+        return cls.from_rows(
+            queryset.order_by("datetime").values_list(*COLUMNS).iterator()
+        )
+
+
+class CandleStore:
+    """Memory-mapped columnar candle files, one per symbol/timeframe.
+
+    Files are replaced atomically on write, so every process that maps a file
+    keeps a consistent view and all workers share the same pages. upsert_ohlcv
+    keeps them in sync with the OHLCV table, rows saved another way delete
+    the file of their symbol and timeframe until it is rebuilt.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = path
+        self._cache: dict[str, tuple[tuple[int, int], Candles]] = {}
+        # the updates collected by deferred, None outside of it
+        self._pending: Optional[dict[tuple[str, str], list[Candles]]] = None
+
+    @property
+    def path(self) -> str:
+        return self._path or settings.CANDLE_STORE_PATH
+
+    def file_path(self, symbol: str, timeframe: str) -> str:
+        """Returns the file path for the given symbol and timeframe."""
+
+        name = symbol.replace("/", "").replace(":", "-")
+        return os.path.join(self.path, f"{name}-{timeframe}.npy")
+
+    def exists(self, symbol: str, timeframe: str) -> bool:
+        return os.path.isfile(self.file_path(symbol, timeframe))
+
+    def load(self, symbol: str, timeframe: str) -> Optional[Candles]:
+        """Returns the memory-mapped candles, re-mapping when the file changed.
+
+        Returns None without a file or while it misses deferred updates.
+        """
+
+        if self._pending and (symbol, timeframe) in self._pending:
+            return None
+        return self._load_file(symbol, timeframe)
+
+    def _load_file(self, symbol: str, timeframe: str) -> Optional[Candles]:
+        file_path = self.file_path(symbol, timeframe)
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = self._cache.get(file_path)
+        if cached and cached[0] == version:
+            return cached[1]
+        candles = Candles(np.load(file_path, mmap_mode="r"))
+        self._cache[file_path] = (version, candles)
+        return candles
+
+    def write(self, symbol: str, timeframe: str, candles: Candles) -> None:
+        """Replaces the stored candles for the given symbol and timeframe."""
+
+        os.makedirs(self.path, exist_ok=True)
+        file_path = self.file_path(symbol, timeframe)
+        temporary_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(candles.data, dtype=np.float64))
+        os.replace(temporary_path, file_path)
+
+    def discard(self, symbol: str, timeframe: str) -> None:
+        """Deletes the stored candles, load_candles reads the OHLCV table until
+        the next update or rebuild."""
+
+        try:
+            os.remove(self.file_path(symbol, timeframe))
+        except FileNotFoundError:
+            pass
+
+    def update(self, symbol: str, timeframe: str, candles: Candles) -> None:
+        """Merges candles into the store, new values win on equal datetimes.
+
+        Without a stored file yet, it is built from the OHLCV table, so the
+        candles must be written there first. Inside deferred the file is
+        written once on exit.
+        """
+
+        if not candles.exists():
+            return
+        if self._pending is not None:
+            self._pending[(symbol, timeframe)].append(candles)
+            return
+        stored = self._load_file(symbol, timeframe)
+        if stored is None:
+            # a store that only holds the new candles would hide the older
+            # ones from load_candles
+            self.rebuild(symbol, timeframe)
+            return
+        data = np.concatenate([stored.data, candles.data], axis=1)
+        data = data[:, np.argsort(data[0], kind="stable")]
+        keep = np.append(data[0, 1:] != data[0, :-1], True)
+        self.write(symbol, timeframe, Candles(data[:, keep]))
+
+    @contextmanager
+    def deferred(self):
+        """Collects the updates and writes every file once on exit, instead
+        of rewriting it for every upserted chunk."""
+
+        if self._pending is not None:
+            yield
+            return
+        self._pending = defaultdict(list)
+        try:
+            yield
+        finally:
+            # also on errors, the chunks before it are in the OHLCV table
+            pending, self._pending = self._pending, None
+            for (symbol, timeframe), parts in pending.items():
+                self.update(
+                    symbol,
+                    timeframe,
+                    Candles(np.concatenate([part.data for part in parts], axis=1)),
+                )
+
+    def rebuild(self, symbol: str, timeframe: str) -> int:
+        """Rebuilds the stored candles from the OHLCV table."""
+
+        candles = Candles.from_queryset(
+            OHLCV.objects.filter(symbol=symbol, timeframe=timeframe)
+        )
+        self.write(symbol, timeframe, candles)
+        return len(candles)
+
+
+candle_store = CandleStore()
+
+
+def discard_candle_store(sender, instance: OHLCV, **kwargs) -> None:
+    """Deletes the stored candles of an OHLCV row saved or deleted outside of
+    upsert_ohlcv, like in the admin or an import."""
+
+    candle_store.discard(instance.symbol, instance.timeframe)
+
+
+def query_candles(
+    symbol: str,
+    timeframe: str,
+    start: timezone.datetime,
+    end: timezone.datetime,
+) -> Candles:
+    """Returns candles with start <= datetime < end from the OHLCV table."""
+
+    return Candles.from_queryset(
+        OHLCV.objects.filter(
+            symbol=symbol,
+            timeframe=timeframe,
+            datetime__gte=start,
+            datetime__lt=end,
+        )
+    )
+
+
+def load_candles(
+    symbol: str,
+    timeframe: str,
+    start: timezone.datetime,
+    end: timezone.datetime,
+) -> Candles:
+    """Returns candles with start <= datetime < end, preferring the candle store.
+
+    The parts of the window before the first or after the last stored candle
+    are read from the OHLCV table.
+    """
+
+    stored = candle_store.load(symbol, timeframe)
+    if stored is None or not stored.exists():
+        return query_candles(symbol, timeframe, start, end)
+    stored_start = stored.first().datetime
+    stored_end = stored.last().datetime + timezone.timedelta(
+        seconds=timeframe_seconds(timeframe)
+    )
+    if start >= stored_start and end <= stored_end:
+        return stored.window(start, end)
+    parts = [
+        query_candles(symbol, timeframe, start, min(end, stored_start)),
+        stored.window(start, end),
+        query_candles(symbol, timeframe, max(start, stored_end), end),
+    ]
+    return Candles(np.concatenate([part.data for part in parts], axis=1))
+
+
+def prefetch_candles(
+    symbol: str,
+    timeframe: str,
+    windows: Iterable[tuple[timezone.datetime, timezone.datetime]],
+) -> Candles:
+    """Returns the candles of all [start, end) windows in one series, for loops
+    that take their window from it with Candles.window instead of querying.
+
+    Overlapping windows are merged, so every candle is loaded once, with one
+    ordered range query per run of overlapping windows.
+    """
+
+    runs: list[list[timezone.datetime]] = []
+    for start, end in sorted(windows):
+        if runs and start <= runs[-1][1]:
+            runs[-1][1] = max(runs[-1][1], end)
+        else:
+            runs.append([start, end])
+    parts = [load_candles(symbol, timeframe, start, end) for start, end in runs]
+    if not parts:
+        return Candles.empty()
+    if len(parts) == 1:
+        return parts[0]
+    return Candles(np.concatenate([part.data for part in parts], axis=1))
+
+
+def invalidate_position_outcomes(
+    symbol: str, start: timezone.datetime, end: timezone.datetime
+) -> int:
+    """Deletes the cached outcomes and the first passage indexes of the
+    positions whose window overlaps the 5m candles from start to end, so
+    both are built again from the new candles. Returns the number of deleted
+    outcomes."""
+
+    position_symbol = symbol.replace("/USDT:USDT", "USDT")
+    FirstPassageIndex.objects.filter(
+        position__symbol=position_symbol,
+        start__lte=end,
+        end__gt=start,
+    ).delete()
+    deleted, _ = PositionOutcome.objects.filter(
+        position__symbol=position_symbol,
+        start__lte=end,
+        end__gte=start,
+    ).delete()
+    return deleted
+
+
+def upsert_ohlcv(symbol: str, timeframe: str, candles: Candles) -> tuple[int, int]:
+    """Inserts or updates the candles in the OHLCV table in one transaction
+    and merges them into the candle store once it commits.
+
+    The cached position outcomes and first passage indexes that depend on 5m
+    candles that were added or changed are invalidated. Returns the number of inserted and updated rows.
+    """
+
+    # the last candle wins when a datetime was fetched twice
+    rows = {candle.datetime: candle for candle in candles}
+    if not rows:
+        return 0, 0
+    with transaction.atomic():
+        existing = {
+            row[0]: row[1:]
+            for row in OHLCV.objects.filter(
+                symbol=symbol,
+                timeframe=timeframe,
+                datetime__gte=min(rows),
+                datetime__lte=max(rows),
+            ).values_list(*COLUMNS)
+        }
+        OHLCV.objects.bulk_create(
+            [
+                OHLCV(symbol=symbol, timeframe=timeframe, **candle._asdict())
+                for candle in rows.values()
+            ],
+            batch_size=UPSERT_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["symbol", "timeframe", "datetime"],
+            update_fields=["open", "high", "low", "close", "volume"],
+        )
+        changed = [
+            moment
+            for moment, candle in rows.items()
+            if existing.get(moment) != tuple(candle[1:])
+        ]
+        if timeframe == "5m" and changed:
+            invalidate_position_outcomes(symbol, min(changed), max(changed))
+        upserted = Candles.from_rows(
+            (moment, *candle[1:]) for moment, candle in sorted(rows.items())
+        )
+        transaction.on_commit(lambda: candle_store.update(symbol, timeframe, upserted))
+    inserted = len(rows.keys() - existing)
+    return inserted, len(rows) - inserted
+
+
+def resample(candles: Candles, timeframe: str, source_timeframe: str = "1m") -> Candles:
+    """Aggregates candles into a higher timeframe.
+
+    Only buckets that contain all of their source candles are returned, so
+    a bucket is never stored from a partial set of candles.
+    """
+
+    if not candles.exists():
+        return Candles.empty()
+    step = timeframe_seconds(timeframe)
+    buckets = candles.timestamps - candles.timestamps % step
+    starts = np.flatnonzero(np.append(True, buckets[1:] != buckets[:-1]))
+    ends = np.append(starts[1:], len(candles))
+    complete = ends - starts == step // timeframe_seconds(source_timeframe)
+    data = np.vstack(
+        [
+            buckets[starts],
+            candles.open[starts],
+            np.maximum.reduceat(candles.high, starts),
+            np.minimum.reduceat(candles.low, starts),
+            candles.close[ends - 1],
+            np.add.reduceat(candles.volume, starts),
+        ]
+    )
+    return Candles(data[:, complete])
+
+
+def resample_ohlcv(
+    symbol: str,
+    timeframe: str,
+    start: timezone.datetime,
+    end: timezone.datetime,
+    source_timeframe: str = "1m",
+) -> tuple[int, int]:
+    """Derives the candles of a timeframe between start and end from the
+    stored source candles and upserts them.
+
+    Returns the number of inserted and updated rows.
+    """
+
+    step = timeframe_seconds(timeframe)
+    start = from_timestamp(to_timestamp(start) // step * step)
+    candles = resample(
+        load_candles(symbol, source_timeframe, start, end), timeframe, source_timeframe
+    )
+    return upsert_ohlcv(symbol, timeframe, candles)
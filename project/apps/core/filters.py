@@ -1,6 +1,6 @@
 import django_filters
 
-from project.apps.core.models import Position
+from project.apps.core.models import OHLCV, Liquidation, Position, RSILiquidation
 
 
 class PositionFilterSet(django_filters.FilterSet):
@@ -87,3 +87,44 @@ class PositionFilterSet(django_filters.FilterSet):
             "min_liquidation_amount",
             "max_liquidation_amount",
         )
+
+
+class TimeSeriesFilterSet(django_filters.FilterSet):
+    """FilterSet for the rows of a symbol and timeframe in a time range."""
+
+    symbol = django_filters.CharFilter(field_name="symbol", lookup_expr="exact")
+    timeframe = django_filters.CharFilter(field_name="timeframe", lookup_expr="exact")
+    start = django_filters.IsoDateTimeFilter(
+        field_name="datetime",
+        lookup_expr="gte",
+        label="From datetime (inclusive)",
+    )
+    end = django_filters.IsoDateTimeFilter(
+        field_name="datetime",
+        lookup_expr="lt",
+        label="Until datetime (exclusive)",
+    )
+
+
+class OHLCVFilterSet(TimeSeriesFilterSet):
+    """FilterSet for the OHLCV model."""
+
+    class Meta:
+        model = OHLCV
+        fields = ("symbol", "timeframe", "start", "end")
+
+
+class LiquidationFilterSet(TimeSeriesFilterSet):
+    """FilterSet for the Liquidation model."""
+
+    class Meta:
+        model = Liquidation
+        fields = ("symbol", "timeframe", "side", "start", "end")
+
+
+class RSILiquidationFilterSet(TimeSeriesFilterSet):
+    """FilterSet for the RSILiquidation model."""
+
+    class Meta:
+        model = RSILiquidation
+        fields = ("symbol", "timeframe", "side", "start", "end")
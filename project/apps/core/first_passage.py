@@ -0,0 +1,545 @@
+from bisect import bisect_left
+from typing import Iterable, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from project.apps.core.candles import (
+    Candles,
+    from_timestamp,
+    load_candles,
+    to_timestamp,
+)
+from project.apps.core.models import FirstPassageIndex, Position, PositionOutcome
+from project.apps.core.simulation import (
+    EXIT_NONE,
+    EXIT_STOP_LOSS,
+    EXIT_TAKE_PROFIT,
+    first_touch,
+    first_trigger,
+)
+
+
+FIRST_PASSAGE_HORIZON = timezone.timedelta(days=28)
+CANDLE_DURATION = timezone.timedelta(minutes=5)
+BUILD_BATCH_SIZE = 500
+OUTCOME_BATCH_SIZE = 500
+
+# fees the R-multiples of the cached outcomes are net of, bump the version
+# when they change so the outcomes are simulated again
+FEE_MODEL_VERSION = 1
+ENTRY_FEE = 0.02 / 100  # limit order
+TAKE_PROFIT_FEE = 0.02 / 100  # limit order
+STOP_LOSS_FEE = 0.06 / 100  # market order
+
+# running maxima of these series only go up, the others are running minima
+RISING_SERIES = ("high", "close_high")
+
+
+class FirstPassageOutcomes(NamedTuple):
+    """Outcomes of a batch of positions for a set of TP/SL pairs."""
+
+    entry_prices: np.ndarray  # one per position, nan when it has no candles
+    reasons: np.ndarray  # exit reason per position (rows) and TP/SL pair (columns)
+
+
+def ohlcv_symbol(symbol: str) -> str:
+    """Converts a position symbol (BTCUSDT) into an OHLCV symbol (BTC/USDT:USDT)."""
+
+    return symbol.replace("USDT", "") + "/USDT:USDT"
+
+
+def entry_price_for(open_price: float, side: str) -> float:
+    """Returns the limit entry price the what-if simulations use for a candle open."""
+
+    return round(open_price * 1.0001 if side == "SHORT" else open_price * 0.9999, 1)
+
+
+def get_first_passage_index(position: Position) -> Optional[FirstPassageIndex]:
+    """Returns the index of the position or None when it was not built yet."""
+
+    try:
+        return position.first_passage_index
+    except FirstPassageIndex.DoesNotExist:
+        return None
+
+
+def _breakpoints(
+    candles: Candles, values: np.ndarray, rising: bool, start: timezone.datetime
+) -> list:
+    # minutes from start, first_crossing adds them to it, also when the
+    # first candle opens later
+    running = (np.maximum if rising else np.minimum).accumulate(values)
+    changed = np.flatnonzero(np.append(True, running[1:] != running[:-1]))
+    minutes = (candles.timestamps[changed] - to_timestamp(start)) // 60
+    return [minutes.astype(int).tolist(), running[changed].tolist()]
+
+
+def _covered_until(window: Candles, start: timezone.datetime) -> timezone.datetime:
+    """Returns the end of the candles without a gap from start on."""
+
+    step = CANDLE_DURATION.total_seconds()
+    # the first candle that opens at or after start
+    first = -(-to_timestamp(start) // step) * step
+    gaps = np.flatnonzero(window.timestamps != first + step * np.arange(len(window)))
+    return from_timestamp(first) + CANDLE_DURATION * int(
+        gaps[0] if gaps.size else len(window)
+    )
+
+
+def build_first_passage_indexes(positions: Iterable[Position]) -> int:
+    """Builds or rebuilds the first passage index of the given 5m positions.
+
+    Indexes whose horizon is not covered by candles without gaps yet are
+    stored as incomplete, so they can be extended once the candles are
+    fetched.
+    """
+
+    positions = sorted(positions, key=lambda position: position.start)
+    built = 0
+    for symbol in {position.symbol for position in positions}:
+        symbol_positions = [p for p in positions if p.symbol == symbol]
+        for batch_start in range(0, len(symbol_positions), BUILD_BATCH_SIZE):
+            batch = symbol_positions[batch_start : batch_start + BUILD_BATCH_SIZE]
+            starts = [p.start.replace(second=0, microsecond=0) for p in batch]
+            candles = load_candles(
+                ohlcv_symbol(symbol),
+                "5m",
+                starts[0],
+                starts[-1] + FIRST_PASSAGE_HORIZON,
+            )
+            indexes = []
+            for position, start in zip(batch, starts):
+                window = candles.window(start, start + FIRST_PASSAGE_HORIZON)
+                if not window.exists():
+                    continue
+                end = start + FIRST_PASSAGE_HORIZON
+                covered_until = min(end, _covered_until(window, start))
+                indexes.append(
+                    FirstPassageIndex(
+                        position=position,
+                        start=start,
+                        end=end,
+                        covered_until=covered_until,
+                        complete=covered_until >= end,
+                        open=float(window.open[0]),
+                        breakpoints={
+                            "high": _breakpoints(
+                                window, window.high, rising=True, start=start
+                            ),
+                            "low": _breakpoints(
+                                window, window.low, rising=False, start=start
+                            ),
+                            "close_high": _breakpoints(
+                                window, window.close, rising=True, start=start
+                            ),
+                            "close_low": _breakpoints(
+                                window, window.close, rising=False, start=start
+                            ),
+                        },
+                    )
+                )
+            FirstPassageIndex.objects.bulk_create(
+                indexes,
+                update_conflicts=True,
+                unique_fields=["position"],
+                update_fields=[
+                    "start",
+                    "end",
+                    "covered_until",
+                    "complete",
+                    "open",
+                    "breakpoints",
+                ],
+            )
+            built += len(indexes)
+    return built
+
+
+def positions_to_index(positions: QuerySet[Position]) -> QuerySet[Position]:
+    """Filters the 5m positions without an index or with an incomplete one."""
+
+    return positions.filter(timeframe="5m").filter(
+        Q(first_passage_index__isnull=True) | Q(first_passage_index__complete=False)
+    )
+
+
+def first_crossing(
+    index: FirstPassageIndex,
+    series: str,
+    level: float,
+) -> Optional[timezone.datetime]:
+    """Returns the datetime of the first candle whose series crosses the level.
+
+    Rising series cross when they reach the level from below, falling series
+    when they reach it from above.
+    """
+
+    minutes, values = index.breakpoints[series]
+    if series in RISING_SERIES:
+        position = bisect_left(values, level)
+    else:
+        position = bisect_left(values, -level, key=lambda value: -value)
+    if position == len(values):
+        return None
+    return index.start + timezone.timedelta(minutes=minutes[position])
+
+
+def first_passage_outcome(
+    index: FirstPassageIndex,
+    side: str,
+    tp: float,
+    sl: float,
+    until: Optional[timezone.datetime] = None,
+    take_profit_on_close: bool = False,
+) -> Optional[tuple[int, Optional[timezone.datetime]]]:
+    """Returns the exit reason and exit candle datetime for TP and SL
+    percentages, on the candles before until, like the first touch kernel.
+
+    Returns None when the index does not cover the candles needed to answer.
+    """
+
+    until = min(until, index.end) if until else index.end
+    entry_price = entry_price_for(index.open, side)
+    if side == "LONG":
+        take_profit_at = first_crossing(
+            index,
+            "close_high" if take_profit_on_close else "high",
+            entry_price + (entry_price * tp / 100),
+        )
+        stop_loss_at = first_crossing(
+            index, "low", entry_price - (entry_price * sl / 100)
+        )
+    else:
+        take_profit_at = first_crossing(
+            index,
+            "close_low" if take_profit_on_close else "low",
+            entry_price - (entry_price * tp / 100),
+        )
+        stop_loss_at = first_crossing(
+            index, "high", entry_price + (entry_price * sl / 100)
+        )
+
+    # the SL comes first when both are crossed by the same candle
+    exits = [
+        (crossed_at, reason)
+        for crossed_at, reason in (
+            (stop_loss_at, EXIT_STOP_LOSS),
+            (take_profit_at, EXIT_TAKE_PROFIT),
+        )
+        if crossed_at is not None and crossed_at < until
+    ]
+    if exits:
+        exit_at, reason = min(exits, key=lambda exit: exit[0])
+        return reason, exit_at
+    if until > index.covered_until:
+        return None
+    return EXIT_NONE, None
+
+
+def first_passage_trigger(
+    candles: Candles,
+    index: Optional[FirstPassageIndex],
+    side: str,
+    entry_price: float,
+    take_profit_distances: Iterable[float],
+    stop_loss_distances: Iterable[float],
+) -> int:
+    """Like simulation.first_trigger, answered from the index when it is
+    complete and was built on the same candles.
+
+    The index only looks FIRST_PASSAGE_HORIZON ahead, so without a crossing
+    the candles from its end on are left to the caller.
+    """
+
+    first = candles.first()
+    if (
+        index is None
+        or not index.complete
+        or first is None
+        or first.datetime != index.start
+        or first.open != index.open
+    ):
+        return first_trigger(
+            candles, side, entry_price, take_profit_distances, stop_loss_distances
+        )
+    take_profit_distance = min(take_profit_distances)
+    stop_loss_distance = min(stop_loss_distances)
+    direction = 1 if side == "LONG" else -1
+    upper = entry_price * (1 + direction * take_profit_distance / 100)
+    lower = entry_price * (1 - direction * stop_loss_distance / 100)
+    if side != "LONG":
+        upper, lower = lower, upper
+    crossings = [
+        crossed_at
+        for crossed_at in (
+            first_crossing(index, "high", upper),
+            first_crossing(index, "low", lower),
+        )
+        if crossed_at is not None
+    ]
+    return candles.index(min(crossings) if crossings else index.end)
+
+
+def position_outcome(
+    position: Position,
+    entry_price: float,
+    tp: float,
+    sl: float,
+    horizon: timezone.timedelta,
+    take_profit_on_close: bool,
+    reason: int,
+    exit_at: Optional[timezone.datetime],
+) -> PositionOutcome:
+    """Returns the outcome to cache, with the exit price and the R-multiple
+    net of fees."""
+
+    exit_price = None
+    r_multiple = None
+    if reason != EXIT_NONE:
+        distance = tp if reason == EXIT_TAKE_PROFIT else -sl
+        direction = 1 if position.side == "LONG" else -1
+        exit_price = entry_price + direction * (entry_price * distance / 100)
+        exit_fee = TAKE_PROFIT_FEE if reason == EXIT_TAKE_PROFIT else STOP_LOSS_FEE
+        fees = (ENTRY_FEE + exit_fee * exit_price / entry_price) * 100
+        r_multiple = (distance - fees) / sl
+    return PositionOutcome(
+        position=position,
+        side=position.side,
+        take_profit=tp,
+        stop_loss=sl,
+        horizon=horizon,
+        take_profit_on_close=take_profit_on_close,
+        fee_model_version=FEE_MODEL_VERSION,
+        entry_price=entry_price,
+        reason=reason,
+        exit_datetime=exit_at,
+        exit_price=exit_price,
+        r_multiple=r_multiple,
+        start=position.start,
+        end=exit_at or position.start + horizon,
+    )
+
+
+def cached_outcomes(
+    positions: Sequence[Position],
+    take_profits: Sequence[float],
+    stop_losses: Sequence[float],
+    horizon: timezone.timedelta,
+    take_profit_on_close: bool,
+) -> dict[tuple, tuple[float, int, Optional[timezone.datetime]]]:
+    """Returns the cached (entry price, reason, exit datetime) of the positions
+    per (position id, side, TP, SL)."""
+
+    ids = [position.id for position in positions]
+    cached = {}
+    for batch_start in range(0, len(ids), OUTCOME_BATCH_SIZE):
+        for row in PositionOutcome.objects.filter(
+            position_id__in=ids[batch_start : batch_start + OUTCOME_BATCH_SIZE],
+            take_profit__in=set(take_profits),
+            stop_loss__in=set(stop_losses),
+            horizon=horizon,
+            take_profit_on_close=take_profit_on_close,
+            fee_model_version=FEE_MODEL_VERSION,
+        ).values_list(
+            "position_id",
+            "side",
+            "take_profit",
+            "stop_loss",
+            "entry_price",
+            "reason",
+            "exit_datetime",
+        ):
+            cached[row[:4]] = row[4:]
+    return cached
+
+
+def first_passage_outcomes(
+    positions: Sequence[Position],
+    take_profits: Sequence[float],
+    stop_losses: Sequence[float],
+    horizon: timezone.timedelta,
+    until: Optional[timezone.datetime] = None,
+    take_profit_on_close: bool = False,
+    use_cache: bool = True,
+) -> FirstPassageOutcomes:
+    """Returns the entry price of every position and its exit reason for every
+    TP/SL pair, on the candles from start up to start + horizon or until.
+
+    Positions with cached outcomes for all pairs are answered from the
+    PositionOutcome table, positions with an index covering their window by
+    binary search and the others with one run of the first touch kernel.
+    The settled outcomes that were simulated are added to the cache.
+    """
+
+    entry_prices = np.full(len(positions), np.nan)
+    reasons = np.full((len(positions), len(take_profits)), EXIT_NONE, dtype=np.int8)
+    pairs = list(zip(take_profits, stop_losses))
+    cached = (
+        cached_outcomes(
+            positions, take_profits, stop_losses, horizon, take_profit_on_close
+        )
+        if use_cache
+        else {}
+    )
+    settled: list[PositionOutcome] = []
+    missing: list[int] = []
+    for row, position in enumerate(positions):
+        index = get_first_passage_index(position)
+        end = position.start + horizon
+        if until:
+            end = min(end, until)
+        keys = [(position.id, position.side, tp, sl) for tp, sl in pairs]
+        if position.start < end and all(key in cached for key in keys):
+            entry_prices[row] = cached[keys[0]][0]
+            # an exit at or after until was not reached yet
+            reasons[row] = [
+                reason if exit_at is not None and exit_at < end else EXIT_NONE
+                for _, reason, exit_at in (cached[key] for key in keys)
+            ]
+            continue
+        outcomes = (
+            [
+                first_passage_outcome(
+                    index,
+                    position.side,
+                    tp,
+                    sl,
+                    until=end,
+                    take_profit_on_close=take_profit_on_close,
+                )
+                for tp, sl in pairs
+            ]
+            if index
+            else [None]
+        )
+        if None in outcomes:
+            missing.append(row)
+            continue
+        entry_prices[row] = entry_price_for(index.open, position.side)
+        reasons[row] = [reason for reason, _ in outcomes]
+        if use_cache:
+            settled.extend(
+                position_outcome(
+                    position,
+                    float(entry_prices[row]),
+                    tp,
+                    sl,
+                    horizon,
+                    take_profit_on_close,
+                    reason,
+                    exit_at,
+                )
+                for (tp, sl), (reason, exit_at) in zip(pairs, outcomes)
+                if reason != EXIT_NONE or end == position.start + horizon
+            )
+
+    for symbol in {positions[row].symbol for row in missing}:
+        rows = [row for row in missing if positions[row].symbol == symbol]
+        symbol_positions = [positions[row] for row in rows]
+        ends = [
+            min(position.start + horizon, until) if until else position.start + horizon
+            for position in symbol_positions
+        ]
+        candles = load_candles(
+            ohlcv_symbol(symbol),
+            "5m",
+            min(position.start for position in symbol_positions),
+            max(ends),
+        )
+        starts = np.array(
+            [candles.index(position.start) for position in symbol_positions],
+            dtype=np.int64,
+        )
+        end_indexes = np.array([candles.index(end) for end in ends], dtype=np.int64)
+        is_long = np.array([position.side == "LONG" for position in symbol_positions])
+        entry_prices_column = np.array(
+            [
+                (
+                    entry_price_for(float(candles.open[start]), position.side)
+                    if start < end
+                    else np.nan
+                )
+                for position, start, end in zip(symbol_positions, starts, end_indexes)
+            ]
+        )[:, None]
+        tps = np.asarray(take_profits, dtype=np.float64)
+        sls = np.asarray(stop_losses, dtype=np.float64)
+
+        # one kernel row per position and TP/SL pair
+        touch = first_touch(
+            candles.high,
+            candles.low,
+            candles.close,
+            starts=np.repeat(starts, len(tps)),
+            ends=np.repeat(end_indexes, len(tps)),
+            is_long=np.repeat(is_long, len(tps)),
+            take_profit=np.where(
+                is_long[:, None],
+                entry_prices_column + (entry_prices_column * tps / 100),
+                entry_prices_column - (entry_prices_column * tps / 100),
+            ).ravel(),
+            stop_loss=np.where(
+                is_long[:, None],
+                entry_prices_column - (entry_prices_column * sls / 100),
+                entry_prices_column + (entry_prices_column * sls / 100),
+            ).ravel(),
+            take_profit_on_close=take_profit_on_close,
+        )
+        entry_prices[rows] = entry_prices_column[:, 0]
+        reasons[rows] = touch.reason.reshape(len(rows), len(tps))
+        if not use_cache or not candles.exists():
+            continue
+        last_candle_end = candles.last().datetime + CANDLE_DURATION
+        exit_indexes = touch.index.reshape(len(rows), len(tps))
+        for exits, row, position in zip(exit_indexes, rows, symbol_positions):
+            if np.isnan(entry_prices[row]):
+                continue
+            covered = last_candle_end >= position.start + horizon
+            for pair, (tp, sl) in enumerate(pairs):
+                reason = int(reasons[row, pair])
+                if reason == EXIT_NONE and not covered:
+                    continue
+                settled.append(
+                    position_outcome(
+                        position,
+                        float(entry_prices[row]),
+                        tp,
+                        sl,
+                        horizon,
+                        take_profit_on_close,
+                        reason,
+                        (
+                            candles[int(exits[pair])].datetime
+                            if reason != EXIT_NONE
+                            else None
+                        ),
+                    )
+                )
+
+    PositionOutcome.objects.bulk_create(
+        settled,
+        batch_size=OUTCOME_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=[
+            "position",
+            "side",
+            "take_profit",
+            "stop_loss",
+            "horizon",
+            "take_profit_on_close",
+            "fee_model_version",
+        ],
+        update_fields=[
+            "entry_price",
+            "reason",
+            "exit_datetime",
+            "exit_price",
+            "r_multiple",
+            "start",
+            "end",
+        ],
+    )
+    return FirstPassageOutcomes(entry_prices, reasons)
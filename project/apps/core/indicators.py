@@ -0,0 +1,339 @@
+from collections import deque
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from django.db.models import Max
+from django.utils import timezone
+
+from project.apps.core.candles import (
+    EPOCH,
+    Candle,
+    from_timestamp,
+    load_candles,
+    timeframe_seconds,
+)
+from project.apps.core.models import Indicator
+
+
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+MOVING_AVERAGE_PERIOD = 50
+
+# Wilder smoothing forgets its start after this many candles, (13 / 14) ** 1000
+# is far below float precision, so updates recompute from here instead of
+# storing the smoothing state
+WARMUP_CANDLES = 1000
+INDICATOR_BATCH_SIZE = 2000
+
+
+def wilder_average(average: float, values: np.ndarray, period: int = 14) -> float:
+    """Applies Wilder smoothing, average = (average * (period - 1) + value) / period,
+    for every value in one go."""
+
+    if not len(values):
+        return average
+    decay = (period - 1) / period
+    weights = decay ** np.arange(len(values) - 1, -1, -1)
+    return float(average * decay ** len(values) + np.dot(weights, values) / period)
+
+
+def simple_rsi(close: np.ndarray, period: int = 14) -> np.ndarray:
+    """Calculates the RSI of every close from the plain sums of the gains and
+    losses of the last period changes, nan for the first period closes."""
+
+    rsi = np.full(len(close), np.nan)
+    if len(close) <= period:
+        return rsi
+    change = np.diff(close)
+    gain = np.where(change > 0, change, 0.0)
+    loss = np.where(change > 0, 0.0, -change)
+    gains = np.zeros(len(close) - period)
+    losses = np.zeros(len(close) - period)
+    # summed newest change first, so the floats match the candle loops exactly
+    for offset in range(period):
+        gains += gain[period - 1 - offset : len(change) - offset]
+        losses += loss[period - 1 - offset : len(change) - offset]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi[period:] = np.where(
+            losses == 0, 100.0, 100.0 - (100.0 / (1.0 + gains / losses))
+        )
+    return rsi
+
+
+def body_rsi(
+    open: np.ndarray, close: np.ndarray, period: int = RSI_PERIOD
+) -> np.ndarray:
+    """Calculates the RSI class value of every candle in one go, from the
+    bodies of the last period candles, nan for the first period - 1 candles."""
+
+    rsi = np.full(len(close), np.nan)
+    if len(close) < period:
+        return rsi
+    body = close - open
+    gains = sliding_window_view(np.where(body > 0, body, 0.0), period).sum(axis=1)
+    losses = sliding_window_view(np.where(body < 0, -body, 0.0), period).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi[period - 1 :] = np.where(
+            losses == 0,
+            100.0,
+            100.0 - (100.0 / (1.0 + (gains / period) / (losses / period))),
+        )
+    return rsi
+
+
+def wilder_smoothing(values: np.ndarray, period: int) -> np.ndarray:
+    """Applies Wilder smoothing to a whole series, nan for the first period - 1
+    values."""
+
+    return (
+        pd.Series(values)
+        .ewm(alpha=1 / period, adjust=False, min_periods=period)
+        .mean()
+        .to_numpy()
+    )
+
+
+def wilder_rsi(close: np.ndarray, period: int = RSI_PERIOD) -> np.ndarray:
+    """Calculates the RSI of every close from the Wilder smoothed gains and
+    losses, nan until period changes were seen."""
+
+    if not len(close):
+        return np.empty(0)
+    change = np.diff(close)
+    average_gain = wilder_smoothing(np.maximum(change, 0.0), period)
+    average_loss = wilder_smoothing(np.maximum(-change, 0.0), period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = np.where(
+            average_loss == 0,
+            100.0,
+            100.0 - (100.0 / (1.0 + average_gain / average_loss)),
+        )
+    return np.concatenate([[np.nan], rsi])
+
+
+def average_true_range(
+    high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = ATR_PERIOD
+) -> np.ndarray:
+    """Calculates the Wilder smoothed true range of every candle."""
+
+    previous_close = np.concatenate([[np.nan], close[:-1]])
+    true_range = np.fmax.reduce(
+        [high - low, np.abs(high - previous_close), np.abs(low - previous_close)]
+    )
+    return wilder_smoothing(true_range, period)
+
+
+def moving_average(
+    close: np.ndarray, period: int = MOVING_AVERAGE_PERIOD
+) -> np.ndarray:
+    """Calculates the simple moving average of every close."""
+
+    return pd.Series(close).rolling(period).mean().to_numpy()
+
+
+class RSI:
+    """RSI of the bodies (close - open) of the last period candles, as used by
+    the what-if simulations, updated in O(1) per candle."""
+
+    __slots__ = ("period", "changes", "gains", "losses", "nr_of_gains", "nr_of_losses")
+
+    def __init__(self, period: int = RSI_PERIOD, candles: Iterable = ()):
+        self.period = period
+        self.changes = deque()
+        self.gains = 0.0
+        self.losses = 0.0
+        self.nr_of_gains = 0
+        self.nr_of_losses = 0
+        for candle in candles:
+            self.update(candle)
+
+    def _count(self, change: float, sign: int) -> None:
+        # the sums restart from zero when the window has no gains or losses
+        # left, so rounding errors do not pile up
+        if change > 0:
+            self.nr_of_gains += sign
+            self.gains = self.gains + sign * change if self.nr_of_gains else 0.0
+        elif change < 0:
+            self.nr_of_losses += sign
+            self.losses = self.losses - sign * change if self.nr_of_losses else 0.0
+
+    def update(self, candle) -> Optional[float]:
+        change = candle.close - candle.open
+        self.changes.append(change)
+        self._count(change, 1)
+        if len(self.changes) > self.period:
+            self._count(self.changes.popleft(), -1)
+        return self.value
+
+    @property
+    def value(self) -> Optional[float]:
+        """The RSI, None until period candles were seen."""
+
+        if len(self.changes) < self.period:
+            return None
+        if not self.nr_of_losses:
+            return 100
+        rs = (self.gains / self.period) / (self.losses / self.period)
+        return 100 - (100 / (1 + rs))
+
+
+class ATR:
+    """Wilder smoothed range of the candles, updated in O(1) per candle. As in
+    the what-if simulations the range is measured against the candle's own
+    close."""
+
+    __slots__ = ("period", "value")
+
+    def __init__(self, value: float = 0.0, period: int = ATR_PERIOD):
+        self.period = period
+        self.value = value
+
+    def update(self, candle) -> float:
+        true_range = max(
+            candle.high - candle.low,
+            abs(candle.high - candle.close),
+            abs(candle.low - candle.close),
+        )
+        self.value = (self.value * (self.period - 1) + true_range) / self.period
+        return self.value
+
+
+class EMA:
+    """Exponential moving average, updated in O(1) per value."""
+
+    __slots__ = ("alpha", "value")
+
+    def __init__(self, period: int, value: Optional[float] = None):
+        self.alpha = 2 / (period + 1)
+        self.value = value
+
+    def update(self, value: float) -> float:
+        self.value = (
+            value
+            if self.value is None
+            else self.value + self.alpha * (value - self.value)
+        )
+        return self.value
+
+
+class RollingHigh:
+    """Highest of the last period values, in amortized O(1) per value.
+
+    Only the values that can still become the highest are kept, in a deque
+    that decreases from the front to the back.
+    """
+
+    __slots__ = ("period", "count", "candidates")
+
+    def __init__(self, period: int):
+        self.period = period
+        self.count = 0
+        self.candidates = deque()
+
+    def _dominates(self, value: float, candidate: float) -> bool:
+        return value >= candidate
+
+    def update(self, value: float) -> float:
+        while self.candidates and self._dominates(value, self.candidates[-1][1]):
+            self.candidates.pop()
+        self.candidates.append((self.count, value))
+        self.count += 1
+        if self.candidates[0][0] <= self.count - 1 - self.period:
+            self.candidates.popleft()
+        return self.value
+
+    @property
+    def value(self) -> Optional[float]:
+        return self.candidates[0][1] if self.candidates else None
+
+
+class RollingLow(RollingHigh):
+    """Lowest of the last period values, in amortized O(1) per value."""
+
+    __slots__ = ()
+
+    def _dominates(self, value: float, candidate: float) -> bool:
+        return value <= candidate
+
+
+def update_indicators(symbol: str, timeframe: str, rebuild: bool = False) -> int:
+    """Stores the indicators of the candles that have none yet and of the last
+    one, whose candle may have changed since. Returns the number of rows.
+    """
+
+    step = timezone.timedelta(seconds=timeframe_seconds(timeframe))
+    last = (
+        None
+        if rebuild
+        else Indicator.objects.filter(symbol=symbol, timeframe=timeframe).aggregate(
+            Max("datetime")
+        )["datetime__max"]
+    )
+    candles = load_candles(
+        symbol,
+        timeframe,
+        last - WARMUP_CANDLES * step if last else EPOCH,
+        timezone.now() + step,
+    )
+    rsi = wilder_rsi(candles.close)
+    atr = average_true_range(candles.high, candles.low, candles.close)
+    moving_average_50 = moving_average(candles.close)
+
+    def value(values: np.ndarray, i: int):
+        return None if np.isnan(values[i]) else float(values[i])
+
+    indicators = [
+        Indicator(
+            symbol=symbol,
+            timeframe=timeframe,
+            datetime=from_timestamp(candles.timestamps[i]),
+            rsi=value(rsi, i),
+            atr=value(atr, i),
+            moving_average_50=value(moving_average_50, i),
+        )
+        for i in range(candles.index(last) if last else 0, len(candles))
+    ]
+    Indicator.objects.bulk_create(
+        indicators,
+        batch_size=INDICATOR_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["symbol", "timeframe", "datetime"],
+        update_fields=["rsi", "atr", "moving_average_50"],
+    )
+    return len(indicators)
+
+
+def get_indicators(
+    symbol: str,
+    timeframe: str,
+    start: timezone.datetime,
+    end: timezone.datetime,
+) -> dict[timezone.datetime, tuple]:
+    """Returns (rsi, atr, moving_average_50) per candle datetime with
+    start <= datetime <= end."""
+
+    return {
+        row[0]: row[1:]
+        for row in Indicator.objects.filter(
+            symbol=symbol,
+            timeframe=timeframe,
+            datetime__gte=start,
+            datetime__lte=end,
+        ).values_list("datetime", "rsi", "atr", "moving_average_50")
+    }
+
+
+def liquidation_indicators(
+    indicators: dict[timezone.datetime, tuple], candle: Candle
+) -> tuple[float, float]:
+    """Returns the RSI and the ATR as a percentage of the close of a
+    liquidation candle, 50 and 0 when it has no indicators."""
+
+    rsi, atr, _ = indicators.get(candle.datetime, (None, None, None))
+    return (
+        round(rsi, 2) if rsi is not None else 50,
+        atr / candle.close * 100 if atr is not None else 0,
+    )
@@ -0,0 +1,157 @@
+import os
+import socket
+import threading
+import time
+from typing import Iterable, Optional
+
+from django.db import DatabaseError, connection
+from django.db.models import F, Q
+from django.http import QueryDict
+from django.utils import timezone
+
+from project.apps.core.models import WhatIfJob
+
+
+# at most one progress update per job per this many seconds
+PROGRESS_INTERVAL = 1.0
+CLAIM_BATCH_SIZE = 10
+# a running job without a heartbeat for this long lost its worker
+JOB_LEASE = timezone.timedelta(minutes=5)
+# the worker refreshes the heartbeat of its job this often, also while the
+# job reports no progress
+HEARTBEAT_INTERVAL = JOB_LEASE / 10
+
+
+def worker_name(pid: Optional[int] = None) -> str:
+    return f"{socket.gethostname()}-{pid or os.getpid()}"
+
+
+def enqueue_job(view: str, data: QueryDict, cache_key: str = "") -> WhatIfJob:
+    """Stores the submitted form data of a what-if view as a pending job."""
+
+    parameters = {
+        key: values for key, values in data.lists() if key != "csrfmiddlewaretoken"
+    }
+    return WhatIfJob.objects.create(
+        view=view, parameters=parameters, cache_key=cache_key
+    )
+
+
+def job_data(job: WhatIfJob) -> QueryDict:
+    """Returns the form data of the job, as it was submitted."""
+
+    data = QueryDict(mutable=True)
+    for key, values in job.parameters.items():
+        data.setlist(key, values)
+    return data
+
+
+def claim_job() -> Optional[WhatIfJob]:
+    """Marks the oldest pending job as running and returns it, None when no
+    job is pending. Only one worker wins the update of a job."""
+
+    pending = WhatIfJob.objects.filter(status=WhatIfJob.StatusChoices.PENDING)
+    for job_id in pending.order_by("created", "id").values_list("id", flat=True)[
+        :CLAIM_BATCH_SIZE
+    ]:
+        now = timezone.now()
+        claimed = pending.filter(id=job_id).update(
+            status=WhatIfJob.StatusChoices.RUNNING,
+            worker=worker_name(),
+            started=now,
+            heartbeat=now,
+        )
+        if claimed:
+            return WhatIfJob.objects.get(id=job_id)
+    return None
+
+
+def requeue_running_jobs(workers: Optional[Iterable[str]] = None) -> int:
+    """Puts running jobs back in the queue: the jobs of the given workers, or
+    without workers the jobs that had no heartbeat for JOB_LEASE, so
+    the jobs of other live workers are left alone. Returns the number of
+    jobs."""
+
+    running = WhatIfJob.objects.filter(status=WhatIfJob.StatusChoices.RUNNING)
+    if workers is not None:
+        running = running.filter(worker__in=list(workers))
+    else:
+        running = running.filter(
+            Q(heartbeat__isnull=True) | Q(heartbeat__lt=timezone.now() - JOB_LEASE)
+        )
+    return running.update(
+        status=WhatIfJob.StatusChoices.PENDING,
+        processed=0,
+        worker="",
+        started=None,
+        heartbeat=None,
+    )
+
+
+def finish_job(job: WhatIfJob, result: dict) -> None:
+    job.status = WhatIfJob.StatusChoices.DONE
+    job.result = result
+    job.processed = F("total")
+    job.finished = timezone.now()
+    job.save(update_fields=["status", "result", "processed", "finished"])
+    job.refresh_from_db(fields=["processed", "total"])
+
+
+def fail_job(job: WhatIfJob, error: str) -> None:
+    job.status = WhatIfJob.StatusChoices.FAILED
+    job.error = error
+    job.finished = timezone.now()
+    job.save(update_fields=["status", "error", "finished"])
+
+
+class JobProgress:
+    """Stores the progress of a running job, throttled to one update per
+    PROGRESS_INTERVAL seconds."""
+
+    def __init__(self, job: WhatIfJob):
+        self.job = job
+        self.updated = 0.0
+
+    def __call__(self, processed: int, total: int) -> None:
+        now = time.monotonic()
+        if now - self.updated < PROGRESS_INTERVAL and processed < total:
+            return
+        self.updated = now
+        WhatIfJob.objects.filter(id=self.job.id).update(
+            processed=processed, total=total, heartbeat=timezone.now()
+        )
+
+
+class JobHeartbeat:
+    """Refreshes the heartbeat of a running job every HEARTBEAT_INTERVAL from
+    a thread while the context is open, independent of the progress reports,
+    so a slow stretch of a job doesn't lose it its lease."""
+
+    def __init__(self, job: WhatIfJob):
+        self.job = job
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self) -> "JobHeartbeat":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self) -> None:
+        try:
+            while not self.stopped.wait(HEARTBEAT_INTERVAL.total_seconds()):
+                try:
+                    WhatIfJob.objects.filter(
+                        id=self.job.id,
+                        status=WhatIfJob.StatusChoices.RUNNING,
+                        worker=self.job.worker,
+                    ).update(heartbeat=timezone.now())
+                except DatabaseError:
+                    # a locked database, tried again on the next beat
+                    continue
+        finally:
+            # the thread has its own connection
+            connection.close()
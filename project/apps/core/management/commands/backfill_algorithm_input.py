@@ -0,0 +1,223 @@
+import contextlib
+import io
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date
+from typing import List, NamedTuple
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.utils import timezone
+
+
+LEVEL_COMMANDS = {
+    "lvl1": "create_algorithm_input",
+    "lvl2": "create_lvl2_algorithm_input",
+    "lvl3": "create_lvl3_trading_days",
+}
+
+
+class Task(NamedTuple):
+    """One level of the algorithm input for the week starting on monday."""
+
+    level: str
+    monday: date
+
+    def __str__(self):
+        return f"{self.level}-{self.monday}"
+
+
+def dependencies(task: Task) -> List[Task]:
+    """Returns the tasks whose algorithm input the task reads.
+
+    lvl2 reads the lvl1 input of its own week and of the weeks with
+    liquidations in the 90 days before it, lvl3 the lvl2 input of the weeks
+    with liquidations in the 180 days before it.
+    """
+
+    match task.level:
+        case "lvl2":
+            return [
+                Task("lvl1", task.monday - timezone.timedelta(weeks=weeks))
+                for weeks in range(0, 14)
+            ]
+        case "lvl3":
+            return [
+                Task("lvl2", task.monday - timezone.timedelta(weeks=weeks))
+                for weeks in range(1, 27)
+            ]
+        case _:
+            return []
+
+
+def setup_worker() -> None:
+    """Sets Django up once per worker process, with its own database
+    connections."""
+
+    django.setup()
+    connections.close_all()
+
+
+def run_task(task: Task, symbol: str) -> str:
+    """Runs the management command of the task and returns its output."""
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        call_command(
+            LEVEL_COMMANDS[task.level],
+            year=task.monday.year,
+            month=task.monday.month,
+            day=task.monday.day,
+            symbol=symbol,
+        )
+    return output.getvalue()
+
+
+def load_checkpoint(path: str) -> set[str]:
+    """Returns the completed tasks stored in the checkpoint file."""
+
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return set(json.load(f)["completed"])
+
+
+def save_checkpoint(path: str, completed: set[str]) -> None:
+    """Stores the completed tasks, replacing the file in one go so an
+    interruption never leaves half a checkpoint behind."""
+
+    with open(f"{path}.tmp", "w") as f:
+        json.dump({"completed": sorted(completed)}, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+class Command(BaseCommand):
+    help = "Regenerate the algorithm input of every Monday on a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from-date",
+            type=date.fromisoformat,
+            default=date(2024, 10, 1),
+            help="First date (YYYY-MM-DD) to regenerate, from its first Monday on",
+        )
+        parser.add_argument(
+            "--to-date",
+            type=date.fromisoformat,
+            help="Last date (YYYY-MM-DD) to regenerate, defaults to today",
+        )
+        parser.add_argument(
+            "--symbol",
+            type=str,
+            default="BTC",
+            help="symbol for which to create the algorithm input data",
+        )
+        parser.add_argument(
+            "--levels",
+            type=str,
+            nargs="+",
+            choices=list(LEVEL_COMMANDS),
+            default=list(LEVEL_COMMANDS),
+            help="Levels of the algorithm input to regenerate",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help=(
+                "Number of worker processes, defaults to the number of CPUs and "
+                "to 1 on SQLite, which locks the whole database on every write"
+            ),
+        )
+        parser.add_argument(
+            "--checkpoint",
+            type=str,
+            help="File with the completed weeks, defaults to backfill-<symbol>.json in the export path",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignore the checkpoint and regenerate all weeks",
+        )
+
+    def handle(self, *args, **options):
+        symbol = options["symbol"]
+        to_date = options["to_date"] or timezone.now().date()
+        monday = options["from_date"] + timezone.timedelta(
+            days=-options["from_date"].weekday() % 7
+        )
+        mondays = []
+        while monday <= to_date:
+            mondays.append(monday)
+            monday += timezone.timedelta(weeks=1)
+        scheduled = {
+            Task(level, monday) for level in options["levels"] for monday in mondays
+        }
+
+        checkpoint = options["checkpoint"] or os.path.join(
+            settings.ALGORITHM_EXPORT_PATH, f"backfill-{symbol}.json"
+        )
+        completed = set() if options["restart"] else load_checkpoint(checkpoint)
+        pending = sorted(
+            (task for task in scheduled if str(task) not in completed),
+            key=lambda task: (task.level, task.monday),
+        )
+        workers = options["workers"] or (
+            1 if connection.vendor == "sqlite" else os.cpu_count()
+        )
+        if workers > 1 and connection.vendor == "sqlite":
+            print(
+                "Workers writing to SQLite at the same time may fail with "
+                "database is locked, use --workers 1 if they do"
+            )
+        print(
+            f"Regenerating {len(pending)} of {len(scheduled)} tasks "
+            f"for {symbol} with {workers} workers"
+        )
+
+        # the workers open their own connections
+        connections.close_all()
+        failed: set[Task] = set()
+        running = {}
+        with ProcessPoolExecutor(max_workers=workers, initializer=setup_worker) as pool:
+            while pending or running:
+                waiting = []
+                for task in pending:
+                    required = [
+                        dependency
+                        for dependency in dependencies(task)
+                        if dependency in scheduled
+                    ]
+                    if any(dependency in failed for dependency in required):
+                        print(f"Skipped {task}, a task it depends on failed")
+                        failed.add(task)
+                    elif all(str(dependency) in completed for dependency in required):
+                        running[pool.submit(run_task, task, symbol)] = task
+                    else:
+                        waiting.append(task)
+                pending = waiting
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    try:
+                        output = future.result()
+                    except Exception as e:
+                        print(f"Failed {task}: {e}")
+                        failed.add(task)
+                        continue
+                    if options["verbosity"] > 1:
+                        print(output)
+                    completed.add(str(task))
+                    save_checkpoint(checkpoint, completed)
+                    print(f"Completed {task}")
+
+        print(
+            f"Completed {len(scheduled) - len(failed)} of {len(scheduled)} tasks, "
+            f"{len(failed)} failed"
+        )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from project.apps.core.first_passage import (
+    build_first_passage_indexes,
+    positions_to_index,
+)
+from project.apps.core.models import Position
+
+
+class Command(BaseCommand):
+    help = "Build the first passage index of 5m positions that have none or an incomplete one."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--symbol",
+            type=str,
+            help="Position symbol (e.g. BTCUSDT), defaults to all symbols",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Rebuild the indexes of all 5m positions, also the complete ones",
+        )
+
+    def handle(self, *args, **options):
+        positions = Position.objects.filter(timeframe="5m")
+        if options["symbol"]:
+            positions = positions.filter(symbol=options["symbol"])
+        if not options["rebuild"]:
+            positions = positions_to_index(positions)
+        built = build_first_passage_indexes(positions)
+        print(f"Built {built} first passage indexes")
@@ -8,7 +8,14 @@ from django.core.management.base import BaseCommand
 from django.db.models import QuerySet
 from django.utils import timezone
 
-from project.apps.core.models import Position, OHLCV
+from project.apps.core.algorithm_input import store_algorithm_input
+from project.apps.core.models import AlgorithmInput, Position, OHLCV
+from project.apps.core.sliding_window import (
+    WINDOW_ALL,
+    WINDOW_SIX_MONTH,
+    WINDOW_THREE_MONTH,
+    SlidingWindowScorer,
+)
 
 
 x10_TP_SL_PAIRS = [
@@ -59,6 +66,19 @@ class Command(BaseCommand):
             help="symbol for which to create the algorithm input data",
             default="BTC",
         )
+        parser.add_argument(
+            "--evaluation",
+            type=str,
+            choices=["grid", "per-pair"],
+            help="score all TP/SL pairs in one pass or run every pair separately",
+            default="grid",
+        )
+        parser.add_argument(
+            "--weeks",
+            type=int,
+            help="number of consecutive weeks from the date on to create the algorithm input data for",
+            default=1,
+        )
 
     def calculate_position_outcome(
         self,
@@ -232,66 +252,79 @@ class Command(BaseCommand):
                 three_month_wins += local_three_month_wins
                 three_month_losses += local_three_month_losses
 
-            six_month_nr_of_r_s = round(
-                (tp / sl * six_month_wins)
-                - (six_month_wins * (0.04 / sl))
-                - (six_month_losses)
-                - (six_month_losses * (0.1 / sl)),
-                2,
-            )
-            three_month_nr_of_r_s = round(
-                (tp / sl * three_month_wins)
-                - (three_month_wins * (0.04 / sl))
-                - (three_month_losses)
-                - (three_month_losses * (0.1 / sl)),
-                2,
-            )
-            return_row[f"tpx10_{tpx10}_slx10_{slx10}"] = round(
-                ((six_month_nr_of_r_s / 2) + (three_month_nr_of_r_s)) / 2,
-                2,
+            return_row[f"tpx10_{tpx10}_slx10_{slx10}"] = self.score(
+                tp,
+                sl,
+                six_month_wins,
+                six_month_losses,
+                three_month_wins,
+                three_month_losses,
             )
             return_row["trades"] = total_losses + total_wins
             return_list.append(return_row)
         return return_list
 
-    def handle(self, *args, **options):
-        # get until_date
-        if options["year"] and options["month"] and options["day"]:
-            year = options["year"]
-            month = options["month"]
-            day = options["day"]
-            till_date = date(year, month, day)
-        else:
-            till_date = timezone.now().date()
-
-        symbol = options["symbol"] + "USDT"
+    def score(
+        self,
+        tp: float,
+        sl: float,
+        six_month_wins: int,
+        six_month_losses: int,
+        three_month_wins: int,
+        three_month_losses: int,
+    ) -> float:
+        six_month_nr_of_r_s = round(
+            (tp / sl * six_month_wins)
+            - (six_month_wins * (0.04 / sl))
+            - (six_month_losses)
+            - (six_month_losses * (0.1 / sl)),
+            2,
+        )
+        three_month_nr_of_r_s = round(
+            (tp / sl * three_month_wins)
+            - (three_month_wins * (0.04 / sl))
+            - (three_month_losses)
+            - (three_month_losses * (0.1 / sl)),
+            2,
+        )
+        return round(
+            ((six_month_nr_of_r_s / 2) + (three_month_nr_of_r_s)) / 2,
+            2,
+        )
 
-        print(f"Generating {symbol} algorithm input data for {till_date}")
+    def run_algorithm_input_grid(
+        self, scorer: SlidingWindowScorer, until_date: date
+    ) -> pd.DataFrame:
+        """Scores all TP/SL pairs for all hours from the sliding window counts
+        of the scorer."""
 
-        strategy_type = "reversed"
-        day_dataframe = pd.DataFrame()
-        filter_kwargs = {"confirmation_candles__in": [1, 2]}
-        for tpx10, slx10 in x10_TP_SL_PAIRS:
-            result = self.run_algorithm_input(
-                symbol,
-                till_date,
-                tpx10,
-                slx10,
-                strategy_type,
-                **filter_kwargs,
-            )
-            print(f"Completed TP {tpx10 / 10} SL {slx10 / 10} for {strategy_type}")
-            tp_dataframe = pd.DataFrame(result)
-            if day_dataframe.empty:
-                day_dataframe = tp_dataframe[
-                    ["hour", "trades", f"tpx10_{tpx10}_slx10_{slx10}"]
-                ]
-            else:
-                day_dataframe = pd.merge(
-                    day_dataframe,
-                    tp_dataframe[["hour", f"tpx10_{tpx10}_slx10_{slx10}"]],
-                    on="hour",
+        wins, losses = scorer.advance(until_date)
+        return_list: List[dict] = []
+        for hour in range(24):
+            return_row: dict = {
+                "hour": hour,
+                # like the per-pair run, trades are counted for the first pair
+                "trades": int(wins[WINDOW_ALL, hour, 0] + losses[WINDOW_ALL, hour, 0]),
+            }
+            for pair, (tpx10, slx10) in enumerate(x10_TP_SL_PAIRS):
+                return_row[f"tpx10_{tpx10}_slx10_{slx10}"] = self.score(
+                    tpx10 / 10,
+                    slx10 / 10,
+                    int(wins[WINDOW_SIX_MONTH, hour, pair]),
+                    int(losses[WINDOW_SIX_MONTH, hour, pair]),
+                    int(wins[WINDOW_THREE_MONTH, hour, pair]),
+                    int(losses[WINDOW_THREE_MONTH, hour, pair]),
                 )
+            return_list.append(return_row)
+        return pd.DataFrame(return_list)
+
+    def write_algorithm_input(
+        self,
+        symbol: str,
+        till_date: date,
+        strategy_type: str,
+        day_dataframe: pd.DataFrame,
+    ) -> None:
         # write to csv
         day_dataframe.to_csv(
             f"{settings.ALGORITHM_EXPORT_PATH}/data-{symbol}-{till_date}-{strategy_type}.csv",
@@ -321,6 +354,7 @@ class Command(BaseCommand):
         df = pd.read_csv(
             f"{settings.ALGORITHM_EXPORT_PATH}/data-{symbol}-{till_date}-{strategy_type}.csv"
         )
+        input_rows = []
         for row in df.itertuples(index=False):
             tp_percentage = round(
                 max(
@@ -353,3 +387,90 @@ class Command(BaseCommand):
                 ]
                 print("\t".join(map(str, write_row)))
                 writer.writerow(write_row)
+            input_rows.append(write_row)
+        store_algorithm_input(
+            symbol,
+            strategy_type,
+            AlgorithmInput.LevelChoices.LVL1,
+            till_date,
+            pd.DataFrame(input_rows, columns=header_row),
+        )
+
+    def handle(self, *args, **options):
+        # get until_date
+        if options["year"] and options["month"] and options["day"]:
+            year = options["year"]
+            month = options["month"]
+            day = options["day"]
+            till_date = date(year, month, day)
+        else:
+            till_date = timezone.now().date()
+
+        symbol = options["symbol"] + "USDT"
+        strategy_type = "reversed"
+        filter_kwargs = {"confirmation_candles__in": [1, 2]}
+        # consecutive weeks share most of their positions, the scorer only
+        # adds the new ones and subtracts the ones that dropped out
+        scorer = SlidingWindowScorer(
+            Position.objects.filter(
+                symbol=symbol,
+                liquidation_amount__gte=2000,  # TODO: parameterize this
+                timeframe="5m",
+                liquidation_datetime__week_day__in=[2, 3, 4, 5, 6],  # monday-friday
+                strategy_type=strategy_type,
+                **filter_kwargs,
+            )
+            .exclude(candles_before_entry=1)
+            .select_related("first_passage_index")
+            .distinct(),
+            take_profits=[tpx10 / 10 for tpx10, _ in x10_TP_SL_PAIRS],
+            stop_losses=[slx10 / 10 for _, slx10 in x10_TP_SL_PAIRS],
+        )
+        for week in range(options["weeks"]):
+            self.generate(
+                symbol,
+                till_date + timezone.timedelta(weeks=week),
+                strategy_type,
+                options["evaluation"],
+                scorer,
+                **filter_kwargs,
+            )
+
+    def generate(
+        self,
+        symbol: str,
+        till_date: date,
+        strategy_type: str,
+        evaluation: str,
+        scorer: SlidingWindowScorer,
+        **filter_kwargs,
+    ) -> None:
+        print(f"Generating {symbol} algorithm input data for {till_date}")
+
+        day_dataframe = pd.DataFrame()
+        if evaluation == "grid":
+            day_dataframe = self.run_algorithm_input_grid(scorer, till_date)
+            print(f"Completed all TP/SL pairs for {strategy_type}")
+        else:
+            for tpx10, slx10 in x10_TP_SL_PAIRS:
+                result = self.run_algorithm_input(
+                    symbol,
+                    till_date,
+                    tpx10,
+                    slx10,
+                    strategy_type,
+                    **filter_kwargs,
+                )
+                print(f"Completed TP {tpx10 / 10} SL {slx10 / 10} for {strategy_type}")
+                tp_dataframe = pd.DataFrame(result)
+                if day_dataframe.empty:
+                    day_dataframe = tp_dataframe[
+                        ["hour", "trades", f"tpx10_{tpx10}_slx10_{slx10}"]
+                    ]
+                else:
+                    day_dataframe = pd.merge(
+                        day_dataframe,
+                        tp_dataframe[["hour", f"tpx10_{tpx10}_slx10_{slx10}"]],
+                        on="hour",
+                    )
+        self.write_algorithm_input(symbol, till_date, strategy_type, day_dataframe)
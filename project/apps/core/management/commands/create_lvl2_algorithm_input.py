@@ -2,14 +2,22 @@ from dataclasses import dataclass
 from datetime import date
 from decouple import config
 import discord
+import numpy as np
 import pandas as pd
 from typing import List
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db.models import QuerySet
 from django.utils import timezone
 
-from project.apps.core.models import Position, OHLCV
+from project.apps.core.algorithm_input import (
+    algorithm_input_dataframe,
+    algorithm_inputs,
+    store_algorithm_input,
+)
+from project.apps.core.first_passage import first_passage_outcomes
+from project.apps.core.models import AlgorithmInput, Position
+from project.apps.core.simulation import EXIT_STOP_LOSS, EXIT_TAKE_PROFIT
 
 
 INITIAL_CAPITAL = 100
@@ -99,10 +107,6 @@ class Command(BaseCommand):
             till_date = timezone.now().date()
 
         symbol = options["symbol"] + "USDT"
-        symbol_convertor = {
-            "BTCUSDT": "BTC/USDT:USDT",
-            "ETHUSDT": "ETH/USDT:USDT",
-        }
         strategy_type = "reversed"
         positions: QuerySet[Position] = Position.objects.exclude(
             candles_before_entry=1,
@@ -119,163 +123,108 @@ class Command(BaseCommand):
         ).distinct()
 
         performance_list: List[dict] = []
+        lvl1_inputs = algorithm_inputs(
+            symbol, strategy_type, AlgorithmInput.LevelChoices.LVL1
+        )
 
         for hour in range(24):
             total_returns = INITIAL_CAPITAL
             hour_row: dict = {"hour": hour}
-            hour_positions = positions.filter(liquidation_datetime__hour=hour).order_by(
-                "liquidation_datetime"
+            hour_positions = (
+                positions.filter(liquidation_datetime__hour=hour)
+                .select_related("first_passage_index")
+                .order_by("liquidation_datetime")
             )
             for position in hour_positions:
-                try:
-                    try:
-                        # try the file of the liquidation date first
-                        algorithm_input: pd.DataFrame = pd.read_csv(
-                            f"data/algorithm_input-{position.symbol}-{position.liquidation_datetime.date()}-{position.strategy_type}.csv"
-                        )
-                    except:
-                        # if not found, try the file of the Monday of that week
-                        algorithm_input: pd.DataFrame = pd.read_csv(
-                            f"data/algorithm_input-{position.symbol}-{position.liquidation_datetime.date() - timezone.timedelta(days=position.liquidation_datetime.weekday())}-{position.strategy_type}.csv"
-                        )
-                except:
-                    # if not found, skip this position
-                    continue
-                trade: bool = False
-                tp: float = 0.0
-                sl: float = 0.0
-                performance_lvl1: float
-                for row in algorithm_input.itertuples():
-                    if row.hour == hour:
-                        trade, performance_lvl1, tp, sl = (
-                            row.trade_lvl1,
-                            row.performance_lvl1,
-                            row.tp,
-                            row.sl,
-                        )
-
-                if not trade:
+                # the latest lvl1 input generated before the liquidation
+                algorithm_input = lvl1_inputs.get(
+                    position.liquidation_datetime, hour=hour
+                )
+                if not algorithm_input or not algorithm_input.trade_lvl1:
                     continue
+                performance_lvl1: float = algorithm_input.performance_lvl1
+                tp: float = algorithm_input.tp
+                sl: float = algorithm_input.sl
 
                 position.what_if_returns = 0
                 position.start = position.start.replace(second=0, microsecond=0)
-                ohlcv_s = OHLCV.objects.filter(
-                    symbol=symbol_convertor.get(position.symbol),
-                    datetime__gte=position.start,
-                    datetime__lt=min(
-                        position.start.date() + timezone.timedelta(days=28), till_date
+                until_date = min(
+                    position.start.date() + timezone.timedelta(days=28), till_date
+                )
+                outcomes = first_passage_outcomes(
+                    [position],
+                    take_profits=[tp],
+                    stop_losses=[sl],
+                    horizon=timezone.timedelta(days=28),
+                    until=timezone.datetime(
+                        until_date.year, until_date.month, until_date.day
                     ),
-                    timeframe="5m",
-                ).order_by("datetime")
-                if ohlcv_s.exists():
-                    position.entry_price = round(
+                )
+                if np.isnan(outcomes.entry_prices[0]):
+                    continue
+                position.entry_price = float(outcomes.entry_prices[0])
+                position.amount = round(
+                    (total_returns)
+                    / sl
+                    / position.entry_price
+                    * min(performance_lvl1 / 10, 1),
+                    4,
+                )
+                amount = position.amount
+                fees_for_opening = (
+                    position.amount * position.entry_price * BLOFIN_LIMIT_ORDER_FEE
+                )
+                position.what_if_returns -= fees_for_opening
+
+                # SL
+                if outcomes.reasons[0, 0] == EXIT_STOP_LOSS:
+                    position.closing_price = round(
                         (
-                            ohlcv_s.first().open * 1.0001
-                            if position.side == "SHORT"
-                            else ohlcv_s.first().open * 0.9999
+                            position.entry_price - (position.entry_price * sl / 100)
+                            if position.side == "LONG"
+                            else position.entry_price
+                            + (position.entry_price * sl / 100)
                         ),
                         1,
                     )
-                    position.amount = round(
-                        (total_returns)
-                        / sl
-                        / position.entry_price
-                        * min(performance_lvl1 / 10, 1),
-                        4,
-                    )
-                    amount = position.amount
-                    fees_for_opening = (
-                        position.amount * position.entry_price * BLOFIN_LIMIT_ORDER_FEE
+                    fees_for_closing = (
+                        amount * position.closing_price * BLOFIN_MARKET_ORDER_FEE
                     )
-                    position.what_if_returns -= fees_for_opening
-
-                for candle in ohlcv_s:
+                    position.what_if_returns -= fees_for_closing
+                    loss = (position.entry_price * sl / 100) * amount
+                    position.what_if_returns -= loss
+                    total_returns += position.what_if_returns
 
-                    if position.side == "LONG":
-
-                        # SL
-                        if candle.low <= position.entry_price - (
-                            position.entry_price * sl / 100
-                        ):
-                            position.closing_price = round(
-                                position.entry_price
-                                - (position.entry_price * sl / 100),
-                                1,
-                            )
-                            fees_for_closing = (
-                                amount
-                                * position.closing_price
-                                * BLOFIN_MARKET_ORDER_FEE
-                            )
-                            position.what_if_returns -= fees_for_closing
-                            loss = (position.entry_price * sl / 100) * amount
-                            position.what_if_returns -= loss
-                            total_returns += position.what_if_returns
-                            break
-
-                        # final TP
-                        if candle.high >= position.entry_price + (
-                            position.entry_price * tp / 100
-                        ):
-                            position.closing_price = round(
-                                position.entry_price
-                                + (position.entry_price * tp / 100),
-                                1,
-                            )
-                            fees_for_closing = (
-                                amount * position.entry_price * BLOFIN_LIMIT_ORDER_FEE
-                            )
-                            position.what_if_returns -= fees_for_closing
-                            local_win = (position.entry_price * tp / 100) * amount
-                            position.what_if_returns += local_win
-                            total_returns += position.what_if_returns
-                            break
-
-                    if position.side == "SHORT":
-
-                        # SL
-                        if candle.high >= position.entry_price + (
-                            position.entry_price * sl / 100
-                        ):
-                            position.closing_price = round(
-                                position.entry_price
-                                + (position.entry_price * sl / 100),
-                                1,
-                            )
-                            fees_for_closing = (
-                                amount
-                                * position.closing_price
-                                * BLOFIN_MARKET_ORDER_FEE
-                            )
-                            position.what_if_returns -= fees_for_closing
-                            loss = (position.entry_price * sl / 100) * amount
-                            position.what_if_returns -= loss
-                            total_returns += position.what_if_returns
-                            break
-
-                        # final TP
-                        if candle.low <= position.entry_price - (
-                            position.entry_price * tp / 100
-                        ):
-                            position.closing_price = round(
-                                position.entry_price
-                                - (position.entry_price * tp / 100),
-                                1,
-                            )
-                            fees_for_closing = (
-                                amount * position.closing_price * BLOFIN_LIMIT_ORDER_FEE
-                            )
-                            position.what_if_returns -= fees_for_closing
-                            local_wins = (position.entry_price * tp / 100) * amount
-                            position.what_if_returns += local_wins
-                            total_returns += position.what_if_returns
-                            break
+                # final TP
+                if outcomes.reasons[0, 0] == EXIT_TAKE_PROFIT:
+                    position.closing_price = round(
+                        (
+                            position.entry_price + (position.entry_price * tp / 100)
+                            if position.side == "LONG"
+                            else position.entry_price
+                            - (position.entry_price * tp / 100)
+                        ),
+                        1,
+                    )
+                    fees_for_closing = (
+                        amount * position.entry_price * BLOFIN_LIMIT_ORDER_FEE
+                        if position.side == "LONG"
+                        else amount * position.closing_price * BLOFIN_LIMIT_ORDER_FEE
+                    )
+                    position.what_if_returns -= fees_for_closing
+                    local_win = (position.entry_price * tp / 100) * amount
+                    position.what_if_returns += local_win
+                    total_returns += position.what_if_returns
             hour_row["performance_lvl2"] = round(total_returns - INITIAL_CAPITAL, 2)
             performance_list.append(hour_row)
         df = pd.DataFrame(performance_list)
-        till_date_df = pd.read_csv(
-            f"data/algorithm_input-{symbol}-{till_date}-{strategy_type}.csv"
+        till_date_df = algorithm_input_dataframe(
+            symbol, strategy_type, AlgorithmInput.LevelChoices.LVL1, till_date
         )
+        if till_date_df.empty:
+            raise CommandError(
+                f"No level 1 algorithm input for {symbol} on {till_date} ({strategy_type})"
+            )
         till_date_df = pd.merge(
             till_date_df, df[["hour", "performance_lvl2"]], on="hour"
         )
@@ -289,6 +238,13 @@ class Command(BaseCommand):
             f"data/algorithm_input-{symbol}-{till_date}-{strategy_type}-lvl2.csv",
             index=False,
         )
+        store_algorithm_input(
+            symbol,
+            strategy_type,
+            AlgorithmInput.LevelChoices.LVL2,
+            till_date,
+            till_date_df,
+        )
         if USE_DISCORD:
             post_to_discord(
                 DiscordMessage(
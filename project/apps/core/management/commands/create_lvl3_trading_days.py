@@ -1,4 +1,5 @@
 from datetime import date
+import numpy as np
 import os
 import pandas as pd
 from typing import List
@@ -7,7 +8,13 @@ from django.core.management.base import BaseCommand
 from django.db.models import QuerySet
 from django.utils import timezone
 
-from project.apps.core.models import Position, OHLCV
+from project.apps.core.algorithm_input import (
+    algorithm_inputs,
+    store_algorithm_input,
+)
+from project.apps.core.first_passage import first_passage_outcomes
+from project.apps.core.models import AlgorithmInput, Position
+from project.apps.core.simulation import EXIT_STOP_LOSS, EXIT_TAKE_PROFIT
 
 
 INITIAL_CAPITAL = 100
@@ -53,10 +60,6 @@ class Command(BaseCommand):
             till_date = timezone.now().date()
 
         symbol = options["symbol"] + "USDT"
-        symbol_convertor = {
-            "BTCUSDT": "BTC/USDT:USDT",
-            "ETHUSDT": "ETH/USDT:USDT",
-        }
         strategy_type = "reversed"
         positions: QuerySet[Position] = Position.objects.exclude(
             candles_before_entry=1,
@@ -72,155 +75,94 @@ class Command(BaseCommand):
         ).distinct()
 
         performance_list: List[dict] = []
+        lvl2_inputs = algorithm_inputs(
+            symbol, strategy_type, AlgorithmInput.LevelChoices.LVL2
+        )
 
         for day in range(1, 8):
             total_returns = INITIAL_CAPITAL
             day_row: dict = {"day": day}
-            day_positions = positions.filter(
-                liquidation_datetime__week_day=day
-            ).order_by("liquidation_datetime")
+            day_positions = (
+                positions.filter(liquidation_datetime__week_day=day)
+                .select_related("first_passage_index")
+                .order_by("liquidation_datetime")
+            )
             for position in day_positions:
-                try:
-                    try:
-                        # if not found, try the file of the Monday of that week
-                        algorithm_input: pd.DataFrame = pd.read_csv(
-                            f"data/algorithm_input-{position.symbol}-{position.liquidation_datetime.date() - timezone.timedelta(days=position.liquidation_datetime.weekday())}-{position.strategy_type}-lvl2.csv"
-                        )
-                    except:
-                        # try the file of the liquidation date first
-                        algorithm_input: pd.DataFrame = pd.read_csv(
-                            f"data/algorithm_input-{position.symbol}-{position.liquidation_datetime.date()}-{position.strategy_type}-lvl2.csv"
-                        )
-                except:
-                    # if not found, skip this position
-                    continue
-                trade: bool = False
-                tp: float = 0.0
-                sl: float = 0.0
-                performance: float = 0.0
-                for row in algorithm_input.itertuples():
-                    if row.hour == position.liquidation_datetime.hour:
-                        trade, tp, sl, performance = (
-                            row.trade_lvl2,
-                            row.tp,
-                            row.sl,
-                            row.performance_lvl2,
-                        )
-
-                if not trade:
+                # the latest lvl2 input generated before the liquidation
+                algorithm_input = lvl2_inputs.get(
+                    position.liquidation_datetime,
+                    hour=position.liquidation_datetime.hour,
+                )
+                if not algorithm_input or not algorithm_input.trade_lvl2:
                     continue
+                tp: float = algorithm_input.tp
+                sl: float = algorithm_input.sl
+                performance: float = algorithm_input.performance_lvl2
 
                 position.what_if_returns = 0
                 position.start = position.start.replace(second=0, microsecond=0)
-                ohlcv_s = OHLCV.objects.filter(
-                    symbol=symbol_convertor.get(position.symbol),
-                    datetime__gte=position.start,
-                    datetime__lt=position.start + timezone.timedelta(days=28),
-                    timeframe="5m",
-                ).order_by("datetime")
-                if ohlcv_s.exists():
-                    position.entry_price = round(
+                outcomes = first_passage_outcomes(
+                    [position],
+                    take_profits=[tp],
+                    stop_losses=[sl],
+                    horizon=timezone.timedelta(days=28),
+                    take_profit_on_close=False,
+                )
+                if np.isnan(outcomes.entry_prices[0]):
+                    continue
+                position.entry_price = float(outcomes.entry_prices[0])
+                position.amount = round(
+                    (total_returns)
+                    / sl
+                    / position.entry_price
+                    * min(performance / 10, 1),
+                    4,
+                )
+                amount = position.amount
+                fees_for_opening = (
+                    position.amount * position.entry_price * BLOFIN_LIMIT_ORDER_FEE
+                )
+                position.what_if_returns -= fees_for_opening
+
+                # SL
+                if outcomes.reasons[0, 0] == EXIT_STOP_LOSS:
+                    position.closing_price = round(
                         (
-                            ohlcv_s.first().open * 1.0001
-                            if position.side == "SHORT"
-                            else ohlcv_s.first().open * 0.9999
+                            position.entry_price - (position.entry_price * sl / 100)
+                            if position.side == "LONG"
+                            else position.entry_price
+                            + (position.entry_price * sl / 100)
                         ),
                         1,
                     )
-                    position.amount = round(
-                        (total_returns)
-                        / sl
-                        / position.entry_price
-                        * min(performance / 10, 1),
-                        4,
+                    fees_for_closing = (
+                        amount * position.closing_price * BLOFIN_MARKET_ORDER_FEE
                     )
-                    amount = position.amount
-                    fees_for_opening = (
-                        position.amount * position.entry_price * BLOFIN_LIMIT_ORDER_FEE
+                    position.what_if_returns -= fees_for_closing
+                    loss = (position.entry_price * sl / 100) * amount
+                    position.what_if_returns -= loss
+                    total_returns += position.what_if_returns
+
+                # final TP
+                if outcomes.reasons[0, 0] == EXIT_TAKE_PROFIT:
+                    position.closing_price = round(
+                        (
+                            position.entry_price + (position.entry_price * tp / 100)
+                            if position.side == "LONG"
+                            else position.entry_price
+                            - (position.entry_price * tp / 100)
+                        ),
+                        1,
                     )
-                    position.what_if_returns -= fees_for_opening
-
-                for candle in ohlcv_s:
-
-                    if position.side == "LONG":
-
-                        # SL
-                        if candle.low <= position.entry_price - (
-                            position.entry_price * sl / 100
-                        ):
-                            position.closing_price = round(
-                                position.entry_price
-                                - (position.entry_price * sl / 100),
-                                1,
-                            )
-                            fees_for_closing = (
-                                amount
-                                * position.closing_price
-                                * BLOFIN_MARKET_ORDER_FEE
-                            )
-                            position.what_if_returns -= fees_for_closing
-                            loss = (position.entry_price * sl / 100) * amount
-                            position.what_if_returns -= loss
-                            total_returns += position.what_if_returns
-                            break
-
-                        # final TP
-                        if candle.high >= position.entry_price + (
-                            position.entry_price * tp / 100
-                        ):
-                            position.closing_price = round(
-                                position.entry_price
-                                + (position.entry_price * tp / 100),
-                                1,
-                            )
-                            fees_for_closing = (
-                                amount * position.entry_price * BLOFIN_LIMIT_ORDER_FEE
-                            )
-                            position.what_if_returns -= fees_for_closing
-                            local_win = (position.entry_price * tp / 100) * amount
-                            position.what_if_returns += local_win
-                            total_returns += position.what_if_returns
-                            break
-
-                    if position.side == "SHORT":
-
-                        # SL
-                        if candle.high >= position.entry_price + (
-                            position.entry_price * sl / 100
-                        ):
-                            position.closing_price = round(
-                                position.entry_price
-                                + (position.entry_price * sl / 100),
-                                1,
-                            )
-                            fees_for_closing = (
-                                amount
-                                * position.closing_price
-                                * BLOFIN_MARKET_ORDER_FEE
-                            )
-                            position.what_if_returns -= fees_for_closing
-                            loss = (position.entry_price * sl / 100) * amount
-                            position.what_if_returns -= loss
-                            total_returns += position.what_if_returns
-                            break
-
-                        # final TP
-                        if candle.low <= position.entry_price - (
-                            position.entry_price * tp / 100
-                        ):
-                            position.closing_price = round(
-                                position.entry_price
-                                - (position.entry_price * tp / 100),
-                                1,
-                            )
-                            fees_for_closing = (
-                                amount * position.closing_price * BLOFIN_LIMIT_ORDER_FEE
-                            )
-                            position.what_if_returns -= fees_for_closing
-                            local_wins = (position.entry_price * tp / 100) * amount
-                            position.what_if_returns += local_wins
-                            total_returns += position.what_if_returns
-                            break
+                    fees_for_closing = (
+                        amount * position.entry_price * BLOFIN_LIMIT_ORDER_FEE
+                        if position.side == "LONG"
+                        else amount * position.closing_price * BLOFIN_LIMIT_ORDER_FEE
+                    )
+                    position.what_if_returns -= fees_for_closing
+                    local_win = (position.entry_price * tp / 100) * amount
+                    position.what_if_returns += local_win
+                    total_returns += position.what_if_returns
             day_row["performance_lvl3"] = round(total_returns - INITIAL_CAPITAL, 2)
             performance_list.append(day_row)
         df = pd.DataFrame(performance_list)
@@ -234,3 +176,6 @@ class Command(BaseCommand):
             f"data/algorithm_days-{symbol}-{till_date}-{strategy_type}-lvl3.csv",
             index=False,
         )
+        store_algorithm_input(
+            symbol, strategy_type, AlgorithmInput.LevelChoices.LVL3, till_date, df
+        )
@@ -1,31 +1,22 @@
 from datetime import datetime, timedelta
 
+import numpy as np
+
 from django.core.management.base import BaseCommand
 from django.db import models
 
-from project.apps.core.models import Position, OHLCV, Liquidation
-
-
-def calculate_rsi(candles: list[OHLCV], period: int = 14) -> float:
-    """Calculates the RSI for the given candles."""
-
-    if not len(candles) > period:
-        print("something went wrong")
-        return 50
-
-    gains = 0.0
-    losses = 0.0
-    for i in range(1, period + 1):
-        change = candles[-i].close - candles[-i - 1].close
-        if change > 0:
-            gains += change
-        else:
-            losses -= change
-    if losses == 0:
-        return 100.0
-    rs = gains / losses
-    rsi = 100.0 - (100.0 / (1.0 + rs))
-    return round(rsi, 2)
+from project.apps.core.candles import load_candles
+from project.apps.core.first_passage import (
+    build_first_passage_indexes,
+    positions_to_index,
+)
+from project.apps.core.indicators import (
+    get_indicators,
+    liquidation_indicators,
+    update_indicators,
+)
+from project.apps.core.models import DataVersion, Position, OHLCV, Liquidation
+from project.apps.core.result_cache import bump_data_version
 
 
 class Command(BaseCommand):
@@ -82,6 +73,57 @@ class Command(BaseCommand):
             .order_by("datetime")
         )
 
+        liquidations = list(liquidations)
+        positions = []
+        if liquidations:
+            positions = self.find_positions(
+                liquidations, symbol_convertor.get("BTCUSD"), options
+            )
+        Position.objects.bulk_create(positions)
+        if positions:
+            bump_data_version(DataVersion.SourceChoices.POSITIONS)
+        for position in positions:
+            print(True, position)
+
+        built = build_first_passage_indexes(
+            positions_to_index(Position.objects.filter(symbol=options["symbol"] + "T"))
+        )
+        print(f"Built {built} first passage indexes")
+
+    def find_positions(
+        self, liquidations: list[dict], symbol: str, options: dict
+    ) -> list[Position]:
+        """Finds the positions of the liquidations on candles loaded in one go."""
+
+        first_datetime = liquidations[0]["datetime"]
+        last_datetime = liquidations[-1]["datetime"]
+        candles = load_candles(
+            symbol,
+            "5m",
+            first_datetime - timedelta(minutes=5 * 14),
+            last_datetime + timedelta(days=7, minutes=15),
+        )
+        liquidation_candle_ids = dict(
+            OHLCV.objects.filter(
+                symbol=symbol,
+                timeframe="5m",
+                datetime__gte=first_datetime,
+                datetime__lte=last_datetime,
+            ).values_list("datetime", "id")
+        )
+        update_indicators(symbol, "5m")
+        indicators = get_indicators(symbol, "5m", first_datetime, last_datetime)
+        existing_positions = set(
+            Position.objects.filter(
+                symbol=options["symbol"] + "T",
+                strategy_type="reversed",
+                timeframe="5m",
+                liquidation_datetime__gte=first_datetime,
+                liquidation_datetime__lte=last_datetime,
+            ).values_list("liquidation_datetime", "side", "start")
+        )
+
+        positions = []
         for liquidation in liquidations:
 
             # liquidation amount threshold
@@ -89,52 +131,26 @@ class Command(BaseCommand):
                 continue
 
             # liquidation candle
-            liquidation_candles = OHLCV.objects.filter(
-                datetime=liquidation["datetime"],
-                timeframe="5m",
-                symbol=symbol_convertor.get("BTCUSD"),
-            )
-            if not liquidation_candles.first():
+            liquidation_index = candles.index(liquidation["datetime"])
+            if (
+                liquidation["datetime"] not in liquidation_candle_ids
+                or liquidation_index == len(candles)
+                or candles[liquidation_index].datetime != liquidation["datetime"]
+            ):
                 continue
-            liquidation_candle = liquidation_candles.first()
-
-            # RSI calculation
-            rsi_candles = OHLCV.objects.filter(
-                datetime__gte=liquidation["datetime"] - timedelta(minutes=5 * 14),
-                datetime__lte=liquidation["datetime"],
-                timeframe="5m",
-                symbol=symbol_convertor.get("BTCUSD"),
-            ).order_by("datetime")
-            rsi_candles = list(rsi_candles)
-            liquidation_rsi = calculate_rsi(rsi_candles)
+            liquidation_candle = candles[liquidation_index]
 
-            # ATR calculation
-            atr_values = []
-            for i in range(1, len(rsi_candles)):
-                current_candle = rsi_candles[i]
-                previous_candle = rsi_candles[i - 1]
-                tr = max(
-                    current_candle.high - current_candle.low,
-                    abs(current_candle.high - previous_candle.close),
-                    abs(current_candle.low - previous_candle.close),
-                )
-                atr_values.append(tr)
-            atr = (
-                sum(atr_values) / len(atr_values) / rsi_candles[-1].close * 100
-                if atr_values
-                else 0
+            liquidation_rsi, atr = liquidation_indicators(
+                indicators, liquidation_candle
             )
 
             # candles around liquidation
-            volume_candles_around_liquidation = OHLCV.objects.filter(
-                symbol=symbol_convertor.get("BTCUSD"),
-                datetime__gte=liquidation["datetime"] - timedelta(minutes=5),
-                datetime__lte=liquidation["datetime"] + timedelta(minutes=10),
-                timeframe="5m",
-            ).order_by("datetime")
-            if not volume_candles_around_liquidation.first():
-                continue
-            volume_candles_around_liquidation = list(volume_candles_around_liquidation)
+            volume_candles_around_liquidation = list(
+                candles.window(
+                    liquidation["datetime"] - timedelta(minutes=5),
+                    liquidation["datetime"] + timedelta(minutes=15),
+                )
+            )
 
             # first candle after liquidation
             first_candles_after_liquidation = volume_candles_around_liquidation[2:]
@@ -159,98 +175,50 @@ class Command(BaseCommand):
             if not confirmation_candles:
                 continue
 
-            candles_after_liquidation = OHLCV.objects.filter(
-                symbol=symbol_convertor.get("BTCUSD"),
-                datetime__gt=confirmation_candle.datetime,
-                datetime__lte=confirmation_candle.datetime + timedelta(days=7),
-                timeframe="5m",
-            ).order_by("datetime")
-            for candles_before_entry, candle in enumerate(
-                candles_after_liquidation, start=1
-            ):
-                if candle.close > confirmation_candle.close * (
-                    1 + (options["confirmation_distance"]) / 100
-                ):
-                    # if liquidation["side"] == "LONG" and confirmation_candles == 1:
-                    #     position, created = Position.objects.get_or_create(
-                    #         liquidation_datetime=liquidation["datetime"],
-                    #         start=candle.datetime + timedelta(minutes=5),
-                    #         side=Position._PostionSideChoices.LONG,
-                    #         amount=0.0001,
-                    #         symbol=options["symbol"] + "T",
-                    #         strategy_type="live",
-                    #         confirmation_candles=confirmation_candles,
-                    #         candles_before_entry=candles_before_entry,
-                    #         liquidation_amount=liquidation["total_amount"],
-                    #         nr_of_liquidations=liquidation["total_nr_of_liquidations"],
-                    #         timeframe="5m",
-                    #         liquidation_candle=liquidation_candle,
-                    #         liquidation_rsi=liquidation_rsi,
-                    #         liquidation_atr=atr,
-                    #     )
-                    #     print(created, position)
-                    #     break
-
-                    if liquidation["side"] == "SHORT":
-                        position, created = Position.objects.get_or_create(
-                            liquidation_datetime=liquidation["datetime"],
-                            start=candle.datetime + timedelta(minutes=5),
-                            side=Position._PostionSideChoices.LONG,
-                            amount=0.0001,
-                            symbol=options["symbol"] + "T",
-                            strategy_type="reversed",
-                            confirmation_candles=confirmation_candles,
-                            candles_before_entry=candles_before_entry,
-                            liquidation_amount=liquidation["total_amount"],
-                            nr_of_liquidations=liquidation["total_nr_of_liquidations"],
-                            timeframe="5m",
-                            liquidation_candle=liquidation_candle,
-                            liquidation_rsi=liquidation_rsi,
-                            liquidation_atr=atr,
-                        )
-                        print(created, position)
-                        break
-                    break
-                if candle.close < confirmation_candle.close * (
-                    1 - (options["confirmation_distance"]) / 100
-                ):
-                    # if liquidation["side"] == "SHORT" and confirmation_candles == 1:
-                    #     position, created = Position.objects.get_or_create(
-                    #         liquidation_datetime=liquidation["datetime"],
-                    #         start=candle.datetime + timedelta(minutes=5),
-                    #         side=Position._PostionSideChoices.SHORT,
-                    #         amount=0.0001,
-                    #         symbol=options["symbol"] + "T",
-                    #         strategy_type="live",
-                    #         confirmation_candles=confirmation_candles,
-                    #         candles_before_entry=candles_before_entry,
-                    #         liquidation_amount=liquidation["total_amount"],
-                    #         nr_of_liquidations=liquidation["total_nr_of_liquidations"],
-                    #         timeframe="5m",
-                    #         liquidation_candle=liquidation_candle,
-                    #         liquidation_rsi=liquidation_rsi,
-                    #         liquidation_atr=atr,
-                    #     )
-                    #     print(created, position)
-                    #     break
-
-                    if liquidation["side"] == "LONG":
-                        position, created = Position.objects.get_or_create(
-                            liquidation_datetime=liquidation["datetime"],
-                            start=candle.datetime + timedelta(minutes=5),
-                            side=Position._PostionSideChoices.SHORT,
-                            amount=0.0001,
-                            symbol=options["symbol"] + "T",
-                            strategy_type="reversed",
-                            confirmation_candles=confirmation_candles,
-                            candles_before_entry=candles_before_entry,
-                            liquidation_amount=liquidation["total_amount"],
-                            nr_of_liquidations=liquidation["total_nr_of_liquidations"],
-                            timeframe="5m",
-                            liquidation_candle=liquidation_candle,
-                            liquidation_rsi=liquidation_rsi,
-                            liquidation_atr=atr,
-                        )
-                        print(created, position)
-                        break
-                    break
+            # first candle that closes the confirmation distance away
+            candles_after_liquidation = candles.window(
+                confirmation_candle.datetime + timedelta(minutes=5),
+                confirmation_candle.datetime + timedelta(days=7, minutes=5),
+            )
+            above = candles_after_liquidation.close > confirmation_candle.close * (
+                1 + (options["confirmation_distance"]) / 100
+            )
+            below = candles_after_liquidation.close < confirmation_candle.close * (
+                1 - (options["confirmation_distance"]) / 100
+            )
+            moved = np.flatnonzero(above | below)
+            if not moved.size:
+                continue
+            entry_index = int(moved[0])
+            if above[entry_index] and liquidation["side"] == "SHORT":
+                side = Position._PostionSideChoices.LONG
+            elif below[entry_index] and liquidation["side"] == "LONG":
+                side = Position._PostionSideChoices.SHORT
+            else:
+                continue
+            start = candles_after_liquidation[entry_index].datetime + timedelta(
+                minutes=5
+            )
+            if (liquidation["datetime"], side, start) in existing_positions:
+                continue
+            positions.append(
+                Position(
+                    liquidation_datetime=liquidation["datetime"],
+                    start=start,
+                    side=side,
+                    amount=0.0001,
+                    symbol=options["symbol"] + "T",
+                    strategy_type="reversed",
+                    confirmation_candles=confirmation_candles,
+                    candles_before_entry=entry_index + 1,
+                    liquidation_amount=liquidation["total_amount"],
+                    nr_of_liquidations=liquidation["total_nr_of_liquidations"],
+                    timeframe="5m",
+                    liquidation_candle_id=liquidation_candle_ids[
+                        liquidation["datetime"]
+                    ],
+                    liquidation_rsi=liquidation_rsi,
+                    liquidation_atr=atr,
+                )
+            )
+        return positions
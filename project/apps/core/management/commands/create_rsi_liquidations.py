@@ -1,32 +1,15 @@
 from datetime import datetime, timedelta
 
-from django.core.management.base import BaseCommand
-from django.db import models
-from django.db.models import QuerySet
-
-from project.apps.core.models import Position, OHLCV, RSILiquidation
+import numpy as np
 
+from django.core.management.base import BaseCommand
 
-def calculate_rsi(candles: list[OHLCV], period: int = 14) -> float:
-    """Calculates the RSI for the given candles."""
+from project.apps.core.candles import load_candles
+from project.apps.core.indicators import simple_rsi
+from project.apps.core.models import RSILiquidation
 
-    if not len(candles) > period:
-        print("something went wrong")
-        return 50
 
-    gains = 0.0
-    losses = 0.0
-    for i in range(1, period + 1):
-        change = candles[-i].close - candles[-i - 1].close
-        if change > 0:
-            gains += change
-        else:
-            losses -= change
-    if losses == 0:
-        return 100.0
-    rs = gains / losses
-    rsi = 100.0 - (100.0 / (1.0 + rs))
-    return round(rsi, 2)
+RSI_PERIOD = 14
 
 
 class Command(BaseCommand):
@@ -48,35 +31,51 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         now = datetime.now().replace(second=0, microsecond=0)
-        for minutes_back in range(
-            options["from_days_ago"] * 24 * 60, options["to_days_ago"] * 24 * 60 - 1, -1
-        ):
-            local_datetime = now - timedelta(days=1) - timedelta(minutes=minutes_back)
-            rsi_candles = OHLCV.objects.filter(
-                datetime__gte=local_datetime - timedelta(minutes=15),
-                datetime__lte=local_datetime + timedelta(minutes=1),
-                timeframe="1m",
-                symbol="BTC/USDT:USDT",
-            ).order_by("datetime")
-            rsi_candles = list(rsi_candles)
-            rsi = calculate_rsi(rsi_candles[:-1])
-            if rsi <= 30 and rsi_candles[-1].close > rsi_candles[-2].high:
-                print(
-                    RSILiquidation.objects.update_or_create(
-                        symbol="BTC/USDT:USDT",
-                        datetime=local_datetime,
-                        side="LONG",
-                        rsi=rsi,
-                        timeframe="1m",
-                    )
-                )
-            elif rsi >= 70 and rsi_candles[-1].close < rsi_candles[-2].low:
-                print(
-                    RSILiquidation.objects.update_or_create(
-                        symbol="BTC/USDT:USDT",
-                        datetime=local_datetime,
-                        side="SHORT",
-                        rsi=rsi,
-                        timeframe="1m",
-                    )
+        first_datetime = (
+            now - timedelta(days=1) - timedelta(days=options["from_days_ago"])
+        )
+        last_datetime = now - timedelta(days=1) - timedelta(days=options["to_days_ago"])
+
+        # the RSI of a minute uses the 15 candles before it, the signal the next one
+        candles = load_candles(
+            "BTC/USDT:USDT",
+            "1m",
+            first_datetime - timedelta(minutes=RSI_PERIOD + 1),
+            last_datetime + timedelta(minutes=2),
+        )
+        rsi = simple_rsi(candles.close, period=RSI_PERIOD)
+        minutes = np.arange(RSI_PERIOD + 1, len(candles) - 1)
+        complete = (
+            candles.timestamps[minutes + 1]
+            - candles.timestamps[minutes - RSI_PERIOD - 1]
+            == (RSI_PERIOD + 2) * 60
+        )
+        closes_above = candles.close[minutes + 1] > candles.high[minutes]
+        closes_below = candles.close[minutes + 1] < candles.low[minutes]
+        candidates = minutes[complete & (closes_above | closes_below)]
+
+        rsi_liquidations = []
+        for minute in candidates:
+            minute_rsi = round(float(rsi[minute]), 2)
+            if minute_rsi <= 30 and closes_above[minute - RSI_PERIOD - 1]:
+                side = "LONG"
+            elif minute_rsi >= 70 and closes_below[minute - RSI_PERIOD - 1]:
+                side = "SHORT"
+            else:
+                continue
+            rsi_liquidations.append(
+                RSILiquidation(
+                    symbol="BTC/USDT:USDT",
+                    datetime=candles[minute].datetime,
+                    side=side,
+                    rsi=minute_rsi,
+                    timeframe="1m",
                 )
+            )
+        RSILiquidation.objects.bulk_create(
+            rsi_liquidations,
+            update_conflicts=True,
+            unique_fields=["symbol", "datetime", "side", "timeframe"],
+            update_fields=["rsi"],
+        )
+        print(f"Stored {len(rsi_liquidations)} RSI liquidations")
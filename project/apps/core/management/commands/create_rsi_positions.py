@@ -4,7 +4,8 @@ from django.core.management.base import BaseCommand
 from django.db import models
 from django.db.models import QuerySet
 
-from project.apps.core.models import Position, OHLCV, RSILiquidation
+from project.apps.core.models import DataVersion, Position, OHLCV, RSILiquidation
+from project.apps.core.result_cache import bump_data_version
 
 
 class Command(BaseCommand):
@@ -63,6 +64,7 @@ class Command(BaseCommand):
                 max_rsi = max(rsi_liquidations_5m[key]["max_rsi"], liquidation["rsi"])
                 rsi_liquidations_5m[key]["max_rsi"] = max_rsi
 
+        created_any = False
         # loop over rsi_liquidations_5m and create positions based on the number of candles with rsi <= 30 or rsi >= 70
         for liquidation in rsi_liquidations_5m.values():
 
@@ -145,6 +147,7 @@ class Command(BaseCommand):
                         position.entry_price = round(candle.close * 0.9999, 1)
                         position.save()
                         print(created, position)
+                        created_any |= created
                         break
                     break
                 if candle.close < confirmation_candle.close * 0.996:
@@ -165,5 +168,10 @@ class Command(BaseCommand):
                         position.entry_price = round(candle.close * 1.0001, 1)
                         position.save()
                         print(created, position)
+                        created_any |= created
                         break
                     break
+
+        # the existing positions are unchanged, their cached results still hold
+        if created_any:
+            bump_data_version(DataVersion.SourceChoices.POSITIONS)
@@ -1,10 +1,12 @@
 from datetime import datetime, timedelta
 from decouple import config
 import requests
+from typing import Optional
 
 from django.core.management.base import BaseCommand
 
-from project.apps.core.models import Liquidation
+from project.apps.core.models import DataVersion, IngestionWatermark, Liquidation
+from project.apps.core.result_cache import bump_data_version
 
 
 COINALYZE_SECRET_API_KEY = config("COINALYZE_SECRET_API_KEY")
@@ -42,19 +44,39 @@ class Command(BaseCommand):
             default="BTCUSD",
             help="Symbol for the data",
         )
+        parser.add_argument(
+            "--sync",
+            action="store_true",
+            help="Fetch from the last synced interval up to now instead of the day range",
+        )
 
     def get_params(self, **options) -> dict:
         """Returns the parameters for the request to the API"""
         now = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        start = now - timedelta(days=options["from_days_ago"])
+        end = now - timedelta(days=options["to_days_ago"])
+        if options["sync"]:
+            # the last synced interval is fetched again, it may not have
+            # been complete yet
+            watermark = self.get_watermark(**options)
+            if watermark:
+                start = watermark.synced_until
+            end = datetime.now()
         return {
             "symbols": self.get_symbols(**options),
-            "from": int(
-                datetime.timestamp(now - timedelta(days=options["from_days_ago"]))
-            ),
-            "to": int(datetime.timestamp(now - timedelta(days=options["to_days_ago"]))),
+            "from": int(datetime.timestamp(start)),
+            "to": int(datetime.timestamp(end)),
             "interval": options["interval"],
         }
 
+    def get_watermark(self, **options) -> Optional[IngestionWatermark]:
+        """Returns the watermark of the symbol and interval, if synced before"""
+        return IngestionWatermark.objects.filter(
+            source=IngestionWatermark.SourceChoices.LIQUIDATIONS,
+            symbol=options["symbol"],
+            timeframe=options["interval"],
+        ).first()
+
     def get_symbols(self, **options) -> list:
         """Returns the list of symbols to request data for"""
         symbols = []
@@ -68,12 +90,14 @@ class Command(BaseCommand):
         return ",".join(symbols)
 
     def handle(self, *args, **options):
+        synced_until = None
         for liquidation in requests.get(
             url=COINALYZE_LIQUIDATION_URL,
             headers={"api_key": COINALYZE_SECRET_API_KEY},
             params=self.get_params(**options),
         ).json():
             for history in liquidation.get("history"):
+                synced_until = max(synced_until or 0, history["t"])
                 if long := history.get("l"):
                     if long > 100:
                         print(
@@ -81,8 +105,8 @@ class Command(BaseCommand):
                                 symbol=liquidation["symbol"],
                                 datetime=datetime.fromtimestamp(history["t"]),
                                 side="LONG",
-                                amount=long,
                                 timeframe=options["interval"],
+                                defaults={"amount": long},
                             )
                         )
                 if short := history.get("s"):
@@ -92,7 +116,17 @@ class Command(BaseCommand):
                                 symbol=liquidation["symbol"],
                                 datetime=datetime.fromtimestamp(history["t"]),
                                 side="SHORT",
-                                amount=short,
                                 timeframe=options["interval"],
+                                defaults={"amount": short},
                             )
                         )
+
+        if synced_until:
+            bump_data_version(DataVersion.SourceChoices.LIQUIDATIONS)
+        if options["sync"] and synced_until:
+            IngestionWatermark.objects.update_or_create(
+                source=IngestionWatermark.SourceChoices.LIQUIDATIONS,
+                symbol=options["symbol"],
+                timeframe=options["interval"],
+                defaults={"synced_until": datetime.fromtimestamp(synced_until)},
+            )
@@ -1,36 +1,236 @@
-from asyncio import run
+import asyncio
+from collections import defaultdict
 from django.utils import timezone
-from typing import List
+from typing import Iterable, List, NamedTuple
+from asgiref.sync import sync_to_async
 from django.core.management.base import BaseCommand
+from django.db.models import Max
 
-from project.apps.core.models import OHLCV
+import numpy as np
+
+from project.apps.core.candles import (
+    Candles,
+    candle_store,
+    from_timestamp,
+    resample_ohlcv,
+    timeframe_seconds,
+    to_timestamp,
+    upsert_ohlcv,
+)
+from project.apps.core.indicators import update_indicators
+from project.apps.core.models import OHLCV, DataVersion, IngestionWatermark
+from project.apps.core.result_cache import bump_data_version
 
 import ccxt.pro as ccxt
 
 
 EXCHANGE = ccxt.binance()
 
+CONCURRENCY = 4
+RETRIES = 3
+RETRY_DELAY = 1  # seconds, doubled after every failed attempt
+
+
+class Chunk(NamedTuple):
+    """One fetch_ohlcv request: limit candles from since (ms) on."""
+
+    symbol: str
+    timeframe: str
+    since: int
+    limit: int
+
+
+def chunk_limit(timeframe: str) -> int:
+    """Returns the number of candles fetched per request, one day for 5m."""
+
+    return int(24 * 60 / 5) if timeframe == "5m" else (24 * 60)
+
+
+def day_since(days: int) -> int:
+    """Returns the timestamp in ms of midnight the given number of days ago."""
+
+    return int(
+        (timezone.now() - timezone.timedelta(days=days))
+        .replace(hour=0, minute=0, second=0, microsecond=0)
+        .timestamp()
+        * 1000
+    )
+
+
+def day_chunks(
+    symbols: Iterable[str],
+    timeframes: Iterable[str],
+    from_days_ago: int,
+    to_days_ago: int,
+) -> List[Chunk]:
+    """Returns one chunk per day for every symbol and timeframe."""
+
+    return [
+        Chunk(symbol, timeframe, day_since(days), chunk_limit(timeframe))
+        for symbol in symbols
+        for timeframe in timeframes
+        for days in range(from_days_ago, to_days_ago, -1)
+    ]
+
+
+def sync_chunks(symbol: str, timeframe: str, from_days_ago: int) -> List[Chunk]:
+    """Returns the chunks with the candles missing since from_days_ago: the
+    gaps in the OHLCV table up to the watermark and everything after it.
+
+    The candle at the watermark is fetched again, it may not have been
+    closed when it was stored.
+    """
+
+    step = timeframe_seconds(timeframe)
+    now = timezone.now()
+    start = (now - timezone.timedelta(days=from_days_ago)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    ohlcv_s = OHLCV.objects.filter(symbol=symbol, timeframe=timeframe)
+    watermark = IngestionWatermark.objects.filter(
+        source=IngestionWatermark.SourceChoices.OHLCV,
+        symbol=symbol,
+        timeframe=timeframe,
+    ).first()
+    synced_until = (
+        watermark.synced_until
+        if watermark
+        else ohlcv_s.aggregate(Max("datetime"))["datetime__max"]
+    )
+    synced_until = max(synced_until, start) if synced_until else start
+    candles = Candles.from_queryset(
+        ohlcv_s.filter(datetime__gte=start, datetime__lt=synced_until)
+    )
+
+    chunks = []
+    limit = chunk_limit(timeframe)
+    for gap_start, gap_end in candles.gaps(start, synced_until, timeframe) + [
+        (synced_until, now)
+    ]:
+        count = -(-int((gap_end - gap_start).total_seconds()) // step)
+        for offset in range(0, count, limit):
+            since = gap_start + timezone.timedelta(seconds=offset * step)
+            chunks.append(
+                Chunk(
+                    symbol,
+                    timeframe,
+                    int(since.timestamp() * 1000),
+                    min(limit, count - offset),
+                )
+            )
+    return chunks
+
+
+async def fetch_chunk(
+    exchange,
+    semaphore: asyncio.Semaphore,
+    chunk: Chunk,
+    retries: int = RETRIES,
+) -> List[list]:
+    """Fetches the candles of one chunk, retrying network and rate limit
+    errors with exponential backoff."""
+
+    # never retry faster than the exchange allows requests
+    delay = max(RETRY_DELAY, getattr(exchange, "rateLimit", 0) / 1000)
+    for attempt in range(retries + 1):
+        try:
+            async with semaphore:
+                return await exchange.fetch_ohlcv(
+                    symbol=chunk.symbol,
+                    timeframe=chunk.timeframe,
+                    since=chunk.since,
+                    limit=chunk.limit,
+                )
+        except ccxt.NetworkError as e:
+            if attempt == retries:
+                raise
+            print(f"Retrying {chunk} in {delay}s: {e}")
+            await asyncio.sleep(delay)
+            delay *= 2
+
+
+async def write_candles(queue: asyncio.Queue) -> dict[tuple[str, str], List[Candles]]:
+    """Upserts fetched days into the OHLCV table as they arrive until a None
+    is queued, and returns the written candles per symbol and timeframe."""
+
+    written = defaultdict(list)
+    while (item := await queue.get()) is not None:
+        symbol, timeframe, rows = item
+        candles = Candles.from_rows(
+            (timezone.datetime.fromtimestamp(row[0] / 1000), *row[1:6]) for row in rows
+        )
+        inserted, updated = await sync_to_async(upsert_ohlcv)(
+            symbol, timeframe, candles
+        )
+        print(f"Inserted {inserted} and updated {updated} {symbol} {timeframe} candles")
+        written[(symbol, timeframe)].append(candles)
+    return written
+
 
 async def get_closing_data(
-    symbol: str, timeframe: str, from_days_ago: int = 10, to_days_ago: int = 0
-) -> List[dict]:
-    """Asynchronously fetches closing data for a given position."""
+    exchange,
+    chunks: List[Chunk],
+    concurrency: int = CONCURRENCY,
+    retries: int = RETRIES,
+) -> tuple[dict[tuple[str, str], Candles], List[Chunk]]:
+    """Fetches the chunks concurrently and streams them into the OHLCV table.
+
+    Chunks that still fail after the retries are reported and skipped.
+    Returns the written candles per symbol and timeframe and the failed
+    chunks.
+    """
+
+    semaphore = asyncio.Semaphore(concurrency)
+    queue = asyncio.Queue()
+    writer = asyncio.create_task(write_candles(queue))
+
+    async def fetch(chunk: Chunk) -> None:
+        rows = await fetch_chunk(exchange, semaphore, chunk, retries)
+        await queue.put((chunk.symbol, chunk.timeframe, rows))
+
+    try:
+        results = await asyncio.gather(
+            *(fetch(chunk) for chunk in chunks), return_exceptions=True
+        )
+    finally:
+        await queue.put(None)
+        written = await writer
+        await exchange.close()
+    failed = []
+    for chunk, result in zip(chunks, results):
+        if isinstance(result, Exception):
+            print(f"Failed to fetch {chunk}: {result}")
+            failed.append(chunk)
+    return {
+        key: Candles(np.concatenate([candles.data for candles in parts], axis=1))
+        for key, parts in written.items()
+    }, failed
 
-    candles = []
-    for days in range(from_days_ago, to_days_ago, -1):
-        candles = candles + await EXCHANGE.fetch_ohlcv(
+
+def update_watermarks(
+    written: dict[tuple[str, str], Candles], failed: List[Chunk]
+) -> None:
+    """Moves the watermarks to the last written candle, or back to the first
+    failed chunk so it is fetched again on the next sync."""
+
+    for (symbol, timeframe), candles in written.items():
+        if not candles.exists():
+            continue
+        synced_until = candles.timestamps.max()
+        for chunk in failed:
+            if (chunk.symbol, chunk.timeframe) == (symbol, timeframe):
+                # since is in ms since the unix epoch, the candle timestamps
+                # count from the naive epoch in local time
+                since = to_timestamp(
+                    timezone.datetime.fromtimestamp(chunk.since / 1000)
+                )
+                synced_until = min(synced_until, since)
+        IngestionWatermark.objects.update_or_create(
+            source=IngestionWatermark.SourceChoices.OHLCV,
             symbol=symbol,
             timeframe=timeframe,
-            since=int(
-                (timezone.now() - timezone.timedelta(days=days))
-                .replace(hour=0, minute=0, second=0, microsecond=0)
-                .timestamp()
-                * 1000
-            ),
-            limit=int(24 * 60 / 5) if timeframe == "5m" else (24 * 60),
+            defaults={"synced_until": from_timestamp(synced_until)},
         )
-    await EXCHANGE.close()
-    return candles
 
 
 class Command(BaseCommand):
@@ -52,53 +252,93 @@ class Command(BaseCommand):
         parser.add_argument(
             "--timeframe",
             type=str,
-            default="5m",
-            help="Timeframe for the OHLCV data",
+            nargs="+",
+            default=["5m"],
+            help="Timeframes for the OHLCV data",
         )
         parser.add_argument(
             "--symbol",
             type=str,
-            default="BTC/USDT:USDT",
-            help="Trading pair symbol",
+            nargs="+",
+            default=["BTC/USDT:USDT"],
+            help="Trading pair symbols",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=CONCURRENCY,
+            help="Maximum number of requests to the exchange at the same time",
+        )
+        parser.add_argument(
+            "--retries",
+            type=int,
+            default=RETRIES,
+            help="Number of retries for a request that fails with a network error",
+        )
+        parser.add_argument(
+            "--sync",
+            action="store_true",
+            help="Only fetch the candles missing since --from-days-ago and the watermark",
+        )
+        parser.add_argument(
+            "--resample",
+            type=str,
+            nargs="+",
+            default=[],
+            help="Timeframes to derive from the fetched 1m candles",
         )
 
     def handle(self, *args, **options):
         print(options)
-        candles = run(
-            get_closing_data(
+        if options["sync"]:
+            chunks = [
+                chunk
+                for symbol in options["symbol"]
+                for timeframe in options["timeframe"]
+                for chunk in sync_chunks(symbol, timeframe, options["from_days_ago"])
+            ]
+        else:
+            chunks = day_chunks(
                 options["symbol"],
                 options["timeframe"],
                 options["from_days_ago"],
                 options["to_days_ago"],
             )
-        )
-        for candle in candles:
-            candle_defaults = {
-                "symbol": options["symbol"],
-                "timeframe": options["timeframe"],
-                "datetime": timezone.datetime.fromtimestamp(candle[0] / 1000),
-            }
-            try:
-                ohlcv, created = OHLCV.objects.update_or_create(
-                    defaults=candle_defaults,
-                    open=candle[1],
-                    high=candle[2],
-                    low=candle[3],
-                    close=candle[4],
-                    volume=candle[5],
+        print(f"Fetching {len(chunks)} chunks")
+        # every candle store file is written once, not for every fetched chunk
+        with candle_store.deferred():
+            written, failed = asyncio.run(
+                get_closing_data(
+                    EXCHANGE,
+                    chunks,
+                    concurrency=options["concurrency"],
+                    retries=options["retries"],
+                )
+            )
+        if options["sync"]:
+            update_watermarks(written, failed)
+
+        # derive the higher timeframes from the fetched minutes
+        updated_timeframes = set(written)
+        for (symbol, timeframe), candles in written.items():
+            if timeframe != "1m" or not candles.exists():
+                continue
+            for resample_timeframe in options["resample"]:
+                inserted, updated = resample_ohlcv(
+                    symbol,
+                    resample_timeframe,
+                    from_timestamp(candles.timestamps.min()),
+                    from_timestamp(candles.timestamps.max())
+                    + timezone.timedelta(minutes=1),
+                )
+                print(
+                    f"Inserted {inserted} and updated {updated} "
+                    f"{symbol} {resample_timeframe} candles"
                 )
-                print(ohlcv, created)
-            except Exception as e:
-                ohlcv_s = OHLCV.objects.filter(**candle_defaults)
-                if not ohlcv_s.exists():
-                    print(f"Failed to create OHLCV: {e}")
-                    continue
-                ohlcv = ohlcv_s.first()
-                ohlcv.open = candle[1]
-                ohlcv.high = candle[2]
-                ohlcv.low = candle[3]
-                ohlcv.close = candle[4]
-                ohlcv.volume = candle[5]
-                ohlcv.save()
-                print(f"Updated: {ohlcv} due to {e}")
-        run(EXCHANGE.close())
+                updated_timeframes.add((symbol, resample_timeframe))
+
+        for symbol, timeframe in sorted(updated_timeframes):
+            count = update_indicators(symbol, timeframe)
+            print(f"Updated {count} {symbol} {timeframe} indicators")
+        if written:
+            bump_data_version(DataVersion.SourceChoices.OHLCV)
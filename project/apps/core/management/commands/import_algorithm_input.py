@@ -0,0 +1,52 @@
+import os
+import re
+from datetime import date
+
+import pandas as pd
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from project.apps.core.algorithm_input import store_algorithm_input
+from project.apps.core.models import AlgorithmInput
+
+
+# algorithm_input-BTCUSDT-2025-01-06-reversed.csv (lvl1),
+# algorithm_input-BTCUSDT-2025-01-06-reversed-lvl2.csv and
+# algorithm_days-BTCUSDT-2025-01-06-reversed-lvl3.csv
+FILE_NAME = re.compile(
+    r"^algorithm_(?:input|days)-(?P<symbol>[A-Z]+)-(?P<date>\d{4}-\d{2}-\d{2})"
+    r"-(?P<strategy_type>[a-z_]+?)(?:-(?P<level>lvl[23]))?\.csv$"
+)
+
+
+class Command(BaseCommand):
+    help = "Import the algorithm input CSV files into the AlgorithmInput table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            type=str,
+            nargs="+",
+            default=[settings.ALGORITHM_EXPORT_PATH],
+            help="Directories with the algorithm input files",
+        )
+
+    def handle(self, *args, **options):
+        imported = 0
+        for path in options["path"]:
+            for name in sorted(os.listdir(path)):
+                match = FILE_NAME.match(name)
+                if not match:
+                    continue
+                level = match["level"] or AlgorithmInput.LevelChoices.LVL1
+                count = store_algorithm_input(
+                    match["symbol"],
+                    match["strategy_type"],
+                    level,
+                    date.fromisoformat(match["date"]),
+                    pd.read_csv(os.path.join(path, name)),
+                )
+                print(f"Imported {count} {level} rows from {name}")
+                imported += 1
+        print(f"Imported {imported} algorithm input files")
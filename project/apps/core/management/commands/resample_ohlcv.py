@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from project.apps.core.candles import resample_ohlcv
+from project.apps.core.indicators import update_indicators
+from project.apps.core.models import OHLCV, DataVersion
+from project.apps.core.result_cache import bump_data_version
+
+
+class Command(BaseCommand):
+    help = "Derive higher timeframe OHLCV data from the stored 1m candles."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--symbol",
+            type=str,
+            nargs="+",
+            default=["BTC/USDT:USDT"],
+            help="Trading pair symbols",
+        )
+        parser.add_argument(
+            "--timeframe",
+            type=str,
+            nargs="+",
+            default=["5m", "15m", "1h"],
+            help="Timeframes to derive from the 1m candles",
+        )
+        parser.add_argument(
+            "--from-days-ago",
+            type=int,
+            help="Number of days ago to start resampling from, defaults to the last derived candle",
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        for symbol in options["symbol"]:
+            first_minute = OHLCV.objects.filter(
+                symbol=symbol, timeframe="1m"
+            ).aggregate(Min("datetime"))["datetime__min"]
+            if not first_minute:
+                print(f"No 1m candles for {symbol}")
+                continue
+            for timeframe in options["timeframe"]:
+                if options["from_days_ago"] is not None:
+                    start = (
+                        now - timezone.timedelta(days=options["from_days_ago"])
+                    ).replace(hour=0, minute=0, second=0, microsecond=0)
+                else:
+                    # the last derived candle is derived again, it may come
+                    # from the exchange or from a fetch that was still open
+                    start = (
+                        OHLCV.objects.filter(
+                            symbol=symbol, timeframe=timeframe
+                        ).aggregate(Max("datetime"))["datetime__max"]
+                        or first_minute
+                    )
+                inserted, updated = resample_ohlcv(symbol, timeframe, start, now)
+                print(
+                    f"Inserted {inserted} and updated {updated} {symbol} {timeframe} candles"
+                )
+                count = update_indicators(symbol, timeframe)
+                print(f"Updated {count} {symbol} {timeframe} indicators")
+        bump_data_version(DataVersion.SourceChoices.OHLCV)
@@ -0,0 +1,91 @@
+import time
+import traceback
+from multiprocessing import Process
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from project.apps.core.jobs import (
+    JobHeartbeat,
+    claim_job,
+    fail_job,
+    finish_job,
+    requeue_running_jobs,
+    worker_name,
+)
+
+
+def work(poll_interval: float, once: bool) -> None:
+    """Runs pending what-if jobs one by one, until the queue is empty when
+    once is set."""
+
+    django.setup()
+    connections.close_all()
+    # imported after the setup, the views load the url configuration
+    from project.apps.core.views.jobs import run_what_if_job
+
+    while True:
+        job = claim_job()
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        print(f"{worker_name()} started {job}")
+        try:
+            with JobHeartbeat(job):
+                result = run_what_if_job(job)
+        except Exception:
+            fail_job(job, traceback.format_exc())
+            print(f"{worker_name()} failed {job}")
+            continue
+        finish_job(job, result)
+        print(f"{worker_name()} finished {job}")
+
+
+class Command(BaseCommand):
+    help = "Run the what-if jobs of the forms on local worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=2,
+            help="Number of worker processes",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds between two checks of an empty queue",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Stop when the queue is empty",
+        )
+
+    def handle(self, *args, **options):
+        # the jobs of workers that stopped halfway are run again, the ones
+        # of workers that still report progress keep running
+        if requeued := requeue_running_jobs():
+            print(f"Requeued {requeued} interrupted jobs")
+        print(f"Starting {options['workers']} workers")
+
+        # the workers open their own connections
+        connections.close_all()
+        workers = [
+            Process(target=work, args=(options["poll_interval"], options["once"]))
+            for _ in range(options["workers"])
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
+            requeue_running_jobs(worker_name(worker.pid) for worker in workers)
+            print("Stopped, requeued the running jobs")
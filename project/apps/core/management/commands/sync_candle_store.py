@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from project.apps.core.candles import candle_store
+from project.apps.core.models import OHLCV
+
+
+class Command(BaseCommand):
+    help = "Rebuild the columnar candle store from the OHLCV table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--symbol",
+            type=str,
+            help="Trading pair symbol, defaults to all stored symbols",
+        )
+        parser.add_argument(
+            "--timeframe",
+            type=str,
+            help="Timeframe for the OHLCV data, defaults to all stored timeframes",
+        )
+
+    def handle(self, *args, **options):
+        pairs = OHLCV.objects.values_list("symbol", "timeframe").distinct()
+        if options["symbol"]:
+            pairs = pairs.filter(symbol=options["symbol"])
+        if options["timeframe"]:
+            pairs = pairs.filter(timeframe=options["timeframe"])
+        for symbol, timeframe in pairs.order_by("symbol", "timeframe"):
+            count = candle_store.rebuild(symbol, timeframe)
+            print(f"Stored {count} {symbol} {timeframe} candles")
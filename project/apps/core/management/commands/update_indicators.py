@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from project.apps.core.indicators import update_indicators
+from project.apps.core.models import OHLCV, DataVersion
+from project.apps.core.result_cache import bump_data_version
+
+
+class Command(BaseCommand):
+    help = "Store the RSI, ATR and moving average of the OHLCV candles."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--symbol",
+            type=str,
+            help="Trading pair symbol, defaults to all stored symbols",
+        )
+        parser.add_argument(
+            "--timeframe",
+            type=str,
+            help="Timeframe for the OHLCV data, defaults to all stored timeframes",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Recompute the indicators of all candles instead of only the new ones",
+        )
+
+    def handle(self, *args, **options):
+        pairs = OHLCV.objects.values_list("symbol", "timeframe").distinct()
+        if options["symbol"]:
+            pairs = pairs.filter(symbol=options["symbol"])
+        if options["timeframe"]:
+            pairs = pairs.filter(timeframe=options["timeframe"])
+        for symbol, timeframe in pairs.order_by("symbol", "timeframe"):
+            count = update_indicators(symbol, timeframe, rebuild=options["rebuild"])
+            print(f"Updated {count} {symbol} {timeframe} indicators")
+        bump_data_version(DataVersion.SourceChoices.OHLCV)
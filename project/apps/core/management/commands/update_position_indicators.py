@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+
+from project.apps.core.indicators import (
+    get_indicators,
+    liquidation_indicators,
+    update_indicators,
+)
+from project.apps.core.models import DataVersion, Position
+from project.apps.core.result_cache import bump_data_version
+
+
+UPDATE_BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = "Recompute the liquidation RSI and ATR of the positions from the Indicator table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--symbol",
+            type=str,
+            help="Position symbol (e.g. BTCUSDT), defaults to all symbols",
+        )
+
+    def handle(self, *args, **options):
+        positions = Position.objects.filter(
+            liquidation_candle__isnull=False
+        ).select_related("liquidation_candle")
+        if options["symbol"]:
+            positions = positions.filter(symbol=options["symbol"])
+
+        by_candles = {}
+        for position in positions.order_by("liquidation_datetime"):
+            candle = position.liquidation_candle
+            by_candles.setdefault((candle.symbol, candle.timeframe), []).append(
+                position
+            )
+
+        for (symbol, timeframe), candle_positions in by_candles.items():
+            update_indicators(symbol, timeframe)
+            indicators = get_indicators(
+                symbol,
+                timeframe,
+                candle_positions[0].liquidation_candle.datetime,
+                candle_positions[-1].liquidation_candle.datetime,
+            )
+            for position in candle_positions:
+                position.liquidation_rsi, position.liquidation_atr = (
+                    liquidation_indicators(indicators, position.liquidation_candle)
+                )
+            Position.objects.bulk_update(
+                candle_positions,
+                ["liquidation_rsi", "liquidation_atr"],
+                batch_size=UPDATE_BATCH_SIZE,
+            )
+            print(f"Updated {len(candle_positions)} {symbol} {timeframe} positions")
+        if by_candles:
+            bump_data_version(DataVersion.SourceChoices.POSITIONS)
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0019_remove_position_liquidation_closing_price_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FirstPassageIndex",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("start", models.DateTimeField()),
+                ("end", models.DateTimeField()),
+                ("covered_until", models.DateTimeField()),
+                ("complete", models.BooleanField(default=False)),
+                ("open", models.FloatField()),
+                ("breakpoints", models.JSONField(default=dict)),
+                (
+                    "position",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="first_passage_index",
+                        to="core.position",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0020_firstpassageindex"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngestionWatermark",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[("ohlcv", "OHLCV"), ("liquidations", "Liquidations")],
+                        max_length=20,
+                    ),
+                ),
+                ("symbol", models.CharField(max_length=20)),
+                ("timeframe", models.CharField(max_length=10)),
+                ("synced_until", models.DateTimeField()),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "unique_together": {("source", "symbol", "timeframe")},
+            },
+        ),
+    ]
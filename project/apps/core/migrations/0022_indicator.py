@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-18 05:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0021_ingestionwatermark"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Indicator",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("symbol", models.CharField(max_length=20)),
+                ("timeframe", models.CharField(default="5m", max_length=5)),
+                ("datetime", models.DateTimeField()),
+                ("rsi", models.FloatField(blank=True, null=True)),
+                ("atr", models.FloatField(blank=True, null=True)),
+                ("moving_average_50", models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                "unique_together": {("symbol", "timeframe", "datetime")},
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0022_indicator"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PositionOutcome",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("side", models.CharField(max_length=10)),
+                ("take_profit", models.FloatField()),
+                ("stop_loss", models.FloatField()),
+                ("horizon", models.DurationField()),
+                ("take_profit_on_close", models.BooleanField(default=False)),
+                ("fee_model_version", models.IntegerField()),
+                ("entry_price", models.FloatField()),
+                ("reason", models.SmallIntegerField()),
+                ("exit_datetime", models.DateTimeField(blank=True, null=True)),
+                ("exit_price", models.FloatField(blank=True, null=True)),
+                ("r_multiple", models.FloatField(blank=True, null=True)),
+                ("start", models.DateTimeField()),
+                ("end", models.DateTimeField()),
+                (
+                    "position",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="outcomes",
+                        to="core.position",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {
+                    (
+                        "position",
+                        "side",
+                        "take_profit",
+                        "stop_loss",
+                        "horizon",
+                        "take_profit_on_close",
+                        "fee_model_version",
+                    )
+                },
+            },
+        ),
+    ]
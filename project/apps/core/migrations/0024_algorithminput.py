@@ -0,0 +1,68 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0023_positionoutcome"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AlgorithmInput",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("symbol", models.CharField(max_length=20)),
+                (
+                    "strategy_type",
+                    models.CharField(
+                        choices=[
+                            ("live", "Live"),
+                            ("reversed", "Reversed"),
+                            ("journaling", "Journaling"),
+                            ("rsi_live", "RSI Live"),
+                            ("rsi_reversed", "RSI Reversed"),
+                        ],
+                        max_length=12,
+                    ),
+                ),
+                (
+                    "level",
+                    models.CharField(
+                        choices=[
+                            ("lvl1", "Level 1"),
+                            ("lvl2", "Level 2"),
+                            ("lvl3", "Level 3"),
+                        ],
+                        max_length=5,
+                    ),
+                ),
+                ("valid_from", models.DateField()),
+                ("hour", models.IntegerField(blank=True, null=True)),
+                ("day", models.IntegerField(blank=True, null=True)),
+                ("tp", models.FloatField(blank=True, null=True)),
+                ("sl", models.FloatField(blank=True, null=True)),
+                ("performance_lvl1", models.FloatField(blank=True, null=True)),
+                ("trade_lvl1", models.BooleanField(blank=True, null=True)),
+                ("performance_lvl2", models.FloatField(blank=True, null=True)),
+                ("trade_lvl2", models.BooleanField(blank=True, null=True)),
+                ("performance_lvl3", models.FloatField(blank=True, null=True)),
+                ("trade_lvl3", models.BooleanField(blank=True, null=True)),
+            ],
+            options={
+                "unique_together": {
+                    ("symbol", "strategy_type", "level", "valid_from", "hour", "day")
+                },
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0025_whatifjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DataVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[
+                            ("ohlcv", "OHLCV"),
+                            ("liquidations", "Liquidations"),
+                            ("positions", "Positions"),
+                        ],
+                        max_length=20,
+                        unique=True,
+                    ),
+                ),
+                ("version", models.PositiveIntegerField(default=0)),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="whatifjob",
+            name="cache_key",
+            field=models.CharField(
+                blank=True, db_index=True, default="", max_length=64
+            ),
+        ),
+    ]
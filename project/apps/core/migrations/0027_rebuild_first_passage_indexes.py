@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+def mark_incomplete(apps, schema_editor):
+    """Indexes built before counted their minutes from the first candle
+    instead of the start and were complete despite gaps in their window,
+    build_first_passage_index rebuilds them."""
+
+    FirstPassageIndex = apps.get_model("core", "FirstPassageIndex")
+    FirstPassageIndex.objects.update(complete=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0026_dataversion_whatifjob_cache_key"),
+    ]
+
+    operations = [
+        migrations.RunPython(mark_incomplete, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0027_rebuild_first_passage_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="whatifjob",
+            name="heartbeat",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.core.management import call_command
+from django.db import migrations
+
+
+def recompute_position_indicators(apps, schema_editor):
+    """The liquidation RSI and ATR of the positions are the Wilder values of
+    the Indicator table now, existing positions still hold the old ones."""
+
+    call_command("update_position_indicators")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0028_whatifjob_heartbeat"),
+    ]
+
+    operations = [
+        migrations.RunPython(recompute_position_indicators, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,11 @@
+import math
+
 from django.urls import reverse
 from django.contrib.auth.models import AbstractUser
 from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models.functions import Coalesce, Floor
 
 
 class User(AbstractUser):
@@ -10,6 +14,97 @@ class User(AbstractUser):
     pass
 
 
+def round_returns(value):
+    """Rounds returns half up to cents, a float in Python and an expression in
+    the database with the same floating point steps, so Position.returns and
+    PositionQuerySet.returns_expression give the same cents."""
+
+    if hasattr(value, "resolve_expression"):
+        return models.ExpressionWrapper(
+            Floor(value * 100.0 + 0.5) / 100.0, output_field=models.FloatField()
+        )
+    return math.floor(value * 100.0 + 0.5) / 100.0
+
+
+class PositionQuerySet(models.QuerySet):
+    """QuerySet of positions with their returns computed by the database."""
+
+    @staticmethod
+    def returns_expression() -> models.Expression:
+        """Position.returns as an expression: the side aware profit or loss
+        minus the entry and closing fees, rounded to cents."""
+
+        priced = (
+            models.Q(
+                entry_price__isnull=False,
+                closing_price__isnull=False,
+                amount__isnull=False,
+            )
+            & ~models.Q(entry_price=0)
+            & ~models.Q(closing_price=0)
+        )
+        profit = models.Case(
+            models.When(
+                priced & models.Q(side="LONG"),
+                then=(models.F("closing_price") - models.F("entry_price"))
+                * models.F("amount"),
+            ),
+            models.When(
+                priced & models.Q(side="SHORT"),
+                then=(models.F("entry_price") - models.F("closing_price"))
+                * models.F("amount"),
+            ),
+            default=models.Value(0.0),
+            output_field=models.FloatField(),
+        )
+        fees = Coalesce(
+            models.F("entry_fee"), models.Value(0.0), output_field=models.FloatField()
+        ) + Coalesce(
+            models.F("closing_fee"), models.Value(0.0), output_field=models.FloatField()
+        )
+        return round_returns(profit - fees)
+
+    def with_returns(self) -> "PositionQuerySet":
+        """Annotates the returns of every position as net_returns."""
+
+        return self.annotate(net_returns=self.returns_expression())
+
+    def total_returns(self) -> float:
+        """Returns the sum of the returns of the positions in one aggregate."""
+
+        return self.aggregate(
+            total_returns=Coalesce(
+                models.Sum(self.returns_expression()),
+                models.Value(0.0),
+                output_field=models.FloatField(),
+            )
+        )["total_returns"]
+
+    def rows(self) -> models.QuerySet:
+        """Returns the positions as dicts of their field values and returns,
+        without model instances."""
+
+        return self.values(
+            *(field.name for field in self.model._meta.concrete_fields),
+            returns=self.returns_expression(),
+        )
+
+    def cumulative_returns(self) -> models.QuerySet:
+        """Returns (start, cumulative returns) per position by start, summed
+        by a window function in the database."""
+
+        return (
+            self.annotate(
+                cumulative_returns=models.Window(
+                    models.Sum(self.returns_expression()),
+                    order_by=[models.F("start").asc(), models.F("id").asc()],
+                )
+            )
+            .order_by("start", "id")
+            .values_list("start", "cumulative_returns")
+        )
+
+
 class Position(models.Model):
     """Position model"""
 
@@ -76,6 +171,8 @@ class Position(models.Model):
     liquidation_atr = models.FloatField(null=True, blank=True)
     ##########
 
+    objects = PositionQuerySet.as_manager()
+
     @property
     def admin_url(self):
         content_type = ContentType.objects.get_for_model(self.__class__)
@@ -86,22 +183,18 @@ class Position(models.Model):
 
     @property
     def returns(self) -> float:
-        """Calculate the returns for the position."""
+        """Calculate the returns for the position, the same as
+        PositionQuerySet.returns_expression does in the database."""
 
-        return_value = 0.00
-        return_value -= self.entry_fee if self.entry_fee else 0
-        return_value -= self.closing_fee if self.closing_fee else 0
+        profit = 0.0
         if self.entry_price and self.closing_price and self.amount:
             match self.side:
                 case self._PostionSideChoices.LONG:
-                    return_value += (
-                        self.closing_price - self.entry_price
-                    ) * self.amount
+                    profit = (self.closing_price - self.entry_price) * self.amount
                 case self._PostionSideChoices.SHORT:
-                    return_value += (
-                        self.entry_price - self.closing_price
-                    ) * self.amount
-        return round(return_value, 2)
+                    profit = (self.entry_price - self.closing_price) * self.amount
+        fees = (self.entry_fee or 0.0) + (self.closing_fee or 0.0)
+        return round_returns(profit - fees)
 
     def __str__(self):
         """String representation of the Position model."""
@@ -165,3 +258,207 @@ class RSILiquidation(models.Model):
 
     class Meta:
         unique_together = ("symbol", "datetime", "side", "timeframe")
+
+
+class FirstPassageIndex(models.Model):
+    """Running extremes of the candles after a position's entry.
+
+    For each series the breakpoints are stored as [[minutes after start, ...],
+    [running extreme, ...]], one entry for every candle that sets a new
+    extreme. The first candle crossing any price level is then found with a
+    binary search instead of a scan over the candles.
+    """
+
+    position = models.OneToOneField(
+        Position,
+        on_delete=models.CASCADE,
+        related_name="first_passage_index",
+    )
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    covered_until = models.DateTimeField()
+    complete = models.BooleanField(default=False)
+    open = models.FloatField()
+    breakpoints = models.JSONField(default=dict)
+
+    def __str__(self):
+        """String representation of the FirstPassageIndex model."""
+        return f"FirstPassageIndex[{self.position_id} - {self.start} - {self.covered_until}]"
+
+
+class IngestionWatermark(models.Model):
+    """Datetime up to which a data source is synced for a symbol and timeframe."""
+
+    class SourceChoices(models.TextChoices):
+        OHLCV = "ohlcv", "OHLCV"
+        LIQUIDATIONS = "liquidations", "Liquidations"
+
+    source = models.CharField(max_length=20, choices=SourceChoices.choices)
+    symbol = models.CharField(max_length=20)
+    timeframe = models.CharField(max_length=10)
+    synced_until = models.DateTimeField()
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("source", "symbol", "timeframe")
+
+    def __str__(self):
+        """String representation of the IngestionWatermark model."""
+        return f"IngestionWatermark[{self.source} - {self.symbol} - {self.timeframe} - {self.synced_until}]"
+
+
+class Indicator(models.Model):
+    """Indicators of a candle, computed from the candles up to and including it."""
+
+    symbol = models.CharField(max_length=20)
+    timeframe = models.CharField(max_length=5, default="5m")
+    datetime = models.DateTimeField()
+    rsi = models.FloatField(null=True, blank=True)
+    atr = models.FloatField(null=True, blank=True)
+    moving_average_50 = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ("symbol", "timeframe", "datetime")
+
+    def __str__(self):
+        """String representation of the Indicator model."""
+        return f"Indicator[{self.symbol} - {self.timeframe} - {self.datetime}]"
+
+
+class PositionOutcome(models.Model):
+    """Cached outcome of simulating a position with a TP and SL percentage.
+
+    Only settled outcomes are stored: an exit was found, or the candles cover
+    the whole horizon without one. The window from start to end holds the
+    candles the outcome depends on, it is deleted when one of them changes.
+    """
+
+    position = models.ForeignKey(
+        Position,
+        on_delete=models.CASCADE,
+        related_name="outcomes",
+    )
+    side = models.CharField(max_length=10)
+    take_profit = models.FloatField()
+    stop_loss = models.FloatField()
+    horizon = models.DurationField()
+    take_profit_on_close = models.BooleanField(default=False)
+    fee_model_version = models.IntegerField()
+    entry_price = models.FloatField()
+    reason = models.SmallIntegerField()
+    exit_datetime = models.DateTimeField(null=True, blank=True)
+    exit_price = models.FloatField(null=True, blank=True)
+    r_multiple = models.FloatField(null=True, blank=True)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+
+    class Meta:
+        unique_together = (
+            "position",
+            "side",
+            "take_profit",
+            "stop_loss",
+            "horizon",
+            "take_profit_on_close",
+            "fee_model_version",
+        )
+
+    def __str__(self):
+        """String representation of the PositionOutcome model."""
+        return f"PositionOutcome[{self.position_id} - {self.side} - TP {self.take_profit} SL {self.stop_loss} - {self.reason}]"
+
+
+class AlgorithmInput(models.Model):
+    """One row of the algorithm input generated on valid_from: the TP, SL and
+    performance per liquidation hour (lvl1, lvl2) or week day (lvl3)."""
+
+    class LevelChoices(models.TextChoices):
+        LVL1 = "lvl1", "Level 1"
+        LVL2 = "lvl2", "Level 2"
+        LVL3 = "lvl3", "Level 3"
+
+    symbol = models.CharField(max_length=20)
+    strategy_type = models.CharField(
+        max_length=12, choices=Position.StrategyTypeChoices.choices
+    )
+    level = models.CharField(max_length=5, choices=LevelChoices.choices)
+    valid_from = models.DateField()
+    hour = models.IntegerField(null=True, blank=True)
+    day = models.IntegerField(null=True, blank=True)
+    tp = models.FloatField(null=True, blank=True)
+    sl = models.FloatField(null=True, blank=True)
+    performance_lvl1 = models.FloatField(null=True, blank=True)
+    trade_lvl1 = models.BooleanField(null=True, blank=True)
+    performance_lvl2 = models.FloatField(null=True, blank=True)
+    trade_lvl2 = models.BooleanField(null=True, blank=True)
+    performance_lvl3 = models.FloatField(null=True, blank=True)
+    trade_lvl3 = models.BooleanField(null=True, blank=True)
+
+    class Meta:
+        unique_together = (
+            "symbol",
+            "strategy_type",
+            "level",
+            "valid_from",
+            "hour",
+            "day",
+        )
+
+    def __str__(self):
+        """String representation of the AlgorithmInput model."""
+        return f"AlgorithmInput[{self.symbol} - {self.strategy_type} - {self.level} - {self.valid_from} - {self.hour if self.day is None else self.day}]"
+
+
+class WhatIfJob(models.Model):
+    """A what-if simulation submitted through one of the what-if forms, run in
+    the background by the run_what_if_workers command."""
+
+    class StatusChoices(models.TextChoices):
+        PENDING = "pending", "Pending"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    view = models.CharField(max_length=100)  # url name of the what-if view
+    parameters = models.JSONField()  # the submitted form data
+    # hash of the view, its cleaned form data and the data version, empty for
+    # the views whose results are not cached
+    cache_key = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    status = models.CharField(
+        max_length=10,
+        choices=StatusChoices.choices,
+        default=StatusChoices.PENDING,
+        db_index=True,
+    )
+    processed = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True, default="")
+    worker = models.CharField(max_length=100, blank=True, default="")
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    # last progress update of the worker running the job
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        """String representation of the WhatIfJob model."""
+        return f"WhatIfJob[{self.id} - {self.view} - {self.status} - {self.processed}/{self.total}]"
+
+
+class DataVersion(models.Model):
+    """Counter per data source, bumped by the commands that write its rows so
+    cached what-if results of older data are not used anymore."""
+
+    class SourceChoices(models.TextChoices):
+        OHLCV = "ohlcv", "OHLCV"
+        LIQUIDATIONS = "liquidations", "Liquidations"
+        POSITIONS = "positions", "Positions"
+
+    source = models.CharField(max_length=20, choices=SourceChoices.choices, unique=True)
+    version = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """String representation of the DataVersion model."""
+        return f"DataVersion[{self.source} - {self.version}]"
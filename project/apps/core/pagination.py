@@ -0,0 +1,202 @@
+import base64
+import binascii
+import json
+from typing import Optional, Sequence
+
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def keyset_filter(keyset: Sequence[str], values: Sequence) -> Q:
+    """Returns the rows after values in the order of keyset, fields with a -
+    prefix descending. For (datetime, id) that is datetime > value or
+    datetime = value and id > value."""
+
+    field, *rest = keyset
+    lookup = "lt" if field.startswith("-") else "gt"
+    field = field.lstrip("-")
+    after = Q(**{f"{field}__{lookup}": values[0]})
+    if rest:
+        after |= Q(**{field: values[0]}) & keyset_filter(rest, values[1:])
+    return after
+
+
+class KeysetPagination(BasePagination):
+    """Pagination on the keyset of the view, ("datetime", "id") by default.
+
+    The cursor holds the keyset values of the last row of the page, the next
+    page starts after them. Unlike offsets every page costs the same and no
+    COUNT query is needed.
+    """
+
+    keyset = ("datetime", "id")
+    page_size = 1000
+    page_size_query_param = "page_size"
+    # a week of 1m candles
+    max_page_size = 7 * 24 * 60
+    cursor_query_param = "cursor"
+
+    def get_keyset(self, view) -> Sequence[str]:
+        return getattr(view, "keyset", self.keyset)
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def encode_cursor(self, values: list) -> str:
+        return base64.urlsafe_b64encode(
+            # isoformat keeps the microseconds, DjangoJSONEncoder drops them
+            json.dumps(values, default=lambda value: value.isoformat()).encode()
+        ).decode()
+
+    def decode_cursor(self, request) -> Optional[list]:
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, ValueError):
+            raise NotFound("Invalid cursor")
+        if not isinstance(values, list) or len(values) != len(self.keyset):
+            raise NotFound("Invalid cursor")
+        return values
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None) -> list:
+        self.request = request
+        self.keyset = self.get_keyset(view)
+        page_size = self.get_page_size(request)
+        if (values := self.decode_cursor(request)) is not None:
+            queryset = queryset.filter(keyset_filter(self.keyset, values))
+        rows = list(queryset.order_by(*self.keyset)[: page_size + 1])
+        self.next_values = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            self.next_values = [
+                last[field] if isinstance(last, dict) else getattr(last, field)
+                for field in (field.lstrip("-") for field in self.keyset)
+            ]
+        return rows
+
+    def get_next_link(self) -> Optional[str]:
+        if self.next_values is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_values),
+        )
+
+    def get_paginated_response(self, data) -> Response:
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view) -> list[dict]:
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "The cursor of the page, from the next link",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": f"Number of rows per page, at most {self.max_page_size}",
+                "schema": {"type": "integer"},
+            },
+        ]
+
+
+class PositionKeysetPagination(KeysetPagination):
+    """KeysetPagination with the page size of the other position listings."""
+
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 1000
+
+
+class OptionalCountPagination(PageNumberPagination):
+    """PageNumberPagination that leaves out the count, and its COUNT query,
+    with ?count=false. The next page is then known by fetching one row more
+    than the page."""
+
+    count_query_param = "count"
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None):
+        self.with_count = request.query_params.get(self.count_query_param) != "false"
+        if self.with_count:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        try:
+            self.number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            raise NotFound("Invalid page")
+        if self.number < 1:
+            raise NotFound("Invalid page")
+        offset = (self.number - 1) * page_size
+        rows = list(queryset[offset : offset + page_size + 1])
+        self.has_next = len(rows) > page_size
+        if not rows and self.number > 1:
+            raise NotFound("Invalid page")
+        return rows[:page_size]
+
+    def get_next_link(self) -> Optional[str]:
+        if self.with_count:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.page_query_param, self.number + 1
+        )
+
+    def get_previous_link(self) -> Optional[str]:
+        if self.with_count:
+            return super().get_previous_link()
+        if self.number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.number - 1)
+
+    def get_paginated_response(self, data) -> Response:
+        if self.with_count:
+            return super().get_paginated_response(data)
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_schema_operation_parameters(self, view) -> list[dict]:
+        return super().get_schema_operation_parameters(view) + [
+            {
+                "name": self.count_query_param,
+                "required": False,
+                "in": "query",
+                "description": "false leaves out the count of all results",
+                "schema": {"type": "boolean"},
+            }
+        ]
@@ -0,0 +1,37 @@
+import io
+
+import numpy as np
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class ColumnsRenderer(JSONRenderer):
+    """JSON with an array per column instead of an object per row, see
+    ColumnarViewSetMixin."""
+
+    format = "columns"
+
+
+class NpzRenderer(BaseRenderer):
+    """The columns as a NumPy .npz archive with an array per column, read
+    with numpy.load."""
+
+    media_type = "application/x-npz"
+    format = "npz"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        arrays = {
+            name: np.asarray(values) for name, values in data.get("columns", {}).items()
+        }
+        # the constant columns, the next link and the detail of an error
+        arrays.update(
+            {
+                key: np.asarray(str(value))
+                for key, value in data.items()
+                if key != "columns" and value is not None
+            }
+        )
+        output = io.BytesIO()
+        np.savez(output, **arrays)
+        return output.getvalue()
@@ -0,0 +1,97 @@
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.utils import timezone
+
+from project.apps.core.models import DataVersion, WhatIfJob
+
+
+def bump_data_version(source: str) -> None:
+    """Marks the rows of the source as changed, the what-if results cached
+    before are not used anymore."""
+
+    DataVersion.objects.get_or_create(source=source)
+    DataVersion.objects.filter(source=source).update(
+        version=F("version") + 1, updated=timezone.now()
+    )
+
+
+def data_version() -> str:
+    """Returns the versions of all sources, like ohlcv:3,positions:1."""
+
+    return ",".join(
+        f"{source}:{version}"
+        for source, version in DataVersion.objects.order_by("source").values_list(
+            "source", "version"
+        )
+    )
+
+
+def _canonical(value):
+    # the order of the choices of a multiple choice field does not matter
+    if isinstance(value, (list, tuple, set)):
+        return sorted(value, key=str)
+    return value
+
+
+def result_key(view: str, cleaned_data: dict) -> str:
+    """Returns the hash of the view, the cleaned form data and the current
+    data version."""
+
+    return hashlib.sha256(
+        json.dumps(
+            {
+                "view": view,
+                "data": {key: _canonical(value) for key, value in cleaned_data.items()},
+                "version": data_version(),
+            },
+            sort_keys=True,
+            cls=DjangoJSONEncoder,
+        ).encode()
+    ).hexdigest()
+
+
+def cached_job(cache_key: str) -> Optional[WhatIfJob]:
+    """Returns the latest job with the key that did not fail, None when
+    there is none."""
+
+    return (
+        WhatIfJob.objects.filter(cache_key=cache_key)
+        .exclude(status=WhatIfJob.StatusChoices.FAILED)
+        .defer("result")
+        .order_by("-created")
+        .first()
+    )
+
+
+class ResultCache:
+    """The last used results of finished jobs by their cache key, in memory,
+    so the job page does not load and decode them again."""
+
+    def __init__(self, size: Optional[int] = None):
+        self._size = size
+        self._results: OrderedDict[str, dict] = OrderedDict()
+
+    @property
+    def size(self) -> int:
+        return self._size or settings.WHAT_IF_RESULT_CACHE_SIZE
+
+    def get(self, cache_key: str) -> Optional[dict]:
+        result = self._results.get(cache_key)
+        if result is not None:
+            self._results.move_to_end(cache_key)
+        return result
+
+    def put(self, cache_key: str, result: dict) -> None:
+        self._results[cache_key] = result
+        self._results.move_to_end(cache_key)
+        while len(self._results) > self.size:
+            self._results.popitem(last=False)
+
+
+result_cache = ResultCache()
@@ -1,6 +1,8 @@
+from functools import cache
+
 from rest_framework import serializers
 
-from project.apps.core.models import Position, User
+from project.apps.core.models import OHLCV, Liquidation, Position, RSILiquidation, User
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -17,10 +19,52 @@ class PositionSerializer(serializers.ModelSerializer):
     returns = serializers.SerializerMethodField("get_returns")
 
     def get_returns(self, position: Position) -> float:
-        """Calculate the returns for the position."""
+        """Returns the returns annotated by PositionQuerySet.with_returns, else
+        calculates them for the position."""
 
+        if hasattr(position, "net_returns"):
+            return position.net_returns
         return position.returns
 
     class Meta:
         model = Position
         fields = "__all__"
+
+
+@cache
+def position_fields() -> list[str]:
+    """Returns the field names of PositionSerializer, in its order."""
+
+    return list(PositionSerializer().fields)
+
+
+class PositionRowSerializer(serializers.BaseSerializer):
+    """Read-only serializer of the dicts of PositionQuerySet.rows, with the
+    output of PositionSerializer but without model instances."""
+
+    def to_representation(self, row: dict) -> dict:
+        return {name: row[name] for name in position_fields()}
+
+
+class OHLCVSerializer(serializers.ModelSerializer):
+    """Serializer for the OHLCV model."""
+
+    class Meta:
+        model = OHLCV
+        fields = "__all__"
+
+
+class LiquidationSerializer(serializers.ModelSerializer):
+    """Serializer for the Liquidation model."""
+
+    class Meta:
+        model = Liquidation
+        fields = "__all__"
+
+
+class RSILiquidationSerializer(serializers.ModelSerializer):
+    """Serializer for the RSILiquidation model."""
+
+    class Meta:
+        model = RSILiquidation
+        fields = "__all__"
@@ -0,0 +1,256 @@
+import heapq
+from typing import Any, Callable, Iterable, NamedTuple, Optional, Protocol
+
+import numpy as np
+
+from project.apps.core.candles import Candle, Candles
+
+
+EXIT_NONE = 0
+EXIT_TAKE_PROFIT = 1
+EXIT_STOP_LOSS = 2
+
+FIRST_BLOCK_SIZE = 288  # one day of 5m candles
+MAX_BLOCK_SIZE = 4096
+MAX_BLOCK_ELEMENTS = 2**22
+
+
+class FirstTouch(NamedTuple):
+    """Result of the first touch kernel, one entry per position."""
+
+    index: np.ndarray  # candle index of the exit, -1 when nothing was touched
+    price: np.ndarray  # TP or SL level that was touched, nan when nothing was touched
+    reason: np.ndarray  # EXIT_NONE, EXIT_TAKE_PROFIT or EXIT_STOP_LOSS
+
+
+def first_touch(
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    is_long: np.ndarray,
+    take_profit: np.ndarray,
+    stop_loss: np.ndarray,
+    take_profit_on_close: bool = False,
+) -> FirstTouch:
+    """Finds the first candle that touches TP or SL for a batch of positions.
+
+    All positions share one candle series; position i is simulated on the
+    candles starts[i] <= index < ends[i] with absolute TP and SL price levels.
+    The SL wins when both levels are touched by the same candle, like the
+    candle loops in the what-if views. Positions are scanned in blocks that
+    double in size, so most of them are resolved after looking at one day.
+    """
+
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.minimum(np.asarray(ends, dtype=np.int64), len(high))
+    is_long = np.asarray(is_long, dtype=bool)
+    take_profit = np.asarray(take_profit, dtype=np.float64)
+    stop_loss = np.asarray(stop_loss, dtype=np.float64)
+    take_profit_high = close if take_profit_on_close else high
+    take_profit_low = close if take_profit_on_close else low
+
+    index = np.full(len(starts), -1, dtype=np.int64)
+    price = np.full(len(starts), np.nan)
+    reason = np.full(len(starts), EXIT_NONE, dtype=np.int8)
+
+    def scan(pending: np.ndarray, offset: int, block_size: int) -> np.ndarray:
+        """Scans one block of candles, stores the positions that were resolved
+        and returns the ones that need the next block."""
+
+        base = starts[pending] + offset
+        candle_index = base[:, None] + np.arange(block_size)
+        valid = candle_index < ends[pending, None]
+        candle_index = np.minimum(candle_index, len(high) - 1)
+
+        long = is_long[pending, None]
+        sl = stop_loss[pending, None]
+        tp = take_profit[pending, None]
+        sl_hit = np.where(long, low[candle_index] <= sl, high[candle_index] >= sl)
+        tp_hit = np.where(
+            long,
+            take_profit_high[candle_index] >= tp,
+            take_profit_low[candle_index] <= tp,
+        )
+        hit = (sl_hit | tp_hit) & valid
+
+        touched = hit.any(axis=1)
+        rows = np.flatnonzero(touched)
+        columns = hit[rows].argmax(axis=1)
+        resolved = pending[rows]
+        stopped = sl_hit[rows, columns]
+        index[resolved] = base[rows] + columns
+        price[resolved] = np.where(stopped, stop_loss[resolved], take_profit[resolved])
+        reason[resolved] = np.where(stopped, EXIT_STOP_LOSS, EXIT_TAKE_PROFIT)
+
+        exhausted = base + block_size >= ends[pending]
+        return pending[~touched & ~exhausted]
+
+    pending = np.flatnonzero(starts < ends)
+    offset = 0
+    block_size = FIRST_BLOCK_SIZE
+    while pending.size:
+        # bound the positions x candles block so big batches keep memory flat
+        chunk_size = max(1, MAX_BLOCK_ELEMENTS // block_size)
+        pending = np.concatenate(
+            [
+                scan(pending[chunk : chunk + chunk_size], offset, block_size)
+                for chunk in range(0, pending.size, chunk_size)
+            ]
+        )
+        offset += block_size
+        block_size = min(block_size * 2, MAX_BLOCK_SIZE)
+    return FirstTouch(index, price, reason)
+
+
+def first_trigger(
+    candles: Candles,
+    side: str,
+    entry_price: float,
+    take_profit_distances: Iterable[float],
+    stop_loss_distances: Iterable[float],
+) -> int:
+    """Returns the index of the first candle that reaches one of the given
+    percentage distances from the entry price, or len(candles) when no candle
+    does.
+
+    Take profit distances are above the entry for a LONG and below it for a
+    SHORT, stop loss distances the other way around. Candle loops use this to
+    skip the candles where none of their price triggers can fire.
+    """
+
+    if not candles.exists():
+        return 0
+    take_profit_distance = min(take_profit_distances)
+    stop_loss_distance = min(stop_loss_distances)
+    is_long = side == "LONG"
+    direction = 1 if is_long else -1
+    touch = first_touch(
+        candles.high,
+        candles.low,
+        candles.close,
+        starts=np.array([0]),
+        ends=np.array([len(candles)]),
+        is_long=np.array([is_long]),
+        take_profit=np.array(
+            [entry_price * (1 + direction * take_profit_distance / 100)]
+        ),
+        stop_loss=np.array([entry_price * (1 - direction * stop_loss_distance / 100)]),
+    )
+    return int(touch.index[0]) if touch.reason[0] != EXIT_NONE else len(candles)
+
+
+class SweepTrade(Protocol):
+    """An open position of a sweep.
+
+    levels returns the highest price at or below which and the lowest price
+    at or above which the next candle changes the trade, update processes
+    such a candle and returns True when it closed the trade. Trades whose
+    levels move with every candle, like a trailing SL, set every_candle.
+    """
+
+    every_candle: bool
+
+    def levels(self) -> tuple[float, float]: ...
+
+    def update(self, index: int, candle: Candle) -> bool: ...
+
+
+def sweep(
+    candles: Candles,
+    entries: Iterable[tuple[int, int, Any]],
+    open_trade: Callable[[Any, int], Optional[SweepTrade]],
+    close_trade: Callable[[SweepTrade, int], None],
+    expire_trade: Optional[Callable[[SweepTrade], None]] = None,
+) -> None:
+    """Simulates many positions on one candle series in a single
+    chronological pass.
+
+    entries are (entry index, end index, item) in entry order, a position
+    is simulated on the candles entry index <= index < end index. For every
+    entry open_trade returns the trade, or None to skip it, so sizing and
+    overlap rules see exactly the trades that closed before the entry.
+
+    The open trades wait in two heaps keyed by their levels. Every candle is
+    visited once and only the trades whose level it reaches are updated, in
+    entry order, the entries of a candle before its exits. Trades still open
+    at their end index are passed to expire_trade.
+    """
+
+    entries = sorted(
+        ((entry, end, item) for entry, end, item in entries if entry < end),
+        key=lambda entry: entry[0],
+    )
+    high = candles.high
+    low = candles.low
+    lows: list[tuple] = []  # (-lower level, sequence, version)
+    highs: list[tuple] = []  # (upper level, sequence, version)
+    ends: list[tuple] = []  # (end index, sequence)
+    trades: dict[int, SweepTrade] = {}
+    versions: dict[int, int] = {}
+    every_candle: set[int] = set()
+
+    def push(sequence: int) -> None:
+        trade = trades[sequence]
+        if trade.every_candle:
+            every_candle.add(sequence)
+            return
+        versions[sequence] += 1
+        lower, upper = trade.levels()
+        heapq.heappush(lows, (-lower, sequence, versions[sequence]))
+        heapq.heappush(highs, (upper, sequence, versions[sequence]))
+
+    def remove(sequence: int) -> SweepTrade:
+        every_candle.discard(sequence)
+        versions.pop(sequence)
+        return trades.pop(sequence)
+
+    next_entry = 0
+    index = entries[0][0] if entries else len(candles)
+    while index < len(candles):
+        while ends and ends[0][0] <= index:
+            _, sequence = heapq.heappop(ends)
+            if sequence in trades:
+                trade = remove(sequence)
+                if expire_trade:
+                    expire_trade(trade)
+
+        while next_entry < len(entries) and entries[next_entry][0] == index:
+            _, end, item = entries[next_entry]
+            trade = open_trade(item, index)
+            if trade is not None:
+                trades[next_entry] = trade
+                versions[next_entry] = 0
+                heapq.heappush(ends, (end, next_entry))
+                push(next_entry)
+            next_entry += 1
+
+        if not trades:
+            if next_entry == len(entries):
+                break
+            # nothing is open, jump to the next entry
+            index = entries[next_entry][0]
+            continue
+
+        reached = set(every_candle)
+        while lows and -lows[0][0] >= low[index]:
+            _, sequence, version = heapq.heappop(lows)
+            if versions.get(sequence) == version:
+                reached.add(sequence)
+        while highs and highs[0][0] <= high[index]:
+            _, sequence, version = heapq.heappop(highs)
+            if versions.get(sequence) == version:
+                reached.add(sequence)
+        if reached:
+            candle = candles[index]
+            for sequence in sorted(reached):
+                if trades[sequence].update(index, candle):
+                    close_trade(remove(sequence), index)
+                else:
+                    push(sequence)
+        index += 1
+
+    if expire_trade:
+        for trade in trades.values():
+            expire_trade(trade)
@@ -0,0 +1,168 @@
+import heapq
+from datetime import date
+from typing import NamedTuple, Sequence
+
+import numpy as np
+
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from project.apps.core.first_passage import first_passage_outcomes
+from project.apps.core.models import Position
+from project.apps.core.simulation import EXIT_STOP_LOSS, EXIT_TAKE_PROFIT
+
+
+# the windows of the counts, by the start of the position (WINDOW_ALL) or by
+# the days between its liquidation and the until date
+WINDOW_ALL = 0
+WINDOW_SIX_MONTH = 1
+WINDOW_THREE_MONTH = 2
+WINDOW_DAYS = {WINDOW_ALL: 180, WINDOW_SIX_MONTH: 180, WINDOW_THREE_MONTH: 90}
+
+
+class WindowCounts(NamedTuple):
+    """Wins and losses per window (rows), hour and TP/SL pair (columns)."""
+
+    wins: np.ndarray
+    losses: np.ndarray
+
+
+class SlidingWindowScorer:
+    """Win and loss counts of the positions that started in the 180 days
+    before consecutive until dates, per liquidation hour and TP/SL pair.
+
+    Outcomes that are settled, whose horizon ended before the until date,
+    are counted once and subtracted again when they drop out of a window.
+    Only the positions of the last horizon are simulated for every until
+    date, so a week later costs about one week of new positions.
+    """
+
+    def __init__(
+        self,
+        positions: QuerySet[Position],
+        take_profits: Sequence[float],
+        stop_losses: Sequence[float],
+        horizon: timezone.timedelta = timezone.timedelta(days=14),
+        take_profit_on_close: bool = True,
+    ):
+        self.positions = positions
+        self.take_profits = take_profits
+        self.stop_losses = stop_losses
+        self.horizon = horizon
+        self.take_profit_on_close = take_profit_on_close
+        shape = (len(WINDOW_DAYS), 24, len(take_profits))
+        self.wins = np.zeros(shape, dtype=int)
+        self.losses = np.zeros(shape, dtype=int)
+        # (last until date it counts for, sequence, window, hour, wins, losses)
+        self.expiries: list[tuple] = []
+        self.sequence = 0
+        self.until_date = None
+        self.settled_until = None
+
+    def outcomes(
+        self, positions: list[Position], until: timezone.datetime
+    ) -> tuple[np.ndarray, np.ndarray]:
+        reasons = first_passage_outcomes(
+            positions,
+            take_profits=self.take_profits,
+            stop_losses=self.stop_losses,
+            horizon=self.horizon,
+            until=until,
+            take_profit_on_close=self.take_profit_on_close,
+        ).reasons
+        return (
+            (reasons == EXIT_TAKE_PROFIT).astype(int),
+            (reasons == EXIT_STOP_LOSS).astype(int),
+        )
+
+    def last_until_dates(self, position: Position) -> dict[int, date]:
+        """Returns the last until date the position counts for per window."""
+
+        started = (
+            position.start + timezone.timedelta(days=WINDOW_DAYS[WINDOW_ALL])
+        ).date()
+        liquidated = position.liquidation_datetime.date()
+        return {
+            window: (
+                started
+                if window == WINDOW_ALL
+                else min(started, liquidated + timezone.timedelta(days=days))
+            )
+            for window, days in WINDOW_DAYS.items()
+        }
+
+    def settle(self, until: timezone.datetime) -> None:
+        """Counts the outcomes that settled since the last until date."""
+
+        positions = self.positions.filter(
+            start__gte=until - timezone.timedelta(days=WINDOW_DAYS[WINDOW_ALL]),
+            start__lte=until - self.horizon,
+        )
+        if self.settled_until:
+            positions = positions.filter(start__gt=self.settled_until)
+        positions = list(positions.order_by("start"))
+        self.settled_until = until - self.horizon
+        if not positions:
+            return
+        wins, losses = self.outcomes(positions, until)
+        for position, position_wins, position_losses in zip(positions, wins, losses):
+            hour = position.liquidation_datetime.hour
+            for window, last_until_date in self.last_until_dates(position).items():
+                if last_until_date < self.until_date:
+                    continue
+                self.wins[window, hour] += position_wins
+                self.losses[window, hour] += position_losses
+                heapq.heappush(
+                    self.expiries,
+                    (
+                        last_until_date,
+                        self.sequence,
+                        window,
+                        hour,
+                        position_wins,
+                        position_losses,
+                    ),
+                )
+                self.sequence += 1
+
+    def expire(self) -> None:
+        """Subtracts the outcomes that dropped out of their window."""
+
+        while self.expiries and self.expiries[0][0] < self.until_date:
+            _, _, window, hour, wins, losses = heapq.heappop(self.expiries)
+            self.wins[window, hour] -= wins
+            self.losses[window, hour] -= losses
+
+    def advance(self, until_date: date) -> WindowCounts:
+        """Returns the counts of the positions that started before until_date,
+        on the candles before it. The until dates may not go back."""
+
+        if self.until_date and until_date < self.until_date:
+            raise ValueError(
+                f"until date {until_date} is before the last one {self.until_date}"
+            )
+        self.until_date = until_date
+        until = timezone.datetime(until_date.year, until_date.month, until_date.day)
+        self.settle(until)
+        self.expire()
+
+        wins = self.wins.copy()
+        losses = self.losses.copy()
+        # the outcomes of the last horizon may still change, they are
+        # simulated up to the until date every time
+        positions = list(
+            self.positions.filter(
+                start__gt=until - self.horizon, start__lt=until
+            ).order_by("start")
+        )
+        if positions:
+            open_wins, open_losses = self.outcomes(positions, until)
+            for position, position_wins, position_losses in zip(
+                positions, open_wins, open_losses
+            ):
+                hour = position.liquidation_datetime.hour
+                for window, last_until_date in self.last_until_dates(position).items():
+                    if last_until_date >= until_date:
+                        wins[window, hour] += position_wins
+                        losses[window, hour] += position_losses
+        return WindowCounts(wins, losses)
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+
+from project.apps.core.indicators import EMA, RollingHigh, RollingLow
+
+
+class StreamingIndicatorTest(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(6)
+        # rounded, so the windows contain equal values
+        self.values = np.round(rng.normal(100, 5, 500))
+
+    def test_ema_matches_pandas(self):
+        ema = EMA(10)
+        streamed = [ema.update(value) for value in self.values]
+        expected = pd.Series(self.values).ewm(span=10, adjust=False).mean()
+        np.testing.assert_allclose(streamed, expected)
+
+    def test_ema_starts_from_the_given_value(self):
+        ema = EMA(3, value=10)
+        self.assertEqual(ema.update(20), 15)
+
+    def test_rolling_high_and_low_match_pandas(self):
+        for period in (1, 2, 5, 20):
+            with self.subTest(period=period):
+                high, low = RollingHigh(period), RollingLow(period)
+                series = pd.Series(self.values).rolling(period, min_periods=1)
+                self.assertEqual(
+                    [high.update(value) for value in self.values],
+                    series.max().tolist(),
+                )
+                self.assertEqual(
+                    [low.update(value) for value in self.values],
+                    series.min().tolist(),
+                )
+
+    def test_empty(self):
+        self.assertIsNone(EMA(10).value)
+        self.assertIsNone(RollingHigh(10).value)
+        self.assertIsNone(RollingLow(10).value)
@@ -0,0 +1,62 @@
+import numpy as np
+from django.test import TestCase
+from django.utils import timezone
+
+from project.apps.core.models import Position
+
+
+class PositionReturnsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = np.random.default_rng(7)
+        start = timezone.datetime(2024, 1, 1)
+        positions = [
+            # profits of exactly half a cent and more, up and down
+            Position(
+                side=side, start=start, amount=1, entry_price=100, closing_price=price
+            )
+            for side in ("LONG", "SHORT")
+            for price in (100.005, 100.125, 99.875, 100.375, 92.785)
+        ]
+        for i in range(2000):
+            entry_price = round(rng.uniform(20000, 100000), 1)
+            positions.append(
+                Position(
+                    side=rng.choice(["LONG", "SHORT"]),
+                    start=start + timezone.timedelta(minutes=5 * i),
+                    amount=round(rng.uniform(0.0001, 0.01), 4),
+                    entry_price=entry_price,
+                    closing_price=round(entry_price * rng.uniform(0.97, 1.03), 1),
+                    entry_fee=round(rng.uniform(0, 0.5), 3),
+                    closing_fee=round(rng.uniform(0, 0.5), 3) if i % 3 else None,
+                )
+            )
+        # unpriced positions only pay their fees
+        positions.append(Position(start=start, amount=1, entry_fee=0.015))
+        Position.objects.bulk_create(positions)
+
+    def test_expression_matches_property(self):
+        for position in Position.objects.with_returns():
+            with self.subTest(id=position.id):
+                self.assertEqual(position.net_returns, position.returns)
+
+    def test_rows_match_property(self):
+        returns = {position.id: position.returns for position in Position.objects.all()}
+        for row in Position.objects.rows():
+            self.assertEqual(row["returns"], returns[row["id"]])
+
+    def test_half_cents_round_up(self):
+        # a profit of exactly 0.125 and -0.125
+        positions = Position.objects.filter(closing_price=100.125).with_returns()
+        self.assertEqual(
+            sorted((position.returns, position.net_returns) for position in positions),
+            [(-0.12, -0.12), (0.13, 0.13)],
+        )
+
+    def test_totals_are_the_sum_of_the_returns(self):
+        returns = [
+            position.returns for position in Position.objects.order_by("start", "id")
+        ]
+        self.assertAlmostEqual(Position.objects.total_returns(), sum(returns), places=6)
+        cumulative = [value for _, value in Position.objects.cumulative_returns()]
+        np.testing.assert_allclose(cumulative, np.cumsum(returns), atol=1e-6)
@@ -0,0 +1,108 @@
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from project.apps.core.models import OHLCV
+from project.apps.core.pagination import KeysetPagination, PositionKeysetPagination
+from project.apps.core.viewsets import OHLCVViewset, PositionViewset
+
+
+class KeysetPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.datetime(2024, 1, 1)
+        # three symbols per datetime, so pages end between equal datetimes
+        OHLCV.objects.bulk_create(
+            OHLCV(
+                symbol=symbol,
+                timeframe="5m",
+                datetime=start + timezone.timedelta(minutes=5 * (i // 3)),
+                open=1,
+                high=1,
+                low=1,
+                close=1,
+                volume=1,
+            )
+            for i, symbol in enumerate(["BTC", "ETH", "SOL"] * 10)
+        )
+
+    def pages(self, keyset: tuple, page_size: int) -> list[list[int]]:
+        """Returns the ids of every page, following the next links."""
+
+        factory = APIRequestFactory()
+        queryset = OHLCV.objects.all()
+        url = f"/ohlcv/?page_size={page_size}"
+        pages = []
+        while url:
+            paginator = KeysetPagination()
+            paginator.keyset = keyset
+            rows = paginator.paginate_queryset(queryset, Request(factory.get(url)))
+            pages.append([row.id for row in rows])
+            url = paginator.get_next_link()
+        return pages
+
+    def test_visits_every_row_once(self):
+        expected = list(
+            OHLCV.objects.order_by("datetime", "id").values_list("id", flat=True)
+        )
+        for page_size in (1, 2, 4, 7, 30, 100):
+            with self.subTest(page_size=page_size):
+                pages = self.pages(("datetime", "id"), page_size)
+                self.assertEqual(sum(pages, []), expected)
+                self.assertTrue(all(len(page) <= page_size for page in pages))
+
+    def test_descending_keyset(self):
+        expected = list(OHLCV.objects.order_by("-id").values_list("id", flat=True))
+        self.assertEqual(sum(self.pages(("-id",), 4), []), expected)
+
+    def test_descending_datetime_with_equal_datetimes(self):
+        expected = list(
+            OHLCV.objects.order_by("-datetime", "id").values_list("id", flat=True)
+        )
+        self.assertEqual(sum(self.pages(("-datetime", "id"), 4), []), expected)
+
+
+class ColumnarViewSetTest(TestCase):
+    def test_datetimes_are_unix_seconds(self):
+        # stored naive in Europe/Amsterdam, an hour ahead of UTC in winter
+        OHLCV.objects.create(
+            symbol="BTC",
+            timeframe="1m",
+            datetime=timezone.datetime(2024, 1, 1, 1, 0, 0, 500000),
+            open=1,
+            high=1,
+            low=1,
+            close=1,
+            volume=1,
+        )
+        view = OHLCVViewset.as_view({"get": "list"}, permission_classes=[])
+        response = view(
+            APIRequestFactory().get(
+                "/ohlcv/", {"format": "columns", "symbol": "BTC", "timeframe": "1m"}
+            )
+        )
+        self.assertEqual(response.data["columns"]["datetime"], [1704067200.5])
+
+
+class PositionCursorPaginationTest(TestCase):
+    def list(self, params: dict):
+        view = PositionViewset.as_view({"get": "list"}, permission_classes=[])
+        return view(APIRequestFactory().get("/positions/", params))
+
+    def test_page_size_of_the_positions(self):
+        paginator = PositionKeysetPagination()
+        factory = APIRequestFactory()
+        self.assertEqual(paginator.get_page_size(Request(factory.get("/"))), 100)
+        request = Request(factory.get("/", {"page_size": 100000}))
+        self.assertEqual(paginator.get_page_size(request), 1000)
+
+    def test_ordering_is_rejected(self):
+        response = self.list({"pagination": "cursor", "ordering": "start"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("ordering", response.data)
+
+    def test_cursor(self):
+        response = self.list({"pagination": "cursor"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"], [])
@@ -0,0 +1,317 @@
+import numpy as np
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from project.apps.core.candles import Candle, Candles
+from project.apps.core.simulation import (
+    EXIT_NONE,
+    EXIT_STOP_LOSS,
+    EXIT_TAKE_PROFIT,
+    first_touch,
+    first_trigger,
+    sweep,
+)
+
+
+def random_candles(count: int, seed: int) -> Candles:
+    """Returns a random walk of 5m candles around 100."""
+
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, count)))
+    open = np.append(100, close[:-1])
+    high = np.maximum(open, close) * (1 + np.abs(rng.normal(0, 0.001, count)))
+    low = np.minimum(open, close) * (1 - np.abs(rng.normal(0, 0.001, count)))
+    start = timezone.datetime(2024, 1, 1)
+    return Candles.from_rows(
+        (start + timezone.timedelta(minutes=5 * i), *prices, 1.0)
+        for i, prices in enumerate(zip(open, high, low, close))
+    )
+
+
+def candle_loop(
+    candles: Candles,
+    start: int,
+    end: int,
+    is_long: bool,
+    take_profit: float,
+    stop_loss: float,
+    take_profit_on_close: bool = False,
+) -> tuple[int, int]:
+    """Returns the exit index and reason of one position, candle by candle
+    like the what-if views, the SL first when a candle touches both."""
+
+    for index in range(start, min(end, len(candles))):
+        candle = candles[index]
+        if is_long:
+            stop_loss_hit = candle.low <= stop_loss
+            take_profit_hit = (
+                candle.close if take_profit_on_close else candle.high
+            ) >= take_profit
+        else:
+            stop_loss_hit = candle.high >= stop_loss
+            take_profit_hit = (
+                candle.close if take_profit_on_close else candle.low
+            ) <= take_profit
+        if stop_loss_hit:
+            return index, EXIT_STOP_LOSS
+        if take_profit_hit:
+            return index, EXIT_TAKE_PROFIT
+    return -1, EXIT_NONE
+
+
+def tie_candles() -> Candles:
+    """Two candles, the second touches 99 and 101."""
+
+    return Candles.from_rows(
+        [
+            (timezone.datetime(2024, 1, 1, 0, 0), 100, 100.5, 99.5, 100, 1),
+            (timezone.datetime(2024, 1, 1, 0, 5), 100, 102, 98, 100, 1),
+        ]
+    )
+
+
+class FirstTouchTest(SimpleTestCase):
+    def setUp(self):
+        self.candles = random_candles(2000, seed=1)
+        rng = np.random.default_rng(2)
+        count = 300
+        self.starts = rng.integers(0, len(self.candles), count)
+        # windows longer than the first block and past the last candle
+        self.ends = self.starts + rng.integers(0, 1500, count)
+        self.is_long = rng.random(count) < 0.5
+        entry_prices = self.candles.open[self.starts]
+        direction = np.where(self.is_long, 1, -1)
+        self.take_profit = entry_prices * (
+            1 + direction * rng.uniform(0.1, 3, count) / 100
+        )
+        self.stop_loss = entry_prices * (
+            1 - direction * rng.uniform(0.1, 3, count) / 100
+        )
+
+    def assert_matches_loop(self, take_profit_on_close: bool) -> None:
+        touch = first_touch(
+            self.candles.high,
+            self.candles.low,
+            self.candles.close,
+            self.starts,
+            self.ends,
+            self.is_long,
+            self.take_profit,
+            self.stop_loss,
+            take_profit_on_close=take_profit_on_close,
+        )
+        for i in range(len(self.starts)):
+            index, reason = candle_loop(
+                self.candles,
+                self.starts[i],
+                self.ends[i],
+                self.is_long[i],
+                self.take_profit[i],
+                self.stop_loss[i],
+                take_profit_on_close,
+            )
+            self.assertEqual((touch.index[i], touch.reason[i]), (index, reason))
+            if reason == EXIT_NONE:
+                self.assertTrue(np.isnan(touch.price[i]))
+            elif reason == EXIT_STOP_LOSS:
+                self.assertEqual(touch.price[i], self.stop_loss[i])
+            else:
+                self.assertEqual(touch.price[i], self.take_profit[i])
+
+    def test_matches_candle_loop(self):
+        self.assert_matches_loop(take_profit_on_close=False)
+
+    def test_matches_candle_loop_take_profit_on_close(self):
+        self.assert_matches_loop(take_profit_on_close=True)
+
+    def test_stop_loss_wins_a_tie(self):
+        candles = tie_candles()
+        touch = first_touch(
+            candles.high,
+            candles.low,
+            candles.close,
+            starts=[0, 0],
+            ends=[2, 2],
+            is_long=[True, False],
+            take_profit=[101, 99],
+            stop_loss=[99, 101],
+        )
+        self.assertEqual(touch.index.tolist(), [1, 1])
+        self.assertEqual(touch.reason.tolist(), [EXIT_STOP_LOSS, EXIT_STOP_LOSS])
+        self.assertEqual(touch.price.tolist(), [99, 101])
+
+    def test_empty_window(self):
+        end = len(self.candles)
+        touch = first_touch(
+            self.candles.high,
+            self.candles.low,
+            self.candles.close,
+            starts=[10, 10, end],
+            ends=[10, 5, end + 10],
+            is_long=[True, False, True],
+            take_profit=[0, 0, 0],
+            stop_loss=[0, 1000, 0],
+        )
+        self.assertEqual(touch.index.tolist(), [-1, -1, -1])
+        self.assertEqual(touch.reason.tolist(), [EXIT_NONE] * 3)
+        self.assertTrue(np.isnan(touch.price).all())
+
+
+class FirstTriggerTest(SimpleTestCase):
+    def test_matches_candle_loop(self):
+        candles = random_candles(1000, seed=3)
+        entry_price = candles.open[0]
+        for side in ("LONG", "SHORT"):
+            direction = 1 if side == "LONG" else -1
+            for take_profits, stop_losses in (([0.5, 1], [1, 2]), ([3], [0.2])):
+                index, reason = candle_loop(
+                    candles,
+                    0,
+                    len(candles),
+                    side == "LONG",
+                    entry_price * (1 + direction * min(take_profits) / 100),
+                    entry_price * (1 - direction * min(stop_losses) / 100),
+                )
+                self.assertEqual(
+                    first_trigger(
+                        candles, side, entry_price, take_profits, stop_losses
+                    ),
+                    index if reason != EXIT_NONE else len(candles),
+                )
+
+    def test_tie(self):
+        self.assertEqual(first_trigger(tie_candles(), "LONG", 100, [1], [1]), 1)
+
+    def test_empty_candles(self):
+        self.assertEqual(first_trigger(Candles.empty(), "LONG", 100, [1], [1]), 0)
+
+
+class LevelTrade:
+    """A position with a fixed TP and SL, for sweep."""
+
+    every_candle = False
+
+    def __init__(
+        self, number: int, is_long: bool, take_profit: float, stop_loss: float
+    ):
+        self.number = number
+        self.is_long = is_long
+        self.take_profit = take_profit
+        self.stop_loss = stop_loss
+        self.reason = EXIT_NONE
+
+    def levels(self) -> tuple[float, float]:
+        if self.is_long:
+            return self.stop_loss, self.take_profit
+        return self.take_profit, self.stop_loss
+
+    def update(self, index: int, candle: Candle) -> bool:
+        if self.is_long:
+            if candle.low <= self.stop_loss:
+                self.reason = EXIT_STOP_LOSS
+            elif candle.high >= self.take_profit:
+                self.reason = EXIT_TAKE_PROFIT
+        elif candle.high >= self.stop_loss:
+            self.reason = EXIT_STOP_LOSS
+        elif candle.low <= self.take_profit:
+            self.reason = EXIT_TAKE_PROFIT
+        return self.reason != EXIT_NONE
+
+
+class SweepTest(SimpleTestCase):
+    def setUp(self):
+        self.candles = random_candles(1500, seed=4)
+        rng = np.random.default_rng(5)
+        # (start, end, number, is long, TP, SL), some with an empty window or
+        # starting after the last candle, which are never opened
+        self.positions = []
+        for number in range(200):
+            start = int(rng.integers(0, len(self.candles) + 5))
+            is_long = bool(rng.random() < 0.5)
+            direction = 1 if is_long else -1
+            entry_price = self.candles.open[start] if start < len(self.candles) else 100
+            self.positions.append(
+                (
+                    start,
+                    start + int(rng.integers(0, 600)),
+                    number,
+                    is_long,
+                    entry_price * (1 + direction * rng.uniform(0.1, 2) / 100),
+                    entry_price * (1 - direction * rng.uniform(0.1, 2) / 100),
+                )
+            )
+
+    def run_sweep(
+        self, candles: Candles, positions: list[tuple], one_at_a_time: bool = False
+    ) -> dict[int, tuple[int, int]]:
+        """Returns the exit index and reason per position number, positions
+        that were skipped are left out."""
+
+        exits = {}
+        open_numbers = set()
+
+        def open_trade(position: tuple, index: int):
+            if one_at_a_time and open_numbers:
+                return None
+            open_numbers.add(position[2])
+            return LevelTrade(*position[2:])
+
+        def close_trade(trade: LevelTrade, index: int) -> None:
+            open_numbers.discard(trade.number)
+            exits[trade.number] = (index, trade.reason)
+
+        def expire_trade(trade: LevelTrade) -> None:
+            open_numbers.discard(trade.number)
+            exits[trade.number] = (-1, EXIT_NONE)
+
+        sweep(
+            candles,
+            ((position[0], position[1], position) for position in positions),
+            open_trade,
+            close_trade,
+            expire_trade,
+        )
+        return exits
+
+    def test_matches_candle_loop(self):
+        exits = self.run_sweep(self.candles, self.positions)
+        for start, end, number, is_long, take_profit, stop_loss in self.positions:
+            if start >= min(end, len(self.candles)):
+                self.assertNotIn(number, exits)
+                continue
+            self.assertEqual(
+                exits[number],
+                candle_loop(self.candles, start, end, is_long, take_profit, stop_loss),
+            )
+
+    def test_one_position_at_a_time(self):
+        exits = self.run_sweep(self.candles, self.positions, one_at_a_time=True)
+        # a position is only opened after the one before it closed
+        free_from = 0
+        for start, end, number, is_long, take_profit, stop_loss in sorted(
+            self.positions, key=lambda position: position[0]
+        ):
+            if start >= min(end, len(self.candles)) or start < free_from:
+                self.assertNotIn(number, exits)
+                continue
+            index, reason = candle_loop(
+                self.candles, start, end, is_long, take_profit, stop_loss
+            )
+            self.assertEqual(exits[number], (index, reason))
+            # the entries of a candle come before its exits
+            free_from = end if reason == EXIT_NONE else index + 1
+
+    def test_stop_loss_wins_a_tie(self):
+        positions = [(0, 2, 0, True, 101, 99), (0, 2, 1, False, 99, 101)]
+        self.assertEqual(
+            self.run_sweep(tie_candles(), positions),
+            {0: (1, EXIT_STOP_LOSS), 1: (1, EXIT_STOP_LOSS)},
+        )
+
+    def test_empty_window(self):
+        positions = [
+            (1, 1, 0, True, 101, 99),
+            (5, 10, 1, True, 101, 99),
+            (1, 2, 2, True, 200, 1),
+        ]
+        self.assertEqual(self.run_sweep(tie_candles(), positions), {2: (-1, EXIT_NONE)})
@@ -1,12 +1,21 @@
 from rest_framework.routers import DefaultRouter
 from django.urls import include, path
 
-from project.apps.core.viewsets import UserViewset, PositionViewset
+from project.apps.core.viewsets import (
+    LiquidationViewset,
+    OHLCVViewset,
+    PositionViewset,
+    RSILiquidationViewset,
+    UserViewset,
+)
 
 
 router = DefaultRouter()
 router.register("users", UserViewset, basename="user")
 router.register("positions", PositionViewset, basename="position")
+router.register("ohlcv", OHLCVViewset, basename="ohlcv")
+router.register("liquidations", LiquidationViewset, basename="liquidation")
+router.register("rsi-liquidations", RSILiquidationViewset, basename="rsi-liquidation")
 
 urlpatterns = [
     path("", include(router.urls)),
@@ -4,3 +4,4 @@ from .what_if_per_hour import *
 from .what_if_rsi import *
 from .what_if_atr import *
 from .what_if_algorithm import *
+from .jobs import *
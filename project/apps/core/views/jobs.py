@@ -0,0 +1,176 @@
+from datetime import date
+from typing import Optional
+
+from django.conf import settings
+from django.http import HttpRequest, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import resolve, reverse
+from django.utils import timezone
+from django.views import View
+from django_tables2 import DateColumn, DateTimeColumn, tables
+
+from project.apps.core.jobs import JobProgress, enqueue_job, finish_job, job_data
+from project.apps.core.models import WhatIfJob
+from project.apps.core.result_cache import cached_job, result_cache, result_key
+
+
+# context of the what-if views that is not stored in the result of a job
+SKIPPED_CONTEXT = {"form", "view", "table"}
+
+
+def _value(value):
+    """Converts numpy scalars into values the result can store."""
+
+    return value.item() if hasattr(value, "item") else value
+
+
+def table_rows(table: tables.Table) -> list[dict]:
+    """Returns the values of the columns of the table per row."""
+
+    rows = []
+    for row in table.rows:
+        values = {
+            column.name: _value(column.accessor.resolve(row.record, quiet=True))
+            for column in table.columns
+        }
+        if hasattr(row.record, "admin_url"):
+            values["admin_url"] = row.record.admin_url
+        rows.append(values)
+    return rows
+
+
+def job_table(table_class: type[tables.Table], rows: list[dict]) -> tables.Table:
+    """Returns the table of stored rows, with their dates parsed again."""
+
+    rows = [dict(row) for row in rows]
+    for name, column in table_class.base_columns.items():
+        if isinstance(column, DateTimeColumn):
+            parse = timezone.datetime.fromisoformat
+        elif isinstance(column, DateColumn):
+            parse = date.fromisoformat
+        else:
+            continue
+        for row in rows:
+            if row.get(name):
+                row[name] = parse(row[name])
+    return table_class(rows)
+
+
+def job_view_class(job: WhatIfJob) -> type[View]:
+    return resolve(reverse(job.view)).func.view_class
+
+
+def job_result(context: dict) -> dict:
+    """Returns the context of a what-if view to store as the result of its
+    job."""
+
+    result = {
+        key: _value(value)
+        for key, value in context.items()
+        if key not in SKIPPED_CONTEXT
+    }
+    if "table" in context:
+        result["rows"] = table_rows(context["table"])
+    return result
+
+
+def run_what_if_job(job: WhatIfJob) -> dict:
+    """Runs the what-if view of the job on its form data and returns the
+    result to store."""
+
+    request = HttpRequest()
+    request.method = "POST"
+    request.POST = job_data(job)
+    view = job_view_class(job)()
+    view.setup(request)
+    view.job_progress = JobProgress(job)
+    view.capture_context = True
+    form = view.get_form()
+    if not form.is_valid():
+        raise ValueError(form.errors.as_text())
+    return job_result(view.form_valid(form))
+
+
+class WhatIfJobMixin:
+    """Runs the simulation of a valid form in a background job when
+    WHAT_IF_BACKGROUND_JOBS is set, see the run_what_if_workers command.
+
+    With cache_results a form submitted before on the same data version
+    returns the job of the earlier submission.
+    """
+
+    cache_results = False
+    capture_context = False
+    job_progress: Optional[JobProgress] = None
+
+    def post(self, request, *args, **kwargs):
+        form = self.get_form()
+        if not form.is_valid():
+            return self.form_invalid(form)
+        view = request.resolver_match.url_name
+        cache_key = result_key(view, form.cleaned_data) if self.cache_results else ""
+        if cache_key and (job := cached_job(cache_key)):
+            return redirect("what_if_job", job_id=job.id)
+        if settings.WHAT_IF_BACKGROUND_JOBS:
+            job = enqueue_job(view, request.POST, cache_key)
+            return redirect("what_if_job", job_id=job.id)
+        if not cache_key:
+            return self.form_valid(form)
+
+        # store the result as a finished job for the next submissions
+        self.capture_context = True
+        context = self.form_valid(form)
+        self.capture_context = False
+        finish_job(enqueue_job(view, request.POST, cache_key), job_result(context))
+        return self.render_to_response(context)
+
+    def report_progress(self, processed: int, total: int) -> None:
+        """Stores how many positions the job processed, outside a job it does
+        nothing."""
+
+        if self.job_progress:
+            self.job_progress(processed, total)
+
+    def render_to_response(self, context, **response_kwargs):
+        # a job stores the context instead of rendering it
+        if self.capture_context:
+            return context
+        return super().render_to_response(context, **response_kwargs)
+
+
+class WhatIfJobView(View):
+    """The form, table and chart of a what-if job, with its progress while
+    it runs."""
+
+    def get(self, request, job_id: int):
+        job = get_object_or_404(WhatIfJob.objects.defer("result"), id=job_id)
+        view_class = job_view_class(job)
+        context = {
+            "job": job,
+            "title": "What if analysis",
+            "form": view_class.form_class(data=job_data(job)),
+        }
+        if job.status == WhatIfJob.StatusChoices.DONE:
+            result = result_cache.get(job.cache_key) if job.cache_key else None
+            if result is None:
+                result = job.result
+                if job.cache_key:
+                    result_cache.put(job.cache_key, result)
+            result = dict(result)
+            rows = result.pop("rows", None)
+            context.update(result)
+            if rows is not None:
+                context["table"] = job_table(view_class.table_class, rows)
+        return render(request, view_class.template_name, context)
+
+
+class WhatIfJobStatusView(View):
+    """The status and progress of a what-if job as json, for polling."""
+
+    def get(self, request, job_id: int):
+        # without the result, which can be large
+        job = get_object_or_404(
+            WhatIfJob.objects.values("id", "status", "processed", "total", "error"),
+            id=job_id,
+        )
+        return JsonResponse(job)
@@ -2,12 +2,11 @@ import matplotlib.pyplot as plt
 import random
 import seaborn as sns
 
-from django.db.models import QuerySet
 from django_tables2 import SingleTableMixin
 from django_filters.views import FilterView
 
 from project.apps.core.filters import PositionFilterSet
-from project.apps.core.models import Position
+from project.apps.core.models import Position, PositionQuerySet
 from project.apps.core.tables import PositionTable
 
 from .helpers import COLOR_LIST, SNS_THEME, image_encoder, plotter
@@ -24,15 +23,6 @@ class PositionListView(SingleTableMixin, FilterView):
     def get_queryset(self):
         return super().get_queryset().filter(candles_before_entry=1).order_by("-start")
 
-    @property
-    def totals(self) -> dict:
-        """Calculate totals for the positions."""
-
-        return dict(
-            len_positions=len(self.object_list),
-            total_returns=sum(position.returns for position in self.object_list),
-        )
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
@@ -47,17 +37,18 @@ class PositionListView(SingleTableMixin, FilterView):
             },
         )
 
-        object_list: QuerySet[Position] = self.object_list.order_by("start")
+        # the equity curve comes from the database in one query, which also
+        # gives the totals
+        object_list: PositionQuerySet = self.object_list
+        returns = [
+            cumulative_returns
+            for _, cumulative_returns in object_list.cumulative_returns().iterator()
+        ]
 
         # x as
-        x_as_data = [str(i) for i in range(len(object_list))]
+        x_as_data = [str(i) for i in range(len(returns))]
 
         # y as
-        returns = []
-        total_returns = 0
-        for position in object_list:
-            total_returns += position.returns
-            returns.append(total_returns)
         y_as_data = [i for i in returns]
 
         # create plot
@@ -77,5 +68,6 @@ class PositionListView(SingleTableMixin, FilterView):
         # add image to context
         context["img"] = image_encoder(plotter(plt))
         context["title"] = "Position overview"
-
-        return context | self.totals
+        context["len_positions"] = len(returns)
+        context["total_returns"] = returns[-1] if returns else 0
+        return context
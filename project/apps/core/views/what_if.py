@@ -1,16 +1,20 @@
-from typing import Tuple
+from typing import Optional, Tuple
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mtick
 import random
+import numpy as np
 import seaborn as sns
 
 from django.db.models import QuerySet, Q
 from django.utils import timezone
 from django.views.generic.edit import FormView
 
+from project.apps.core.candles import prefetch_candles
 from project.apps.core.filters import PositionFilterSet
 from project.apps.core.forms import WhatIfForm
-from project.apps.core.models import Position, OHLCV
+from project.apps.core.indicators import RSI_PERIOD, body_rsi
+from project.apps.core.models import Position
+from project.apps.core.simulation import sweep
 from project.apps.core.tables import WhatIfPositionTable
 
 from .helpers import (
@@ -21,6 +25,7 @@ from .helpers import (
     plotter,
     WinStreak,
 )
+from .jobs import WhatIfJobMixin
 
 BLOFIN_MARKET_ORDER_FEE = 0.06 / 100  # 0.06% for non VIP users
 BLOFIN_LIMIT_ORDER_FEE = 0.02 / 100  # 0.002% for non VIP users
@@ -35,6 +40,7 @@ def process_position_what_if(
     object_list: list[Position],
     returns: list[float],
     dates: list[timezone.datetime],
+    closed_at: timezone.datetime,
 ) -> Tuple[int, int, float]:
     win = position.what_if_returns > 0
     if win:
@@ -47,7 +53,7 @@ def process_position_what_if(
     position.what_if_returns = f"$ {round(position.what_if_returns, 2):,}"
     object_list.insert(0, position)
     returns.append(total_returns)
-    dates.append(position.start)
+    dates.append(closed_at)
     return wins, losses, total_returns
 
 
@@ -96,7 +102,260 @@ def process_tp(
     return tp_finished, amount
 
 
-class PositionWhatIfView(FormView):
+class WhatIfTrade:
+    """An open position of the what-if sweep, with the state of its candle
+    loop."""
+
+    def __init__(
+        self,
+        position: Position,
+        data: dict,
+        entry_index: int,
+        sl: float,
+        tp: float,
+        rsi: Optional[np.ndarray],
+    ):
+        self.position = position
+        self.data = data
+        self.entry_index = entry_index
+        self.sl = sl
+        self.tp = tp
+        self.rsi = rsi
+        self.amount = position.amount
+        self.use_sl_to_entry: bool = data["use_sl_to_entry"]
+        self.partial_tps = [
+            (data[f"use_tp{number}"], data[f"tp{number}"], data[f"tp{number}_amount"])
+            for number in range(1, 5)
+        ]
+        self.partial_tps_finished = [False, False, False, False]
+        # TP1 of a SHORT is checked upwards like a LONG
+        self.partial_tp_directions = (
+            ["long", "long", "long", "long"]
+            if position.side == "LONG"
+            else ["long", "short", "short", "short"]
+        )
+        self.every_candle: bool = data["use_trailing_sl"]
+        if self.every_candle:
+            self.position_sl_price = (
+                position.entry_price * (1 - data["trailing_sl"] / 100)
+                if position.side == "LONG"
+                else position.entry_price * (1 + data["trailing_sl"] / 100)
+            )
+
+    def levels(self) -> Tuple[float, float]:
+        """Returns the highest low and the lowest high that reach a TP, SL, SL
+        to entry or RSI level."""
+
+        entry_price = self.position.entry_price
+        is_long = self.position.side == "LONG"
+        lower = []
+        upper = []
+        if is_long:
+            lower.append(entry_price - (entry_price * self.sl / 100))
+            upper.append(entry_price + (entry_price * self.tp / 100))
+        else:
+            upper.append(entry_price + (entry_price * self.sl / 100))
+            lower.append(entry_price - (entry_price * self.tp / 100))
+        if self.use_sl_to_entry:
+            distance = entry_price * (self.data["sl_to_entry"] / 100 * self.tp / 100)
+            if is_long:
+                upper.append(entry_price + distance)
+            else:
+                lower.append(entry_price - distance)
+        for (use_tp, tp, _), finished, direction in zip(
+            self.partial_tps, self.partial_tps_finished, self.partial_tp_directions
+        ):
+            if use_tp and not finished:
+                distance = entry_price * (tp / 100 * self.tp / 100)
+                if direction == "long":
+                    upper.append(entry_price + distance)
+                else:
+                    lower.append(entry_price - distance)
+        if self.rsi is not None:
+            distance = entry_price * (50 / 100 * self.tp / 100)
+            lower.append(entry_price - distance)
+            upper.append(entry_price + distance)
+        return max(lower), min(upper)
+
+    def update(self, index: int, candle) -> bool:
+        """Processes one candle, returns True when it closed the position."""
+
+        position = self.position
+        tp = self.tp
+        data = self.data
+
+        if position.side == "LONG":
+
+            # trailing SL
+            if data["use_trailing_sl"]:
+                self.position_sl_price = max(
+                    self.position_sl_price,
+                    position.entry_price - (position.entry_price * self.sl / 100),
+                    candle.high - (candle.high * data["trailing_sl"] / 100),
+                )
+
+                if candle.low <= self.position_sl_price:
+                    position.closing_price = round(self.position_sl_price, 1)
+                    fees_for_closing = (
+                        self.amount * position.closing_price * BLOFIN_MARKET_ORDER_FEE
+                    )
+                    position.what_if_returns -= fees_for_closing
+                    loss_or_win = (
+                        position.entry_price - self.position_sl_price
+                    ) * self.amount
+                    position.what_if_returns -= loss_or_win
+                    return True
+
+            # SL
+            if candle.low <= position.entry_price - (
+                position.entry_price * self.sl / 100
+            ):
+                position.closing_price = round(
+                    position.entry_price - (position.entry_price * self.sl / 100), 1
+                )
+                fees_for_closing = (
+                    self.amount * position.closing_price * BLOFIN_MARKET_ORDER_FEE
+                )
+                position.what_if_returns -= fees_for_closing
+                loss = (position.entry_price * self.sl / 100) * self.amount
+                position.what_if_returns -= loss
+                return True
+
+            # SL to entry
+            if self.use_sl_to_entry and candle.high > position.entry_price + (
+                position.entry_price * (data["sl_to_entry"] / 100 * tp / 100)
+            ):
+                self.sl = -self.sl
+                self.use_sl_to_entry = False  # only use once
+
+            # TP1 - TP4
+            self.process_partial_tps(candle)
+
+            # final TP
+            if candle.high >= position.entry_price + (position.entry_price * tp / 100):
+                position.closing_price = round(
+                    position.entry_price + (position.entry_price * tp / 100), 1
+                )
+                fees_for_closing = (
+                    self.amount * position.entry_price * BLOFIN_LIMIT_ORDER_FEE
+                )
+                position.what_if_returns -= fees_for_closing
+                local_win = (position.entry_price * tp / 100) * self.amount
+                position.what_if_returns += local_win
+                return True
+
+        if position.side == "SHORT":
+
+            # trailing SL
+            if data["use_trailing_sl"]:
+                self.position_sl_price = min(
+                    self.position_sl_price,
+                    position.entry_price + (position.entry_price * self.sl / 100),
+                    candle.low + (candle.low * data["trailing_sl"] / 100),
+                )
+
+                if candle.high >= self.position_sl_price:
+                    position.closing_price = round(self.position_sl_price, 1)
+                    fees_for_closing = (
+                        self.amount * position.closing_price * BLOFIN_MARKET_ORDER_FEE
+                    )
+                    position.what_if_returns -= fees_for_closing
+                    loss_or_win = (
+                        self.position_sl_price - position.entry_price
+                    ) * self.amount
+                    position.what_if_returns -= loss_or_win
+                    return True
+
+            # SL
+            if candle.high >= position.entry_price + (
+                position.entry_price * self.sl / 100
+            ):
+                position.closing_price = round(
+                    position.entry_price + (position.entry_price * self.sl / 100), 1
+                )
+                fees_for_closing = (
+                    self.amount * position.closing_price * BLOFIN_MARKET_ORDER_FEE
+                )
+                position.what_if_returns -= fees_for_closing
+                loss = (position.entry_price * self.sl / 100) * self.amount
+                position.what_if_returns -= loss
+                return True
+
+            # SL to entry
+            if self.use_sl_to_entry and candle.low < position.entry_price - (
+                position.entry_price * (data["sl_to_entry"] / 100 * tp / 100)
+            ):
+                self.sl = -self.sl
+                self.use_sl_to_entry = False  # only use once
+
+            # TP1 - TP4
+            self.process_partial_tps(candle)
+
+            # final TP
+            if candle.low <= position.entry_price - (position.entry_price * tp / 100):
+                position.closing_price = round(
+                    position.entry_price - (position.entry_price * tp / 100), 1
+                )
+                fees_for_closing = (
+                    self.amount * position.closing_price * BLOFIN_LIMIT_ORDER_FEE
+                )
+                position.what_if_returns -= fees_for_closing
+                local_wins = (position.entry_price * tp / 100) * self.amount
+                position.what_if_returns += local_wins
+                return True
+
+        # the RSI of the candles since the entry
+        rsi = (
+            float(self.rsi[index])
+            if self.rsi is not None and index - self.entry_index >= RSI_PERIOD - 1
+            else None
+        )
+        if rsi is not None and (
+            candle.low
+            <= position.entry_price - (position.entry_price * (50 / 100 * tp / 100))
+            or candle.high
+            >= position.entry_price + (position.entry_price * (50 / 100 * tp / 100))
+        ):
+            # check RSI conditions
+            if position.side == "LONG" and rsi >= data["rsi_upper"] and self.amount > 0:
+                sell_amount = self.amount * (data["rsi_sell_percentage"] / 100)
+                fees_for_closing = sell_amount * candle.close * BLOFIN_MARKET_ORDER_FEE
+                position.what_if_returns -= fees_for_closing
+                local_win = (candle.close - position.entry_price) * sell_amount
+                position.what_if_returns += local_win
+                self.amount -= sell_amount
+
+            if (
+                position.side == "SHORT"
+                and rsi <= data["rsi_lower"]
+                and self.amount > 0
+            ):
+                sell_amount = self.amount * (data["rsi_sell_percentage"] / 100)
+                fees_for_closing = sell_amount * candle.close * BLOFIN_MARKET_ORDER_FEE
+                position.what_if_returns -= fees_for_closing
+                local_win = (position.entry_price - candle.close) * sell_amount
+                position.what_if_returns += local_win
+                self.amount -= sell_amount
+        return False
+
+    def process_partial_tps(self, candle) -> None:
+        for number, ((use_tp, tp, tp_amount), direction) in enumerate(
+            zip(self.partial_tps, self.partial_tp_directions)
+        ):
+            self.partial_tps_finished[number], self.amount = process_tp(
+                use_tp=use_tp,
+                tp_finished=self.partial_tps_finished[number],
+                direction=direction,
+                general_tp=self.tp,
+                tp=tp,
+                tp_amount=tp_amount,
+                position=self.position,
+                candle=candle,
+                amount=self.amount,
+            )
+
+
+class PositionWhatIfView(WhatIfJobMixin, FormView):
     """List view for positions with table and filter functionality."""
 
     template_name = "core/what_if.html"
@@ -104,6 +363,7 @@ class PositionWhatIfView(FormView):
     table_class = WhatIfPositionTable
     filterset_class = PositionFilterSet
     form_class = WhatIfForm
+    cache_results = True
 
     def form_valid(self, form: WhatIfForm):
         plt.rcParams["axes.prop_cycle"] = plt.cycler(color=COLOR_LIST)
@@ -166,33 +426,35 @@ class PositionWhatIfView(FormView):
         wins = 0
         losses = 0
         win_streak = WinStreak()
-        sl_to_entry: float = form.cleaned_data["sl_to_entry"]
-        use_tp1: bool = form.cleaned_data["use_tp1"]
-        tp1: float = form.cleaned_data["tp1"]
-        tp1_amount: float = form.cleaned_data["tp1_amount"]
-        use_tp2: bool = form.cleaned_data["use_tp2"]
-        tp2: float = form.cleaned_data["tp2"]
-        tp2_amount: float = form.cleaned_data["tp2_amount"]
-        use_tp3: bool = form.cleaned_data["use_tp3"]
-        tp3: float = form.cleaned_data["tp3"]
-        tp3_amount: float = form.cleaned_data["tp3_amount"]
-        use_tp4: bool = form.cleaned_data["use_tp4"]
-        tp4: float = form.cleaned_data["tp4"]
-        tp4_amount: float = form.cleaned_data["tp4_amount"]
         no_overlap: bool = form.cleaned_data["no_overlap"]
-        use_trailing_sl: bool = form.cleaned_data["use_trailing_sl"]
-        trailing_sl: float = form.cleaned_data["trailing_sl"]
         compound: bool = form.cleaned_data["compound"]
-        last_long_candle_datetime = None
-        last_short_candle_datetime = None
         percentage_per_trade: float = form.cleaned_data["percentage_per_trade"]
         use_rsi: bool = form.cleaned_data["use_rsi"]
-        rsi_lower: int = form.cleaned_data["rsi_lower"]
-        rsi_upper: int = form.cleaned_data["rsi_upper"]
-        rsi_sell_percentage: float = form.cleaned_data["rsi_sell_percentage"]
 
+        # all positions are simulated in one chronological pass over the
+        # candles, so compounding and overlap see the trades that closed
+        # before each entry
+        positions = list(positions)
+        windows = [
+            (
+                position.start.replace(second=0, microsecond=0),
+                position.start + timezone.timedelta(days=28),
+            )
+            for position in positions
+        ]
+        candles = prefetch_candles("BTC/USDT:USDT", "5m", windows)
+        rsi_values = body_rsi(candles.open, candles.close) if use_rsi else None
+        open_trades = {"LONG": 0, "SHORT": 0}
         object_list: list[Position] = []
-        for position in positions:
+        entered = 0
+
+        def open_trade(position: Position, index: int) -> Optional[WhatIfTrade]:
+            nonlocal entered
+            self.report_progress(entered, len(positions))
+            entered += 1
+            # prevent overlapping trades if no_overlap is checked
+            if no_overlap and open_trades[position.side]:
+                return None
             match position.strategy_type:
                 case "reversed":
                     sl: float = form.cleaned_data["reversed_sl"]
@@ -201,414 +463,57 @@ class PositionWhatIfView(FormView):
                     sl: float = form.cleaned_data["live_sl"]
                     tp: float = form.cleaned_data["live_tp"]
             position.what_if_returns = 0
-            use_sl_to_entry: bool = form.cleaned_data["use_sl_to_entry"]
-            iso_datetime = (
-                f"{position.start.year}-"
-                f"{position.start.month:02d}-"
-                f"{position.start.day:02d} "
-                f"{position.start.hour:02d}:{position.start.minute:02d}:00"
+            open_price = float(candles.open[index])
+            position.entry_price = round(
+                (
+                    open_price * 1.0001
+                    if position.side == "SHORT"
+                    else open_price * 0.9999
+                ),
+                1,
+            )
+            position.amount = round(
+                (total_returns if compound else INITIAL_CAPITAL)
+                / sl
+                / position.entry_price
+                * percentage_per_trade,
+                4,
+            )
+            fees_for_opening = (
+                position.amount * position.entry_price * BLOFIN_LIMIT_ORDER_FEE
+            )
+            position.what_if_returns -= fees_for_opening
+            open_trades[position.side] += 1
+            return WhatIfTrade(position, form.cleaned_data, index, sl, tp, rsi_values)
+
+        def close_trade(trade: WhatIfTrade, index: int) -> None:
+            nonlocal wins, losses, total_returns
+            open_trades[trade.position.side] -= 1
+            wins, losses, total_returns = process_position_what_if(
+                wins,
+                losses,
+                win_streak,
+                total_returns,
+                trade.position,
+                object_list,
+                returns,
+                dates,
+                candles[index].datetime,
             )
-            ohlcv_s = OHLCV.objects.filter(
-                datetime__gte=timezone.datetime.fromisoformat(iso_datetime),
-                datetime__lt=position.start + timezone.timedelta(days=28),
-                timeframe="5m",
-                symbol="BTC/USDT:USDT",
-            ).order_by("datetime")
-            tp1_finished = False
-            tp2_finished = False
-            tp3_finished = False
-            tp4_finished = False
-            if ohlcv_s.exists():
-                position.entry_price = round(
-                    (
-                        ohlcv_s.first().open * 1.0001
-                        if position.side == "SHORT"
-                        else ohlcv_s.first().open * 0.9999
-                    ),
-                    1,
-                )
-                position.amount = round(
-                    (total_returns if compound else INITIAL_CAPITAL)
-                    / sl
-                    / position.entry_price
-                    * percentage_per_trade,
-                    4,
-                )
-                amount = position.amount
-                fees_for_opening = (
-                    position.amount * position.entry_price * BLOFIN_LIMIT_ORDER_FEE
-                )
-                position.what_if_returns -= fees_for_opening
-                if use_trailing_sl:
-                    position_sl_price = (
-                        position.entry_price * (1 - trailing_sl / 100)
-                        if position.side == "LONG"
-                        else position.entry_price * (1 + trailing_sl / 100)
-                    )
-
-            # prevent overlapping trades if no_overlap is checked
-            if no_overlap:
-                if (
-                    position.side == "LONG"
-                    and last_long_candle_datetime
-                    and ohlcv_s.first().datetime < last_long_candle_datetime
-                ) or (
-                    position.side == "SHORT"
-                    and last_short_candle_datetime
-                    and ohlcv_s.first().datetime < last_short_candle_datetime
-                ):
-                    continue
-
-            rsi_candles = []
-            for candle in ohlcv_s:
-
-                if position.side == "LONG":
-
-                    # trailing SL
-                    if use_trailing_sl:
-                        position_sl_price = max(
-                            position_sl_price,
-                            position.entry_price - (position.entry_price * sl / 100),
-                            candle.high - (candle.high * trailing_sl / 100),
-                        )
-
-                        if candle.low <= position_sl_price:
-                            position.closing_price = round(position_sl_price, 1)
-                            fees_for_closing = (
-                                amount
-                                * position.closing_price
-                                * BLOFIN_MARKET_ORDER_FEE
-                            )
-                            position.what_if_returns -= fees_for_closing
-                            loss_or_win = (
-                                position.entry_price - position_sl_price
-                            ) * amount
-                            position.what_if_returns -= loss_or_win
-                            win = position.what_if_returns > 0
-                            if win:
-                                wins += 1
-                                win_streak.record_win()
-                            else:
-                                losses += 1
-                                win_streak.record_loss()
-                            total_returns += position.what_if_returns
-                            position.what_if_returns = (
-                                f"$ {round(position.what_if_returns, 2):,}"
-                            )
-                            object_list.insert(0, position)
-                            returns.append(total_returns)
-                            dates.append(position.start)
-                            last_long_candle_datetime = candle.datetime
-                            break
-
-                    # SL
-                    if candle.low <= position.entry_price - (
-                        position.entry_price * sl / 100
-                    ):
-                        position.closing_price = round(
-                            position.entry_price - (position.entry_price * sl / 100), 1
-                        )
-                        fees_for_closing = (
-                            amount * position.closing_price * BLOFIN_MARKET_ORDER_FEE
-                        )
-                        position.what_if_returns -= fees_for_closing
-                        loss = (position.entry_price * sl / 100) * amount
-                        position.what_if_returns -= loss
-                        wins, losses, total_returns = process_position_what_if(
-                            wins,
-                            losses,
-                            win_streak,
-                            total_returns,
-                            position,
-                            object_list,
-                            returns,
-                            dates,
-                        )
-                        last_long_candle_datetime = candle.datetime
-                        break
-
-                    # SL to entry
-                    if use_sl_to_entry and candle.high > position.entry_price + (
-                        position.entry_price * (sl_to_entry / 100 * tp / 100)
-                    ):
-                        sl = -sl
-                        use_sl_to_entry = False  # only use once
-
-                    # TP1
-                    tp1_finished, amount = process_tp(
-                        use_tp=use_tp1,
-                        tp_finished=tp1_finished,
-                        direction="long",
-                        general_tp=tp,
-                        tp=tp1,
-                        tp_amount=tp1_amount,
-                        position=position,
-                        candle=candle,
-                        amount=amount,
-                    )
-
-                    # TP2
-                    tp2_finished, amount = process_tp(
-                        use_tp=use_tp2,
-                        tp_finished=tp2_finished,
-                        direction="long",
-                        general_tp=tp,
-                        tp=tp2,
-                        tp_amount=tp2_amount,
-                        position=position,
-                        candle=candle,
-                        amount=amount,
-                    )
-
-                    # TP3
-                    tp3_finished, amount = process_tp(
-                        use_tp=use_tp3,
-                        tp_finished=tp3_finished,
-                        direction="long",
-                        general_tp=tp,
-                        tp=tp3,
-                        tp_amount=tp3_amount,
-                        position=position,
-                        candle=candle,
-                        amount=amount,
-                    )
-
-                    # TP4
-                    tp4_finished, amount = process_tp(
-                        use_tp=use_tp4,
-                        tp_finished=tp4_finished,
-                        direction="long",
-                        general_tp=tp,
-                        tp=tp4,
-                        tp_amount=tp4_amount,
-                        position=position,
-                        candle=candle,
-                        amount=amount,
-                    )
-
-                    # final TP
-                    if candle.high >= position.entry_price + (
-                        position.entry_price * tp / 100
-                    ):
-                        position.closing_price = round(
-                            position.entry_price + (position.entry_price * tp / 100), 1
-                        )
-                        fees_for_closing = (
-                            amount * position.entry_price * BLOFIN_LIMIT_ORDER_FEE
-                        )
-                        position.what_if_returns -= fees_for_closing
-                        local_win = (position.entry_price * tp / 100) * amount
-                        position.what_if_returns += local_win
-                        wins, losses, total_returns = process_position_what_if(
-                            wins,
-                            losses,
-                            win_streak,
-                            total_returns,
-                            position,
-                            object_list,
-                            returns,
-                            dates,
-                        )
-                        last_long_candle_datetime = candle.datetime
-                        break
-
-                if position.side == "SHORT":
-
-                    # trailing SL
-                    if use_trailing_sl:
-                        position_sl_price = min(
-                            position_sl_price,
-                            position.entry_price + (position.entry_price * sl / 100),
-                            candle.low + (candle.low * trailing_sl / 100),
-                        )
-
-                        if candle.high >= position_sl_price:
-                            position.closing_price = round(position_sl_price, 1)
-                            fees_for_closing = (
-                                amount
-                                * position.closing_price
-                                * BLOFIN_MARKET_ORDER_FEE
-                            )
-                            position.what_if_returns -= fees_for_closing
-                            loss_or_win = (
-                                position_sl_price - position.entry_price
-                            ) * amount
-                            position.what_if_returns -= loss_or_win
-                            wins, losses, total_returns = process_position_what_if(
-                                wins,
-                                losses,
-                                win_streak,
-                                total_returns,
-                                position,
-                                object_list,
-                                returns,
-                                dates,
-                            )
-                            last_short_candle_datetime = candle.datetime
-                            break
-
-                    # SL
-                    if candle.high >= position.entry_price + (
-                        position.entry_price * sl / 100
-                    ):
-                        position.closing_price = round(
-                            position.entry_price + (position.entry_price * sl / 100), 1
-                        )
-                        fees_for_closing = (
-                            amount * position.closing_price * BLOFIN_MARKET_ORDER_FEE
-                        )
-                        position.what_if_returns -= fees_for_closing
-                        loss = (position.entry_price * sl / 100) * amount
-                        position.what_if_returns -= loss
-                        wins, losses, total_returns = process_position_what_if(
-                            wins,
-                            losses,
-                            win_streak,
-                            total_returns,
-                            position,
-                            object_list,
-                            returns,
-                            dates,
-                        )
-                        last_short_candle_datetime = candle.datetime
-                        break
-
-                    # SL to entry
-                    if use_sl_to_entry and candle.low < position.entry_price - (
-                        position.entry_price * (sl_to_entry / 100 * tp / 100)
-                    ):
-                        sl = -sl
-                        use_sl_to_entry = False  # only use once
-
-                    # TP1
-                    tp1_finished, amount = process_tp(
-                        use_tp=use_tp1,
-                        tp_finished=tp1_finished,
-                        direction="long",
-                        general_tp=tp,
-                        tp=tp1,
-                        tp_amount=tp1_amount,
-                        position=position,
-                        candle=candle,
-                        amount=amount,
-                    )
-
-                    # TP2
-                    tp2_finished, amount = process_tp(
-                        use_tp=use_tp2,
-                        tp_finished=tp2_finished,
-                        direction="short",
-                        general_tp=tp,
-                        tp=tp2,
-                        tp_amount=tp2_amount,
-                        position=position,
-                        candle=candle,
-                        amount=amount,
-                    )
-
-                    # TP3
-                    tp3_finished, amount = process_tp(
-                        use_tp=use_tp3,
-                        tp_finished=tp3_finished,
-                        direction="short",
-                        general_tp=tp,
-                        tp=tp3,
-                        tp_amount=tp3_amount,
-                        position=position,
-                        candle=candle,
-                        amount=amount,
-                    )
-
-                    # TP4
-                    tp4_finished, amount = process_tp(
-                        use_tp=use_tp4,
-                        tp_finished=tp4_finished,
-                        direction="short",
-                        general_tp=tp,
-                        tp=tp4,
-                        tp_amount=tp4_amount,
-                        position=position,
-                        candle=candle,
-                        amount=amount,
-                    )
 
-                    # final TP
-                    if candle.low <= position.entry_price - (
-                        position.entry_price * tp / 100
-                    ):
-                        position.closing_price = round(
-                            position.entry_price - (position.entry_price * tp / 100), 1
-                        )
-                        fees_for_closing = (
-                            amount * position.closing_price * BLOFIN_LIMIT_ORDER_FEE
-                        )
-                        position.what_if_returns -= fees_for_closing
-                        local_wins = (position.entry_price * tp / 100) * amount
-                        position.what_if_returns += local_wins
-                        wins, losses, total_returns = process_position_what_if(
-                            wins,
-                            losses,
-                            win_streak,
-                            total_returns,
-                            position,
-                            object_list,
-                            returns,
-                            dates,
-                        )
-                        last_short_candle_datetime = candle.datetime
-                        break
-
-                rsi_candles.append(candle)
-                if (
-                    use_rsi
-                    and len(rsi_candles) >= 14
-                    and (
-                        candle.low
-                        <= position.entry_price
-                        - (position.entry_price * (50 / 100 * tp / 100))
-                        or candle.high
-                        >= position.entry_price
-                        + (position.entry_price * (50 / 100 * tp / 100))
-                    )
-                ):
-                    rsi_candles = rsi_candles[-14:]  # keep only last 14 candles
-                    # calculate RSI
-                    rsi_gains = []
-                    rsi_losses = []
-                    for i in range(0, 14):
-                        change = rsi_candles[i].close - rsi_candles[i].open
-                        if change > 0:
-                            rsi_gains.append(change)
-                        else:
-                            rsi_losses.append(abs(change))
-                    average_gain = sum(rsi_gains) / 14 if rsi_gains else 0
-                    average_loss = sum(rsi_losses) / 14 if rsi_losses else 0
-                    if average_loss == 0:
-                        rsi = 100
-                    else:
-                        rs = average_gain / average_loss
-                        rsi = 100 - (100 / (1 + rs))
-
-                    # check RSI conditions
-                    if position.side == "LONG" and rsi >= rsi_upper and amount > 0:
-                        sell_amount = amount * (rsi_sell_percentage / 100)
-                        fees_for_closing = (
-                            sell_amount * candle.close * BLOFIN_MARKET_ORDER_FEE
-                        )
-                        position.what_if_returns -= fees_for_closing
-                        local_win = (candle.close - position.entry_price) * sell_amount
-                        position.what_if_returns += local_win
-                        amount -= sell_amount
-
-                    if position.side == "SHORT" and rsi <= rsi_lower and amount > 0:
-                        sell_amount = amount * (rsi_sell_percentage / 100)
-                        fees_for_closing = (
-                            sell_amount * candle.close * BLOFIN_MARKET_ORDER_FEE
-                        )
-                        position.what_if_returns -= fees_for_closing
-                        local_win = (position.entry_price - candle.close) * sell_amount
-                        position.what_if_returns += local_win
-                        amount -= sell_amount
+        def expire_trade(trade: WhatIfTrade) -> None:
+            open_trades[trade.position.side] -= 1
+
+        sweep(
+            candles,
+            [
+                (candles.index(start), candles.index(end), position)
+                for (start, end), position in zip(windows, positions)
+            ],
+            open_trade,
+            close_trade,
+            expire_trade,
+        )
 
         # y as
         y_as_data = [i for i in returns]
@@ -1,18 +1,23 @@
-import os
 from typing import Tuple
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mtick
 import random
-import pandas as pd
 import seaborn as sns
 
 from django.db.models import QuerySet, Q
 from django.utils import timezone
 from django.views.generic.edit import FormView
 
+from project.apps.core.algorithm_input import algorithm_inputs
+from project.apps.core.candles import prefetch_candles
 from project.apps.core.filters import PositionFilterSet
+from project.apps.core.first_passage import (
+    first_passage_trigger,
+    get_first_passage_index,
+)
 from project.apps.core.forms import WhatIfAlgorithmForm
-from project.apps.core.models import Position, OHLCV
+from project.apps.core.indicators import RSI
+from project.apps.core.models import AlgorithmInput, Position, OHLCV
 from project.apps.core.tables import WhatIfPositionTable
 
 from .helpers import (
@@ -24,6 +29,7 @@ from .helpers import (
     plotter,
     WinStreak,
 )
+from .jobs import WhatIfJobMixin
 
 BLOFIN_MARKET_ORDER_FEE = 0.06 / 100  # 0.06% for non VIP users
 BLOFIN_LIMIT_ORDER_FEE = 0.02 / 100  # 0.002% for non VIP users
@@ -106,7 +112,7 @@ def process_tp(
     return tp_finished, amount
 
 
-class PositionWhatIfAlgorithmView(FormView):
+class PositionWhatIfAlgorithmView(WhatIfJobMixin, FormView):
     """List view for positions with table and filter functionality."""
 
     template_name = "core/what_if.html"
@@ -163,7 +169,11 @@ class PositionWhatIfAlgorithmView(FormView):
         if max_liquidation_rsi := form.cleaned_data.get("max_liquidation_rsi"):
             positions = positions.filter(liquidation_rsi__lte=max_liquidation_rsi)
 
-        positions = positions.distinct().order_by("liquidation_datetime")
+        positions = (
+            positions.distinct()
+            .select_related("first_passage_index")
+            .order_by("liquidation_datetime")
+        )
 
         wins = 0
         losses = 0
@@ -197,56 +207,44 @@ class PositionWhatIfAlgorithmView(FormView):
         rsi_sell_percentage: float = form.cleaned_data["rsi_sell_percentage"]
         use_only_2r_trades: bool = form.cleaned_data["use_only_2r_trades"]
 
-        object_list: list[Position] = []
-        for position in positions:
-            sl__to_entry_finished = False
-            try:
-                try:
-                    algorithm_input: pd.DataFrame = pd.read_csv(
-                        f"data/algorithm_input-{position.symbol}-{position.liquidation_datetime.date()}-{position.strategy_type}-lvl2.csv"
-                    )
-                except:
-                    algorithm_input: pd.DataFrame = pd.read_csv(
-                        f"data/algorithm_input-{position.symbol}-{position.liquidation_datetime.date() - timezone.timedelta(days=position.liquidation_datetime.weekday())}-{position.strategy_type}-lvl2.csv"
-                    )
-            except:
-                print("lvl2 error")
-                file_names = os.listdir("data/")
-                file_names = [
-                    name
-                    for name in os.listdir("data/")
-                    if os.path.isfile(os.path.join("data/", name))
-                ]
-                file_names = [
-                    name
-                    for name in file_names
-                    if (
-                        name.startswith(f"algorithm_input-{position.symbol}-")
-                        and position.strategy_type in name
-                        and name.endswith("-lvl2.csv")
-                    )
-                ]
-                file_names.sort()
-                last_file_name = file_names[-1]
-                algorithm_input: pd.DataFrame = pd.read_csv(f"data/{last_file_name}")
-            hour = position.liquidation_datetime.hour
-            trade_lvl2: bool = False
-            tp: float = 0.0
-            sl: float = 0.0
-            performance_lvl2: float = 0.0
-            performance_lvl1: float = 0.0
-            for row in algorithm_input.itertuples():
-                if row.hour == hour:
-                    tp, sl, performance_lvl1, performance_lvl2, trade_lvl2 = (
-                        row.tp,
-                        row.sl,
-                        row.performance_lvl1,
-                        row.performance_lvl2,
-                        row.trade_lvl2,
+        # the candles of all positions in one go per symbol, sliced per position
+        positions = list(positions)
+        candles = {
+            symbol: prefetch_candles(
+                symbol_convertor.get(symbol),
+                "5m",
+                [
+                    (
+                        position.start.replace(second=0, microsecond=0),
+                        position.start.replace(second=0, microsecond=0)
+                        + timezone.timedelta(days=28),
                     )
+                    for position in positions
+                    if position.symbol == symbol
+                ],
+            )
+            for symbol in {position.symbol for position in positions}
+        }
 
-            if not trade_lvl2:
+        object_list: list[Position] = []
+        lvl2_inputs = {}
+        for number, position in enumerate(positions):
+            self.report_progress(number, len(positions))
+            sl__to_entry_finished = False
+            key = (position.symbol, position.strategy_type)
+            if key not in lvl2_inputs:
+                lvl2_inputs[key] = algorithm_inputs(
+                    *key, AlgorithmInput.LevelChoices.LVL2
+                )
+            # the latest lvl2 input generated before the liquidation
+            algorithm_input = lvl2_inputs[key].get(
+                position.liquidation_datetime, hour=position.liquidation_datetime.hour
+            )
+            if not algorithm_input or not algorithm_input.trade_lvl2:
                 continue
+            tp: float = algorithm_input.tp
+            sl: float = algorithm_input.sl
+            performance_lvl2: float = algorithm_input.performance_lvl2
 
             if use_only_2r_trades:
                 sl = sl * 1.5
@@ -254,12 +252,9 @@ class PositionWhatIfAlgorithmView(FormView):
 
             position.what_if_returns = 0
             position.start = position.start.replace(second=0, microsecond=0)
-            ohlcv_s = OHLCV.objects.filter(
-                symbol=symbol_convertor.get(position.symbol),
-                datetime__gte=position.start,
-                datetime__lt=position.start + timezone.timedelta(days=28),
-                timeframe="5m",
-            ).order_by("datetime")
+            ohlcv_s = candles[position.symbol].window(
+                position.start, position.start + timezone.timedelta(days=28)
+            )
             tp1_finished = False
             tp2_finished = False
             tp3_finished = False
@@ -311,8 +306,39 @@ class PositionWhatIfAlgorithmView(FormView):
                 ):
                     continue
 
-            rsi_candles = []
-            for candle in ohlcv_s:
+            # skip the candles that cannot reach any TP, SL or RSI level
+            skip = 0
+            if not use_trailing_sl:
+                take_profit_distances = [
+                    tp,
+                    *(
+                        partial_tp * tp / 100
+                        for use_partial_tp, partial_tp in (
+                            (use_tp1, tp1),
+                            (use_tp2, tp2),
+                            (use_tp3, tp3),
+                            (use_tp4, tp4),
+                        )
+                        if use_partial_tp
+                    ),
+                ]
+                stop_loss_distances = [sl]
+                if use_sl_to_entry:
+                    take_profit_distances.append(sl_to_entry * tp / 100)
+                if use_rsi:
+                    take_profit_distances.append(50 / 100 * tp)
+                    stop_loss_distances.append(50 / 100 * tp)
+                skip = first_passage_trigger(
+                    ohlcv_s,
+                    get_first_passage_index(position),
+                    position.side,
+                    position.entry_price,
+                    take_profit_distances,
+                    stop_loss_distances,
+                )
+
+            rsi_indicator = RSI(candles=ohlcv_s[max(skip - 14, 0) : skip])
+            for candle in ohlcv_s[skip:]:
 
                 if position.side == "LONG":
 
@@ -648,37 +674,15 @@ class PositionWhatIfAlgorithmView(FormView):
                         last_short_candle_datetime = candle.datetime
                         break
 
-                rsi_candles.append(candle)
-                if (
-                    use_rsi
-                    and len(rsi_candles) >= 14
-                    and (
-                        candle.low
-                        <= position.entry_price
-                        - (position.entry_price * (50 / 100 * tp / 100))
-                        or candle.high
-                        >= position.entry_price
-                        + (position.entry_price * (50 / 100 * tp / 100))
-                    )
+                rsi = rsi_indicator.update(candle) if use_rsi else None
+                if rsi is not None and (
+                    candle.low
+                    <= position.entry_price
+                    - (position.entry_price * (50 / 100 * tp / 100))
+                    or candle.high
+                    >= position.entry_price
+                    + (position.entry_price * (50 / 100 * tp / 100))
                 ):
-                    rsi_candles = rsi_candles[-14:]  # keep only last 14 candles
-                    # calculate RSI
-                    rsi_gains = []
-                    rsi_losses = []
-                    for i in range(0, 14):
-                        change = rsi_candles[i].close - rsi_candles[i].open
-                        if change > 0:
-                            rsi_gains.append(change)
-                        else:
-                            rsi_losses.append(abs(change))
-                    average_gain = sum(rsi_gains) / 14 if rsi_gains else 0
-                    average_loss = sum(rsi_losses) / 14 if rsi_losses else 0
-                    if average_loss == 0:
-                        rsi = 100
-                    else:
-                        rs = average_gain / average_loss
-                        rsi = 100 - (100 / (1 + rs))
-
                     # check RSI conditions
                     if position.side == "LONG" and rsi >= rsi_upper and amount > 0:
                         sell_amount = amount * (rsi_sell_percentage / 100)
@@ -1,16 +1,30 @@
 from typing import Tuple
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mtick
+import numpy as np
 import random
 import seaborn as sns
 
-from django.db.models import QuerySet, Q
+from django.db.models import Max, Min, QuerySet, Q
 from django.utils import timezone
 from django.views.generic.edit import FormView
 
+from project.apps.core.candles import Candles, prefetch_candles
 from project.apps.core.filters import PositionFilterSet
+from project.apps.core.first_passage import (
+    first_passage_trigger,
+    get_first_passage_index,
+)
 from project.apps.core.forms import WhatIfForm
-from project.apps.core.models import Position, OHLCV
+from project.apps.core.indicators import (
+    ATR,
+    ATR_PERIOD,
+    RSI,
+    average_true_range,
+    get_indicators,
+    wilder_average,
+)
+from project.apps.core.models import Position
 from project.apps.core.tables import WhatIfPositionTable
 
 from .helpers import (
@@ -21,9 +35,36 @@ from .helpers import (
     plotter,
     WinStreak,
 )
+from .jobs import WhatIfJobMixin
 
 BLOFIN_MARKET_ORDER_FEE = 0.06 / 100  # 0.06% for non VIP users
 BLOFIN_LIMIT_ORDER_FEE = 0.02 / 100  # 0.002% for non VIP users
+# the candles before the entry the ATR is computed from without an Indicator row
+ATR_WARMUP = timezone.timedelta(minutes=5 * 10 * ATR_PERIOD)
+
+
+def entry_atr(
+    indicators: dict[timezone.datetime, tuple],
+    candles: Candles,
+    entry: timezone.datetime,
+) -> float:
+    """Returns the ATR of the candle before the entry as a percentage of its
+    close, from the Indicator table or, when the candle has no row yet, from
+    the candles before the entry. 0 without any candle before the entry."""
+
+    window = candles.window(entry - ATR_WARMUP, entry)
+    if not window.exists():
+        return 0
+    candle_before_entry = window.last()
+    _, atr, _ = indicators.get(candle_before_entry.datetime, (None, None, None))
+    if atr is None:
+        atr = average_true_range(
+            window.high,
+            window.low,
+            window.close,
+            period=min(ATR_PERIOD, len(window)),
+        )[-1]
+    return atr / candle_before_entry.close * 100
 
 
 def process_position_what_if(
@@ -96,7 +137,7 @@ def process_tp(
     return tp_finished, amount
 
 
-class PositionWhatIfATRView(FormView):
+class PositionWhatIfATRView(WhatIfJobMixin, FormView):
     """List view for positions with table and filter functionality."""
 
     template_name = "core/what_if.html"
@@ -104,6 +145,7 @@ class PositionWhatIfATRView(FormView):
     table_class = WhatIfPositionTable
     filterset_class = PositionFilterSet
     form_class = WhatIfForm
+    cache_results = True
 
     def form_valid(self, form: WhatIfForm):
         atr_average_list: list = []
@@ -159,7 +201,18 @@ class PositionWhatIfATRView(FormView):
         if max_liq := form.cleaned_data.get("max_liquidation_amount"):
             positions = positions.filter(liquidation_amount__lte=max_liq)
 
-        positions = positions.order_by("start")
+        positions = positions.select_related("first_passage_index").order_by("start")
+        period = positions.aggregate(first=Min("start"), last=Max("start"))
+        indicators = (
+            get_indicators(
+                "BTC/USDT:USDT",
+                "5m",
+                period["first"] - timezone.timedelta(minutes=10),
+                period["last"],
+            )
+            if period["first"]
+            else {}
+        )
 
         returns = []
         dates = []
@@ -192,8 +245,25 @@ class PositionWhatIfATRView(FormView):
         rsi_upper: int = form.cleaned_data["rsi_upper"]
         rsi_sell_percentage: float = form.cleaned_data["rsi_sell_percentage"]
 
+        # the candles of all positions in one go, sliced per position, from
+        # the candles the ATR falls back to before the entry on
+        positions = list(positions)
+        candles = prefetch_candles(
+            "BTC/USDT:USDT",
+            "5m",
+            [
+                (
+                    position.start.replace(second=0, microsecond=0) - ATR_WARMUP,
+                    position.start.replace(second=0, microsecond=0)
+                    + timezone.timedelta(days=28),
+                )
+                for position in positions
+            ],
+        )
+
         object_list: list[Position] = []
-        for position in positions:
+        for number, position in enumerate(positions):
+            self.report_progress(number, len(positions))
             iso_datetime_str = (
                 f"{position.start.year}-"
                 f"{position.start.month:02d}-"
@@ -208,35 +278,14 @@ class PositionWhatIfATRView(FormView):
             #     case "live" | _:
             #         sl: float = form.cleaned_data["live_sl"]
             #         tp: float = form.cleaned_data["live_tp"]
-            atr_candles = OHLCV.objects.filter(
-                datetime__gte=iso_datetime - timezone.timedelta(minutes=5 * 15),
-                datetime__lt=iso_datetime,
-                timeframe="5m",
-            ).order_by("datetime")
-            atr_values = []
-            for i in range(1, len(atr_candles)):
-                current_candle = atr_candles[i]
-                previous_candle = atr_candles[i - 1]
-                tr = max(
-                    current_candle.high - current_candle.low,
-                    abs(current_candle.high - previous_candle.close),
-                    abs(current_candle.low - previous_candle.close),
-                )
-                atr_values.append(tr)
-            atr = (
-                sum(atr_values) / len(atr_values) / atr_candles.last().close * 100
-                if atr_values
-                else 0
-            )
+            atr = entry_atr(indicators, candles, iso_datetime)
             tp: float = 2.0
             sl: float = 1.0
             position.what_if_returns = 0
             use_sl_to_entry: bool = form.cleaned_data["use_sl_to_entry"]
-            ohlcv_s = OHLCV.objects.filter(
-                datetime__gte=iso_datetime,
-                datetime__lt=iso_datetime + timezone.timedelta(days=28),
-                timeframe="5m",
-            ).order_by("datetime")
+            ohlcv_s = candles.window(
+                iso_datetime, iso_datetime + timezone.timedelta(days=28)
+            )
             tp_finished = False
             tp1_finished = False
             tp2_finished = False
@@ -288,8 +337,51 @@ class PositionWhatIfATRView(FormView):
                 ):
                     continue
 
-            rsi_candles = []
-            for candle in ohlcv_s:
+            # skip the candles that cannot reach any TP, SL or RSI level
+            skip = 0
+            if not use_trailing_sl:
+                partial_tp_distances = [
+                    partial_tp * tp / 100
+                    for use_partial_tp, partial_tp in (
+                        (use_tp1, tp1),
+                        (use_tp2, tp2),
+                        (use_tp3, tp3),
+                        (use_tp4, tp4),
+                    )
+                    if use_partial_tp
+                ]
+                take_profit_distances = [tp, *partial_tp_distances]
+                stop_loss_distances = [sl]
+                if position.side == "SHORT" and use_tp1:
+                    stop_loss_distances.append(tp1 * tp / 100)  # checked upwards
+                if use_sl_to_entry:
+                    take_profit_distances.append(sl_to_entry * tp / 100)
+                if use_rsi:
+                    take_profit_distances.append(50 / 100 * tp)
+                    stop_loss_distances.append(50 / 100 * tp)
+                skip = first_passage_trigger(
+                    ohlcv_s,
+                    get_first_passage_index(position),
+                    position.side,
+                    position.entry_price,
+                    take_profit_distances,
+                    stop_loss_distances,
+                )
+                skipped = ohlcv_s[:skip]
+                atr = wilder_average(
+                    atr,
+                    np.maximum.reduce(
+                        [
+                            skipped.high - skipped.low,
+                            np.abs(skipped.high - skipped.close),
+                            np.abs(skipped.low - skipped.close),
+                        ]
+                    ),
+                )
+
+            atr_indicator = ATR(atr)
+            rsi_indicator = RSI(candles=ohlcv_s[max(skip - 14, 0) : skip])
+            for candle in ohlcv_s[skip:]:
 
                 if position.side == "LONG":
 
@@ -633,46 +725,17 @@ class PositionWhatIfATRView(FormView):
                             + (candle.low * (4 * atr / candle.close * 100) / 100),
                         )
 
-                atr = (
-                    atr * 13
-                    + max(
-                        candle.high - candle.low,
-                        abs(candle.high - candle.close),
-                        abs(candle.low - candle.close),
-                    )
-                ) / 14
+                atr = atr_indicator.update(candle)
 
-                rsi_candles.append(candle)
-                if (
-                    use_rsi
-                    and len(rsi_candles) >= 14
-                    and (
-                        candle.low
-                        <= position.entry_price
-                        - (position.entry_price * (50 / 100 * tp / 100))
-                        or candle.high
-                        >= position.entry_price
-                        + (position.entry_price * (50 / 100 * tp / 100))
-                    )
+                rsi = rsi_indicator.update(candle) if use_rsi else None
+                if rsi is not None and (
+                    candle.low
+                    <= position.entry_price
+                    - (position.entry_price * (50 / 100 * tp / 100))
+                    or candle.high
+                    >= position.entry_price
+                    + (position.entry_price * (50 / 100 * tp / 100))
                 ):
-                    rsi_candles = rsi_candles[-14:]  # keep only last 14 candles
-                    # calculate RSI
-                    rsi_gains = []
-                    rsi_losses = []
-                    for i in range(0, 14):
-                        change = rsi_candles[i].close - rsi_candles[i].open
-                        if change > 0:
-                            rsi_gains.append(change)
-                        else:
-                            rsi_losses.append(abs(change))
-                    average_gain = sum(rsi_gains) / 14 if rsi_gains else 0
-                    average_loss = sum(rsi_losses) / 14 if rsi_losses else 0
-                    if average_loss == 0:
-                        rsi = 100
-                    else:
-                        rs = average_gain / average_loss
-                        rsi = 100 - (100 / (1 + rs))
-
                     # check RSI conditions
                     if position.side == "LONG" and rsi >= rsi_upper and amount > 0:
                         sell_amount = amount * (rsi_sell_percentage / 100)
@@ -5,12 +5,16 @@ from django.utils import timezone
 from django.views.generic.edit import FormView
 
 from project.apps.core.filters import PositionFilterSet
+from project.apps.core.first_passage import first_passage_outcomes
 from project.apps.core.forms import WhatIfPerHourForm
-from project.apps.core.models import Position, OHLCV
+from project.apps.core.models import Position
+from project.apps.core.simulation import EXIT_STOP_LOSS, EXIT_TAKE_PROFIT
 from project.apps.core.tables import WhatIfPerHourPositionTable
 
+from .jobs import WhatIfJobMixin
 
-class PositionWhatIfPerHourBaseView(FormView):
+
+class PositionWhatIfPerHourBaseView(WhatIfJobMixin, FormView):
     """List view for positions with table and filter functionality."""
 
     template_name = "core/what_if_per_hour.html"
@@ -26,6 +30,7 @@ class PositionWhatIfPerHourBaseView(FormView):
             until_date = timezone.now().date()
         table_rows: List[dict] = []
         for hour in range(24):
+            self.report_progress(hour, 24)
             table_row = {"hour": hour}
             positions: QuerySet[Position] = (
                 self.model.objects.exclude(candles_before_entry__in=[1])
@@ -65,94 +70,33 @@ class PositionWhatIfPerHourBaseView(FormView):
             three_month_losses = 0
             tp: float = form.cleaned_data[f"tp"]
             sl: float = form.cleaned_data[f"sl"]
-            for position in positions:
-                position.what_if_returns = 0
-                ohlcv_s = OHLCV.objects.filter(
-                    datetime__gte=position.start,
-                    datetime__lt=position.start + timezone.timedelta(days=28),
-                    timeframe="5m",
-                ).order_by("datetime")
-                if ohlcv_s.exists():
-                    entry_price = round(
-                        (
-                            ohlcv_s.first().open * 1.0001
-                            if position.side == "SHORT"
-                            else ohlcv_s.first().open * 0.9999
-                        ),
-                        1,
-                    )
-                for candle in ohlcv_s:
-                    if position.side == "LONG":
-
-                        # SL
-                        if candle.low <= entry_price - (entry_price * sl / 100):
-                            total_losses += 1
-                            six_month_losses += (
-                                1
-                                if position.liquidation_datetime.date()
-                                >= until_date - timezone.timedelta(days=180)
-                                else 0
-                            )
-                            three_month_losses += (
-                                1
-                                if position.liquidation_datetime.date()
-                                >= until_date - timezone.timedelta(days=90)
-                                else 0
-                            )
-                            break
-
-                        # TP
-                        if candle.close >= entry_price + (entry_price * tp / 100):
-                            total_wins += 1
-                            six_month_wins += (
-                                1
-                                if position.liquidation_datetime.date()
-                                >= until_date - timezone.timedelta(days=180)
-                                else 0
-                            )
-                            three_month_wins += (
-                                1
-                                if position.liquidation_datetime.date()
-                                >= until_date - timezone.timedelta(days=90)
-                                else 0
-                            )
-                            break
-
-                    if position.side == "SHORT":
-
-                        # SL
-                        if candle.high >= entry_price + (entry_price * sl / 100):
-                            total_losses += 1
-                            six_month_losses += (
-                                1
-                                if position.liquidation_datetime.date()
-                                >= until_date - timezone.timedelta(days=180)
-                                else 0
-                            )
-                            three_month_losses += (
-                                1
-                                if position.liquidation_datetime.date()
-                                >= until_date - timezone.timedelta(days=90)
-                                else 0
-                            )
-                            break
-
-                        # TP
-                        if candle.close <= entry_price - (entry_price * tp / 100):
-                            total_wins += 1
-                            six_month_wins += (
-                                1
-                                if position.liquidation_datetime.date()
-                                >= until_date - timezone.timedelta(days=180)
-                                else 0
-                            )
-                            three_month_wins += (
-                                1
-                                if position.liquidation_datetime.date()
-                                >= until_date - timezone.timedelta(days=90)
-                                else 0
-                            )
-                            break
+            positions = list(positions.select_related("first_passage_index"))
+            reasons = first_passage_outcomes(
+                positions,
+                take_profits=[tp],
+                stop_losses=[sl],
+                horizon=timezone.timedelta(days=28),
+                take_profit_on_close=True,
+            ).reasons[:, 0]
+            for position, reason in zip(positions, reasons):
+                six_month = position.liquidation_datetime.date() >= (
+                    until_date - timezone.timedelta(days=180)
+                )
+                three_month = position.liquidation_datetime.date() >= (
+                    until_date - timezone.timedelta(days=90)
+                )
+
+                # SL
+                if reason == EXIT_STOP_LOSS:
+                    total_losses += 1
+                    six_month_losses += 1 if six_month else 0
+                    three_month_losses += 1 if three_month else 0
+
+                # TP
+                if reason == EXIT_TAKE_PROFIT:
+                    total_wins += 1
+                    six_month_wins += 1 if six_month else 0
+                    three_month_wins += 1 if three_month else 0
 
             # nr of trades
             table_row["total_nr_of_trades"] = total_wins + total_losses
@@ -7,9 +7,15 @@ from django.db.models import QuerySet, Q
 from django.utils import timezone
 from django.views.generic.edit import FormView
 
+from project.apps.core.candles import prefetch_candles
 from project.apps.core.filters import PositionFilterSet
+from project.apps.core.first_passage import (
+    first_passage_trigger,
+    get_first_passage_index,
+)
 from project.apps.core.forms import WhatIfRSIForm
-from project.apps.core.models import Position, OHLCV
+from project.apps.core.indicators import RSI
+from project.apps.core.models import Position
 from project.apps.core.tables import WhatIfPositionTable
 
 from .helpers import (
@@ -20,12 +26,13 @@ from .helpers import (
     plotter,
     WinStreak,
 )
+from .jobs import WhatIfJobMixin
 
 BLOFIN_MARKET_ORDER_FEE = 0.06 / 100  # 0.06% for non VIP users
 BLOFIN_LIMIT_ORDER_FEE = 0.02 / 100  # 0.002% for non VIP users
 
 
-class PositionWhatIfRSIView(FormView):
+class PositionWhatIfRSIView(WhatIfJobMixin, FormView):
     """List view for positions with table and filter functionality."""
 
     template_name = "core/what_if.html"
@@ -33,6 +40,7 @@ class PositionWhatIfRSIView(FormView):
     table_class = WhatIfPositionTable
     filterset_class = PositionFilterSet
     form_class = WhatIfRSIForm
+    cache_results = True
 
     def form_valid(self, form: WhatIfRSIForm):
         plt.rcParams["axes.prop_cycle"] = plt.cycler(color=COLOR_LIST)
@@ -65,7 +73,7 @@ class PositionWhatIfRSIView(FormView):
         if nr_of_liquidations := form.cleaned_data["nr_of_liquidations"]:
             positions = positions.filter(nr_of_liquidations=nr_of_liquidations)
 
-        positions = positions.order_by("start")
+        positions = positions.select_related("first_passage_index").order_by("start")
 
         returns = []
         dates = []
@@ -113,8 +121,23 @@ class PositionWhatIfRSIView(FormView):
         rsi_upper: int = form.cleaned_data["rsi_upper"]
         rsi_sell_percentage: float = form.cleaned_data["rsi_sell_percentage"]
 
+        # the candles of all positions in one go, sliced per position
+        positions = list(positions)
+        candles = prefetch_candles(
+            "BTC/USDT:USDT",
+            "5m",
+            [
+                (
+                    position.start.replace(second=0, microsecond=0),
+                    position.start + timezone.timedelta(days=28),
+                )
+                for position in positions
+            ],
+        )
+
         object_list: list[Position] = []
-        for position in positions:
+        for number, position in enumerate(positions):
+            self.report_progress(number, len(positions))
             match position.strategy_type:
                 case "rsi_reversed":
                     sl: float = form.cleaned_data["reversed_sl"]
@@ -130,12 +153,10 @@ class PositionWhatIfRSIView(FormView):
                 f"{position.start.day:02d} "
                 f"{position.start.hour:02d}:{position.start.minute:02d}:00"
             )
-            ohlcv_s = OHLCV.objects.filter(
-                datetime__gte=timezone.datetime.fromisoformat(iso_datetime),
-                datetime__lt=position.start + timezone.timedelta(days=28),
-                timeframe="5m",
-                symbol="BTC/USDT:USDT",
-            ).order_by("datetime")
+            ohlcv_s = candles.window(
+                timezone.datetime.fromisoformat(iso_datetime),
+                position.start + timezone.timedelta(days=28),
+            )
             tp1_finished = False
             tp2_finished = False
             tp3_finished = False
@@ -187,8 +208,44 @@ class PositionWhatIfRSIView(FormView):
                 ):
                     continue
 
-            rsi_candles = []
-            for candle in ohlcv_s:
+            # skip the candles that cannot reach any TP, SL or RSI level
+            skip = 0
+            if not use_trailing_sl:
+                take_profit_distances = [
+                    tp,
+                    *(
+                        partial_tp * tp / 100
+                        for use_partial_tp, partial_tp in (
+                            (use_tp1, tp1),
+                            (use_tp2, tp2),
+                            (use_tp3, tp3),
+                            (use_tp4, tp4),
+                            (use_tp5, tp5),
+                            (use_tp6, tp6),
+                            (use_tp7, tp7),
+                            (use_tp8, tp8),
+                            (use_tp9, tp9),
+                        )
+                        if use_partial_tp
+                    ),
+                ]
+                stop_loss_distances = [sl]
+                if use_sl_to_entry:
+                    take_profit_distances.append(sl_to_entry * tp / 100)
+                if use_rsi:
+                    take_profit_distances.append(50 / 100 * tp)
+                    stop_loss_distances.append(50 / 100 * tp)
+                skip = first_passage_trigger(
+                    ohlcv_s,
+                    get_first_passage_index(position),
+                    position.side,
+                    position.entry_price,
+                    take_profit_distances,
+                    stop_loss_distances,
+                )
+
+            rsi_indicator = RSI(candles=ohlcv_s[max(skip - 14, 0) : skip])
+            for candle in ohlcv_s[skip:]:
 
                 if position.side == "LONG":
 
@@ -722,37 +779,15 @@ class PositionWhatIfRSIView(FormView):
                         win_streak.record_win()
                         break
 
-                rsi_candles.append(candle)
-                if (
-                    use_rsi
-                    and len(rsi_candles) >= 14
-                    and (
-                        candle.low
-                        <= position.entry_price
-                        - (position.entry_price * (50 / 100 * tp / 100))
-                        or candle.high
-                        >= position.entry_price
-                        + (position.entry_price * (50 / 100 * tp / 100))
-                    )
+                rsi = rsi_indicator.update(candle) if use_rsi else None
+                if rsi is not None and (
+                    candle.low
+                    <= position.entry_price
+                    - (position.entry_price * (50 / 100 * tp / 100))
+                    or candle.high
+                    >= position.entry_price
+                    + (position.entry_price * (50 / 100 * tp / 100))
                 ):
-                    rsi_candles = rsi_candles[-14:]  # keep only last 14 candles
-                    # calculate RSI
-                    rsi_gains = []
-                    rsi_losses = []
-                    for i in range(0, 14):
-                        change = rsi_candles[i].close - rsi_candles[i].open
-                        if change > 0:
-                            rsi_gains.append(change)
-                        else:
-                            rsi_losses.append(abs(change))
-                    average_gain = sum(rsi_gains) / 14 if rsi_gains else 0
-                    average_loss = sum(rsi_losses) / 14 if rsi_losses else 0
-                    if average_loss == 0:
-                        rsi = 100
-                    else:
-                        rs = average_gain / average_loss
-                        rsi = 100 - (100 / (1 + rs))
-
                     # check RSI conditions
                     if position.side == "LONG" and rsi >= rsi_upper and amount > 0:
                         sell_amount = amount * (rsi_sell_percentage / 100)
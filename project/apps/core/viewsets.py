@@ -1,10 +1,33 @@
 from typing import List
-from drf_spectacular.utils import extend_schema_view, extend_schema
-from rest_framework.viewsets import ModelViewSet
-
-from project.apps.core.filters import PositionFilterSet
-from project.apps.core.models import Position, User
-from project.apps.core.serializers import PositionSerializer, UserSerializer
+from django_filters.rest_framework import DjangoFilterBackend
+from drf_spectacular.utils import OpenApiParameter, extend_schema_view, extend_schema
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.response import Response
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
+
+from project.apps.core.filters import (
+    LiquidationFilterSet,
+    OHLCVFilterSet,
+    PositionFilterSet,
+    RSILiquidationFilterSet,
+)
+from project.apps.core.models import OHLCV, Liquidation, Position, RSILiquidation, User
+from project.apps.core.pagination import (
+    KeysetPagination,
+    OptionalCountPagination,
+    PositionKeysetPagination,
+)
+from project.apps.core.renderers import ColumnsRenderer, NpzRenderer
+from project.apps.core.serializers import (
+    LiquidationSerializer,
+    OHLCVSerializer,
+    PositionRowSerializer,
+    PositionSerializer,
+    RSILiquidationSerializer,
+    UserSerializer,
+)
 
 
 def swagger_class_decorator(tag, actions=None) -> extend_schema_view:
@@ -40,6 +63,68 @@ class BaseViewSet:
         return self.model.objects.all().order_by("-id")
 
 
+class ColumnarViewSetMixin:
+    """Read-only time series, paginated on (datetime, id).
+
+    Besides the rows as json objects, ?format=columns returns a json array
+    per column and ?format=npz a NumPy archive with an array per column. The
+    datetimes of the columns are unix timestamps in seconds, as floats that
+    keep the fractions of a second. The columnar formats require the symbol
+    and timeframe filters and return them once instead of in every row.
+    """
+
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend]
+    renderer_classes = [
+        JSONRenderer,
+        BrowsableAPIRenderer,
+        ColumnsRenderer,
+        NpzRenderer,
+    ]
+    keyset = ("datetime", "id")
+    constant_columns = ("symbol", "timeframe")
+
+    @property
+    def columns(self) -> List[str]:
+        return [
+            field.name
+            for field in self.model._meta.fields
+            if field.name not in self.constant_columns
+        ]
+
+    def list(self, request, *args, **kwargs):
+        """List the rows, or their columns, of one page."""
+        queryset = self.filter_queryset(self.get_queryset())
+        if request.accepted_renderer.format not in (
+            ColumnsRenderer.format,
+            NpzRenderer.format,
+        ):
+            fields = [field.name for field in self.model._meta.fields]
+            rows = self.paginate_queryset(queryset.values(*fields))
+            return self.get_paginated_response(rows)
+
+        if missing := [
+            name for name in self.constant_columns if not request.query_params.get(name)
+        ]:
+            raise ValidationError(
+                {name: "Required for the columnar formats." for name in missing}
+            )
+        rows = self.paginate_queryset(queryset.values_list(*self.columns, named=True))
+        columns = {name: [getattr(row, name) for row in rows] for name in self.columns}
+        # the datetimes are stored naive in TIME_ZONE
+        columns["datetime"] = [
+            timezone.make_aware(moment).timestamp() for moment in columns["datetime"]
+        ]
+        next_link = self.paginator.get_next_link()
+        response = Response(
+            {name: request.query_params[name] for name in self.constant_columns}
+            | {"next": next_link, "columns": columns}
+        )
+        if next_link:
+            response["Link"] = f'<{next_link}>; rel="next"'
+        return response
+
+
 @swagger_class_decorator("Users")
 class UserViewset(BaseViewSet, ModelViewSet):
     """Viewset for the User model."""
@@ -50,21 +135,87 @@ class UserViewset(BaseViewSet, ModelViewSet):
 
 @swagger_class_decorator("Positions")
 class PositionViewset(BaseViewSet, ModelViewSet):
-    """Viewset for the Position model."""
+    """Viewset for the Position model.
+
+    The list is paginated by page number, ?count=false leaves out the count
+    of all positions. ?pagination=cursor pages on the id instead, newest
+    first, which costs the same for every page and can't be combined with
+    ?ordering.
+    """
 
     model = Position
     serializer_class = PositionSerializer
     filterset_class = PositionFilterSet
+    pagination_class = OptionalCountPagination
+    keyset = ("-id",)
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            query_params = getattr(self.request, "query_params", {})
+            if query_params.get("pagination") == "cursor":
+                self._paginator = PositionKeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     @property
     def filterset_fields(self) -> List[str]:
         return super().filterset_fields + ["start__week_day"]
 
+    def get_queryset(self):
+        return super().get_queryset().with_returns()
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "pagination",
+                str,
+                enum=["cursor"],
+                description="cursor pages on the id with the cursor parameter, "
+                "newest first, and can't be combined with ordering",
+            ),
+            OpenApiParameter("cursor", str, description="The cursor of the page"),
+        ]
+    )
     def list(self, request, *args, **kwargs):
-        """List all positions."""
-        return_list = super().list(request, *args, **kwargs)
-        returns = sum(
-            [position.returns for position in self.filter_queryset(self.get_queryset())]
+        """List all positions, serialized from rows instead of instances."""
+        query_params = request.query_params
+        if query_params.get("pagination") == "cursor" and query_params.get("ordering"):
+            raise ValidationError(
+                {"ordering": "Can't be combined with pagination=cursor."}
+            )
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset.rows())
+        return_list = self.get_paginated_response(
+            PositionRowSerializer(page, many=True).data
         )
-        return_list.data["returns"] = returns
+        return_list.data["returns"] = queryset.total_returns()
         return return_list
+
+
+@swagger_class_decorator("OHLCV", actions=["list", "retrieve"])
+class OHLCVViewset(ColumnarViewSetMixin, BaseViewSet, ReadOnlyModelViewSet):
+    """Read-only viewset for the OHLCV model."""
+
+    model = OHLCV
+    serializer_class = OHLCVSerializer
+    filterset_class = OHLCVFilterSet
+
+
+@swagger_class_decorator("Liquidations", actions=["list", "retrieve"])
+class LiquidationViewset(ColumnarViewSetMixin, BaseViewSet, ReadOnlyModelViewSet):
+    """Read-only viewset for the Liquidation model."""
+
+    model = Liquidation
+    serializer_class = LiquidationSerializer
+    filterset_class = LiquidationFilterSet
+
+
+@swagger_class_decorator("RSI Liquidations", actions=["list", "retrieve"])
+class RSILiquidationViewset(ColumnarViewSetMixin, BaseViewSet, ReadOnlyModelViewSet):
+    """Read-only viewset for the RSILiquidation model."""
+
+    model = RSILiquidation
+    serializer_class = RSILiquidationSerializer
+    filterset_class = RSILiquidationFilterSet
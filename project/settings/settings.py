@@ -97,3 +97,18 @@ LOGIN_URL = "admin:login"
 ALGORITHM_EXPORT_PATH = config(
     "ALGORITHM_EXPORT_PATH", default=os.path.join(BASE_DIR, "data")
 )
+
+# where the algorithm input is read from, "database" (the AlgorithmInput
+# table) or "files" (the CSV files in ALGORITHM_EXPORT_PATH)
+ALGORITHM_INPUT_SOURCE = config("ALGORITHM_INPUT_SOURCE", default="database")
+
+CANDLE_STORE_PATH = config(
+    "CANDLE_STORE_PATH", default=os.path.join(BASE_DIR, "candles")
+)
+
+# run the what-if forms as background jobs of the run_what_if_workers command
+# instead of inside the request, the command has to run next to the server
+WHAT_IF_BACKGROUND_JOBS = config("WHAT_IF_BACKGROUND_JOBS", cast=bool, default=False)
+
+# number of what-if results kept in memory per process
+WHAT_IF_RESULT_CACHE_SIZE = config("WHAT_IF_RESULT_CACHE_SIZE", cast=int, default=32)
@@ -9,6 +9,8 @@ from project.apps.core.views import (
     PositionWhatIfRSIView,
     PositionWhatIfATRView,
     PositionWhatIfAlgorithmView,
+    WhatIfJobStatusView,
+    WhatIfJobView,
 )
 
 urlpatterns = [
@@ -33,4 +35,10 @@ urlpatterns = [
         PositionWhatIfPerHourByLiquidationView.as_view(),
         name="positions_what_if_per_hour_by_liquidation",
     ),
+    path("what-if/jobs/<int:job_id>/", WhatIfJobView.as_view(), name="what_if_job"),
+    path(
+        "what-if/jobs/<int:job_id>/status/",
+        WhatIfJobStatusView.as_view(),
+        name="what_if_job_status",
+    ),
 ]